@@ -1,9 +1,49 @@
+import asyncio
+import inspect
+import json
 import uuid
+from contextlib import aclosing
 
-from langgraph.checkpoint.memory import MemorySaver
-from langgraph.graph import END, MessagesState, StateGraph
-from langgraph.prebuilt import ToolNode
-from langgraph.types import Command
+from langchain_core.messages import AIMessage
+from langchain_core.utils.function_calling import convert_to_openai_tool
+from langgraph.graph import MessagesState
+
+from . import instrumentation
+from .agent_session import AgentSession
+from .graph_cache import get_bound_model, get_compiled_graph
+from .model_policy import LARGE, ModelPolicy
+from .model_scheduler import INTERACTIVE, get_model_scheduler
+from .response_cache import get_response_cache
+
+# Name of the system message that holds the per-request prompt variables
+PROMPT_VARIABLES_NAME = "prompt_variables"
+
+
+def prompt_variables_message(variables):
+    """
+    Build the message that gives the model the per-request values of a static system prompt.
+    Args:
+        variables: A dictionary of values, e.g. {"path": "search"}.
+    """
+    return {
+        "role": "system",
+        "name": PROMPT_VARIABLES_NAME,
+        "content": "Variables of this request:\n" + json.dumps(variables, sort_keys=True, indent=2),
+    }
+
+
+def token_text(chunk, metadata):
+    """
+    Get the text of a streamed model token, or None if the chunk is not model output.
+    Args:
+        chunk: The message chunk from a stream_mode="messages" event.
+        metadata: The metadata from the same event.
+    """
+    if metadata.get("langgraph_node") != "agent" or not isinstance(chunk, AIMessage):
+        return None
+    if not isinstance(chunk.content, str) or chunk.content == "":
+        return None
+    return chunk.content
 
 
 class Agent:
@@ -11,6 +51,12 @@ class Agent:
     The agent class.
     """
 
+    # Whether the agent's answers are long generations, like whole pages,
+    # that a ModelPolicy sends to the large model
+    heavy_generation = False
+    # The priority class of the agent's model calls in the ModelScheduler
+    priority = INTERACTIVE
+
     def __init__(
         self,
         model,
@@ -19,24 +65,45 @@ class Agent:
         messages=None,
         message_listener=None,
         user_input_listener=None,
+        context_manager=None,
+        token_listener=None,
+        response_cache=None,
+        prompt_variables=None,
+        scheduler=None,
     ):
         """
         Initialize the agent with a model, tools, and an optional system prompt.
         Args:
-            model: The model to use.
+            model: The model to use, or a ModelPolicy to route turns between a small and a large model.
             tools: The tools to use.
             system_prompt: The system prompt to use.
             messages: The initial messages to use. (optional)
             message_listener: Optional event listener to handle messages from the llm.
             user_input_listener: Optional event listener to handle user input.
+            context_manager: Optional ContextManager that keeps the history within a token budget.
+            token_listener: Optional event listener called with each model token as it is generated.
+            response_cache: Optional ResponseCache for model turns, defaults to the
+                process-wide cache when AGENT_RESPONSE_CACHE is on.
+            prompt_variables: Optional per-request values for the system prompt. They are
+                sent in their own message after it, so the system prompt stays the same
+                across requests and the model provider can cache it.
+            scheduler: Optional ModelScheduler the model calls wait in, defaults to the
+                process-wide scheduler when AGENT_MODEL_TPM or AGENT_MODEL_RPM is set.
         """
         self.model = model
         self.tools = tools
         self.system_prompt = agent_prompt
         self.message_listener = message_listener
         self.user_input_listener = user_input_listener
+        self.context_manager = context_manager
+        self.token_listener = token_listener
+        self.response_cache = response_cache if response_cache is not None else get_response_cache()
+        self.scheduler = scheduler if scheduler is not None else get_model_scheduler()
 
-        self.thread_config = {"configurable": {"thread_id": uuid.uuid4()}}
+        # the agent rides along in the config so the shared graph can find it
+        self.thread_config = {
+            "configurable": {"thread_id": str(uuid.uuid4()), "agent": self}
+        }
         self.state = {
             "messages": [
                 {
@@ -45,53 +112,176 @@ class Agent:
                 }
             ]
         }
+        if prompt_variables:
+            self.state["messages"].append(prompt_variables_message(prompt_variables))
         if messages:
             self.state["messages"].extend(messages)
+        # the number of messages in self.state the thread already has
+        self.sent_messages = 0
+        # the trace of the last run, when instrumentation is on
+        self.last_trace = None
+        # the interrupts the last run stopped at
+        self.interrupts = []
 
-        graph = StateGraph(MessagesState)
-        graph.add_node("agent", self.call_model)
-        graph.add_node("tools", ToolNode(tools=tools))
-        graph.add_edge("agent", "tools")
-        graph.add_edge("tools", "agent")
-
-        graph.set_entry_point("agent")
+        # the names of the tools, for is_valid_response
+        self._tool_names = None
 
-        self.graph = graph.compile(checkpointer=MemorySaver())
-        self.model = model.bind_tools(tools, tool_choice="auto")
+        # the compiled graph and the tool-bound model are shared process-wide
+        self.graph = get_compiled_graph(tools)
+        self.model_policy = None
+        self.tier_models = None
+        if isinstance(model, ModelPolicy):
+            self.model_policy = model
+            self.tier_models = {
+                tier: get_bound_model(tier_model, tools) for tier, tier_model in model.models.items()
+            }
+            model = model.models[LARGE]
+        self.model = get_bound_model(model, tools)
 
     def run(self, command=None):
         """
-        Run the agent.
+        Run the agent, asking the user input listener for an answer at each interrupt.
+        The run is resumed in a loop, so a session can go on for any number of turns.
         """
-        if command is None:
-            for event in self.graph.stream(
-                self.state, config=self.thread_config, stream_mode="values"
-            ):
-                self.handle_event(event)
-        else:
-            for event in self.graph.stream(
-                command, config=self.thread_config, stream_mode="values"
-            ):
-                self.handle_event(event)
-
-        # check that we in fact do have an interrupt
-        if self.has_interrupt() > 0:
-            human_response = None
-            if (
-                hasattr(self, "user_input_listener")
-                and self.user_input_listener is not None
-            ):
-                # call the user input listener
-                human_response = self.user_input_listener(event)
-            else:
+        session = self.session()
+        session.start(command)
+        while session.waiting:
+            if self.user_input_listener is None:
+                raise NotImplementedError("User input listener is not implemented.")
+
+            human_response = self.user_input_listener(session.last_event)
+            if human_response is None:
+                # if the user input listener returns None, we stop the agent
+                return
+            session.resume(human_response)
+
+    async def arun(self, command=None):
+        """
+        Run the agent asynchronously.
+        The user input listener may be a coroutine function.
+        """
+        session = self.session()
+        await session.astart(command)
+        while session.waiting:
+            if self.user_input_listener is None:
                 raise NotImplementedError("User input listener is not implemented.")
 
-            if human_response is not None:
-                command = Command(resume=human_response)
-                return self.run(command=command)
-            else:
+            human_response = self.user_input_listener(session.last_event)
+            if inspect.isawaitable(human_response):
+                human_response = await human_response
+
+            if human_response is None:
                 # if the user input listener returns None, we stop the agent
                 return
+            await session.aresume(human_response)
+
+    def session(self):
+        """
+        Start a resumable session, for callers that collect the user's answers themselves.
+        """
+        return AgentSession(self)
+
+    def next_input(self):
+        """
+        Get the graph input for the next run, the messages the thread does not have yet.
+        The first run sends the whole state, later runs of a reused agent only send
+        the messages added since, so the history is not sent twice.
+        """
+        if self.sent_messages and self.graph.checkpointer.get_tuple(self.thread_config) is None:
+            # the thread expired, start it again from the whole state
+            self.sent_messages = 0
+
+        messages = self.state["messages"][self.sent_messages :]
+        self.sent_messages = len(self.state["messages"])
+        return {"messages": messages}
+
+    def delete_thread(self) -> None:
+        """
+        Delete the checkpoints of the agent's thread, e.g. when the agent is discarded.
+        """
+        self.graph.checkpointer.delete_thread(self.thread_config["configurable"]["thread_id"])
+        self.sent_messages = 0
+
+    def start_trace(self):
+        """
+        Start tracing a run.
+        Returns:
+            The config to run the graph with, and the trace or None when instrumentation is off.
+        """
+        if not instrumentation.enabled():
+            return self.thread_config, None
+        trace = instrumentation.RunTrace(
+            type(self).__name__, self.thread_config["configurable"]["thread_id"]
+        )
+        return {**self.thread_config, "callbacks": [trace]}, trace
+
+    def finish_trace(self, trace) -> None:
+        """
+        Finish tracing a run, keeping the trace in last_trace.
+        """
+        if trace is None:
+            return
+        self.last_trace = trace.finish()
+        instrumentation.write_trace(self.last_trace)
+
+    def stream_modes(self):
+        """
+        The stream modes of a run, model tokens are only streamed to a token listener.
+        """
+        if self.token_listener is None:
+            return ["values"]
+        return ["values", "messages"]
+
+    def stream_values(self, input):
+        """
+        Stream the graph, yielding the state after each step.
+        With a token listener, model tokens are passed to it as they are generated.
+        The interrupts the run stops at are kept in self.interrupts.
+        """
+        self.interrupts = []
+        config, trace = self.start_trace()
+        try:
+            for mode, payload in self.graph.stream(
+                input, config=config, stream_mode=self.stream_modes()
+            ):
+                if mode == "messages":
+                    self.handle_token(*payload)
+                elif "__interrupt__" in payload:
+                    # the run stopped for human input, this chunk is not a state
+                    self.interrupts = list(payload["__interrupt__"])
+                else:
+                    yield payload
+        finally:
+            self.finish_trace(trace)
+
+    async def astream_values(self, input):
+        """
+        Async version of stream_values.
+        """
+        self.interrupts = []
+        config, trace = self.start_trace()
+        try:
+            stream = self.graph.astream(input, config=config, stream_mode=self.stream_modes())
+            # closed with this generator, when the caller stops early
+            async with aclosing(stream):
+                async for mode, payload in stream:
+                    if mode == "messages":
+                        self.handle_token(*payload)
+                    elif "__interrupt__" in payload:
+                        # the run stopped for human input, this chunk is not a state
+                        self.interrupts = list(payload["__interrupt__"])
+                    else:
+                        yield payload
+        finally:
+            self.finish_trace(trace)
+
+    def handle_token(self, chunk, metadata) -> None:
+        """
+        Handle a streamed model token.
+        """
+        text = token_text(chunk, metadata)
+        if text is not None:
+            self.token_listener(text)
 
     def handle_event(self, event) -> None:
         """
@@ -108,14 +298,80 @@ class Agent:
         Call the model with the current state.
         """
         messages = state["messages"]
-        messages = self.model.invoke(messages)
+        if self.model_policy is not None:
+            response = self.model_policy.invoke(self, messages)
+        else:
+            response = self.invoke_model(self.model, messages)
         # We return a list, because this will get added to the existing list
-        return {"messages": [messages]}
+        return {"messages": [response]}
 
-    def has_interrupt(self) -> bool:
+    async def acall_model(self, state: MessagesState):
         """
-        Check if there is an interrupt.
+        Call the model asynchronously with the current state.
         """
-        return len(self.graph.get_state(self.thread_config).tasks) > 0
+        messages = state["messages"]
+        if self.model_policy is not None:
+            response = await self.model_policy.ainvoke(self, messages)
+        else:
+            response = await self.ainvoke_model(self.model, messages)
+        # We return a list, because this will get added to the existing list
+        return {"messages": [response]}
+
+    def invoke_model(self, model, messages, is_valid=None):
+        """
+        Call a tool-bound model, through the response cache and the scheduler.
+        Args:
+            model: The tool-bound model to call.
+            messages: The messages to send.
+            is_valid: Optional check, responses that fail it are not cached.
+        """
+        if self.response_cache is not None:
+            cached = self.response_cache.get(model, messages)
+            if cached is not None:
+                # not streamed token by token, the "messages" stream of the graph
+                # emits it whole when the node returns it, so a token listener still
+                # gets its text once, see tests/test_response_cache.py
+                return cached
+
+        if self.scheduler is not None:
+            response = self.scheduler.invoke(model, messages, self.priority)
+        else:
+            response = model.invoke(messages)
+        if self.response_cache is not None and (is_valid is None or is_valid(response)):
+            self.response_cache.put(model, messages, response)
+        return response
+
+    async def ainvoke_model(self, model, messages, is_valid=None):
+        """
+        Async version of invoke_model.
+        """
+        if self.response_cache is not None:
+            cached = await asyncio.to_thread(self.response_cache.get, model, messages)
+            if cached is not None:
+                return cached
 
+        if self.scheduler is not None:
+            response = await self.scheduler.ainvoke(model, messages, self.priority)
+        else:
+            response = await model.ainvoke(messages)
+        if self.response_cache is not None and (is_valid is None or is_valid(response)):
+            await asyncio.to_thread(self.response_cache.put, model, messages, response)
+        return response
 
+    def is_valid_response(self, message) -> bool:
+        """
+        Check a model response, a ModelPolicy asks the large model again when a
+        small model response fails. Tool calls must name tools of the agent.
+        """
+        if message.invalid_tool_calls:
+            return False
+        if self._tool_names is None:
+            # the names the model sees, also for tools given as plain functions
+            self._tool_names = {convert_to_openai_tool(tool)["function"]["name"] for tool in self.tools}
+        return all(call["name"] in self._tool_names for call in message.tool_calls)
+
+    def has_interrupt(self) -> bool:
+        """
+        Check if the last run stopped at an interrupt.
+        """
+        return len(self.interrupts) > 0
@@ -0,0 +1,82 @@
+from langgraph.types import Command
+
+
+class AgentSession:
+    """
+    A conversation with an agent that pauses at each human interrupt.
+
+    Each step streams one run of the graph and stops when the run finishes or
+    an interrupt asks the user for input, then resume() continues it with the
+    answer. The interrupt is read from the stream itself, so a session can go
+    on for any number of turns without re-reading the graph state, and only the
+    last event of a step is kept.
+    """
+
+    def __init__(self, agent):
+        """
+        Initialize the session.
+        Args:
+            agent: The agent to run, its message listener gets every event.
+        """
+        self.agent = agent
+        # the last state of the latest step
+        self.last_event = None
+        # the value of the pending interrupt, e.g. the prompt to show the user
+        self.interrupt = None
+        self.waiting = False
+
+    def start(self, command=None):
+        """
+        Run the agent on the messages its thread does not have yet, or on a command.
+        Returns:
+            The value of the interrupt the run stopped at, or None if it finished.
+        """
+        return self.step(self.agent.next_input() if command is None else command)
+
+    def resume(self, answer):
+        """
+        Continue the run from the pending interrupt with the user's answer.
+        Returns:
+            The value of the next interrupt, or None if the run finished.
+        """
+        if not self.waiting:
+            raise RuntimeError("The session is not waiting for input.")
+        return self.step(Command(resume=answer))
+
+    def step(self, input):
+        """
+        Stream one run of the graph.
+        """
+        for event in self.agent.stream_values(input):
+            self.last_event = event
+            self.agent.handle_event(event)
+        return self._pause()
+
+    async def astart(self, command=None):
+        """
+        Async version of start.
+        """
+        return await self.astep(self.agent.next_input() if command is None else command)
+
+    async def aresume(self, answer):
+        """
+        Async version of resume.
+        """
+        if not self.waiting:
+            raise RuntimeError("The session is not waiting for input.")
+        return await self.astep(Command(resume=answer))
+
+    async def astep(self, input):
+        """
+        Async version of step.
+        """
+        async for event in self.agent.astream_values(input):
+            self.last_event = event
+            self.agent.handle_event(event)
+        return self._pause()
+
+    def _pause(self):
+        interrupts = self.agent.interrupts
+        self.waiting = len(interrupts) > 0
+        self.interrupt = interrupts[0].value if self.waiting else None
+        return self.interrupt
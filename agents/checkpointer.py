@@ -0,0 +1,297 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from langgraph.checkpoint.memory import MemorySaver
+from langgraph.constants import INTERRUPT
+
+from . import instrumentation
+
+# The number of checkpoints kept per thread, older ones are compacted away
+DEFAULT_KEEP_LAST = 3
+# Threads that were not used for this many seconds are expired, unless they
+# are paused at an interrupt, waiting for the user
+DEFAULT_THREAD_TTL = 3600
+# The ceiling on the bytes held by the in-memory checkpointer
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+DEFAULT_CHECKPOINT_DB = "checkpoints.sqlite"
+
+
+class BoundedMemorySaver(MemorySaver):
+    """
+    An in-memory checkpointer with bounded memory.
+
+    Only the last keep_last checkpoints of each thread are kept, with their
+    pending writes and the channel values they refer to. Threads that were not
+    used for ttl seconds are expired, except the ones paused at an interrupt,
+    which wait for the user's answer for as long as it takes. When the
+    serialized checkpoints of all threads are over max_bytes, the least recently
+    used threads are dropped, paused or not.
+    """
+
+    def __init__(
+        self,
+        keep_last=DEFAULT_KEEP_LAST,
+        ttl=DEFAULT_THREAD_TTL,
+        max_bytes=DEFAULT_MAX_BYTES,
+    ):
+        """
+        Initialize the checkpointer.
+        Args:
+            keep_last: The number of checkpoints kept per thread and namespace.
+            ttl: Seconds a thread is kept after its last use, None keeps it forever.
+                Threads paused at an interrupt are kept until they are resumed.
+            max_bytes: The ceiling on the serialized size of all threads, None for no ceiling.
+        """
+        super().__init__()
+        self.keep_last = max(1, keep_last)
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+
+        self._lock = threading.RLock()
+        # thread id -> last use, least recently used first
+        self._last_used = OrderedDict()
+        # thread id -> bytes held by the thread
+        self._sizes = {}
+        self.total_bytes = 0
+        # thread id -> keys of the blobs stored for the thread
+        self._blob_keys = {}
+        # (thread id, namespace, checkpoint id) -> channel versions of the checkpoint
+        self._versions = {}
+        self.compacted = 0
+        self.expired = 0
+        self.evicted = 0
+
+    def get_tuple(self, config):
+        with self._lock:
+            thread_id = config["configurable"]["thread_id"]
+            if thread_id not in self._last_used:
+                checkpoint = super().get_tuple(config)
+                # reading creates an empty entry in the storage, don't keep it
+                if not self.storage.get(thread_id):
+                    self.storage.pop(thread_id, None)
+                return checkpoint
+            self._touch(thread_id)
+            return super().get_tuple(config)
+
+    def put(self, config, checkpoint, metadata, new_versions):
+        start = time.perf_counter()
+        with self._lock:
+            saved = super().put(config, checkpoint, metadata, new_versions)
+
+            thread_id = config["configurable"]["thread_id"]
+            checkpoint_ns = config["configurable"]["checkpoint_ns"]
+            self._blob_keys.setdefault(thread_id, set()).update(
+                (thread_id, checkpoint_ns, channel, version)
+                for channel, version in new_versions.items()
+            )
+            self._versions[(thread_id, checkpoint_ns, checkpoint["id"])] = dict(
+                checkpoint["channel_versions"]
+            )
+
+            self._compact(thread_id, checkpoint_ns)
+            self._touch(thread_id)
+            self._measure(thread_id)
+            self._expire(keep=thread_id)
+
+            if instrumentation.enabled():
+                instrumentation.record_checkpoint(
+                    time.perf_counter() - start,
+                    self._checkpoint_size(thread_id, checkpoint_ns, checkpoint["id"], new_versions),
+                )
+            return saved
+
+    def put_writes(self, config, writes, task_id, task_path=""):
+        with self._lock:
+            super().put_writes(config, writes, task_id, task_path)
+
+            thread_id = config["configurable"]["thread_id"]
+            self._touch(thread_id)
+            self._measure(thread_id)
+
+    def delete_thread(self, thread_id):
+        with self._lock:
+            super().delete_thread(thread_id)
+            self._forget(thread_id)
+
+    def stats(self) -> dict:
+        """
+        Get the size of the checkpointer and how much it has dropped.
+        """
+        with self._lock:
+            return {
+                "threads": len(self._last_used),
+                "bytes": self.total_bytes,
+                "compacted_checkpoints": self.compacted,
+                "expired_threads": self.expired,
+                "evicted_threads": self.evicted,
+            }
+
+    def _touch(self, thread_id):
+        self._last_used[thread_id] = time.monotonic()
+        self._last_used.move_to_end(thread_id)
+
+    def _compact(self, thread_id, checkpoint_ns):
+        """
+        Drop all but the last keep_last checkpoints of a thread namespace.
+        """
+        checkpoints = self.storage[thread_id][checkpoint_ns]
+        if len(checkpoints) <= self.keep_last:
+            return
+
+        # checkpoint ids are time ordered
+        ordered = sorted(checkpoints)
+        for checkpoint_id in ordered[: -self.keep_last]:
+            del checkpoints[checkpoint_id]
+            self.writes.pop((thread_id, checkpoint_ns, checkpoint_id), None)
+            self._versions.pop((thread_id, checkpoint_ns, checkpoint_id), None)
+            self.compacted += 1
+
+        # drop the channel values no kept checkpoint refers to
+        referenced = set()
+        for checkpoint_id in ordered[-self.keep_last :]:
+            versions = self._versions.get((thread_id, checkpoint_ns, checkpoint_id), {})
+            referenced.update(
+                (thread_id, checkpoint_ns, channel, version)
+                for channel, version in versions.items()
+            )
+        blob_keys = self._blob_keys.get(thread_id, set())
+        for key in [key for key in blob_keys if key[1] == checkpoint_ns and key not in referenced]:
+            blob_keys.discard(key)
+            self.blobs.pop(key, None)
+
+    def _measure(self, thread_id):
+        """
+        Recount the serialized bytes held by a thread.
+        """
+        size = 0
+        for checkpoint_ns, checkpoints in self.storage.get(thread_id, {}).items():
+            for checkpoint_id, (checkpoint, metadata, _) in checkpoints.items():
+                size += len(checkpoint[1]) + len(metadata[1])
+                for write in self.writes.get((thread_id, checkpoint_ns, checkpoint_id), {}).values():
+                    size += len(write[2][1])
+        for key in self._blob_keys.get(thread_id, ()):
+            blob = self.blobs.get(key)
+            if blob is not None:
+                size += len(blob[1])
+
+        self.total_bytes += size - self._sizes.get(thread_id, 0)
+        self._sizes[thread_id] = size
+
+    def _checkpoint_size(self, thread_id, checkpoint_ns, checkpoint_id, new_versions):
+        """
+        Count the serialized bytes of a checkpoint and the channel values written with it.
+        """
+        checkpoint, metadata, _ = self.storage[thread_id][checkpoint_ns][checkpoint_id]
+        size = len(checkpoint[1]) + len(metadata[1])
+        for channel, version in new_versions.items():
+            blob = self.blobs.get((thread_id, checkpoint_ns, channel, version))
+            if blob is not None:
+                size += len(blob[1])
+        return size
+
+    def _expire(self, keep=None):
+        """
+        Drop expired threads, then the least recently used ones while over max_bytes.
+        Args:
+            keep: A thread that is never dropped, e.g. the one being written.
+        """
+        if self.ttl is not None:
+            deadline = time.monotonic() - self.ttl
+            for thread_id, last_used in list(self._last_used.items()):
+                if last_used > deadline:
+                    break
+                if thread_id != keep and not self._paused(thread_id):
+                    self._drop(thread_id)
+                    self.expired += 1
+
+        if self.max_bytes is not None:
+            for thread_id in list(self._last_used):
+                if self.total_bytes <= self.max_bytes:
+                    break
+                if thread_id != keep:
+                    self._drop(thread_id)
+                    self.evicted += 1
+
+    def _paused(self, thread_id) -> bool:
+        """
+        Whether the latest checkpoint of a thread stopped at an interrupt.
+        """
+        for checkpoint_ns, checkpoints in self.storage.get(thread_id, {}).items():
+            if not checkpoints:
+                continue
+            writes = self.writes.get((thread_id, checkpoint_ns, max(checkpoints)), {})
+            if any(write[1] == INTERRUPT for write in writes.values()):
+                return True
+        return False
+
+    def _drop(self, thread_id):
+        self.storage.pop(thread_id, None)
+        for key in [key for key in self.writes if key[0] == thread_id]:
+            del self.writes[key]
+        for key in self._blob_keys.get(thread_id, ()):
+            self.blobs.pop(key, None)
+        self._forget(thread_id)
+
+    def _forget(self, thread_id):
+        self._last_used.pop(thread_id, None)
+        self._blob_keys.pop(thread_id, None)
+        self.total_bytes -= self._sizes.pop(thread_id, 0)
+        for key in [key for key in self._versions if key[0] == thread_id]:
+            del self._versions[key]
+
+
+def _optional_int(name, default):
+    """
+    Read an integer setting from the environment, where "none" or "" means no limit.
+    """
+    value = os.getenv(name)
+    if value is None:
+        return default
+    if value.strip().lower() in ("", "none"):
+        return None
+    return int(value)
+
+
+def create_checkpointer(kind=None):
+    """
+    Create a checkpointer, configured from the environment.
+    Args:
+        kind: "memory" or "sqlite", defaults to the AGENT_CHECKPOINTER environment variable.
+    """
+    kind = (kind or os.getenv("AGENT_CHECKPOINTER", "memory")).lower()
+    keep_last = int(os.getenv("AGENT_CHECKPOINT_KEEP", DEFAULT_KEEP_LAST))
+    ttl = _optional_int("AGENT_THREAD_TTL", DEFAULT_THREAD_TTL)
+
+    if kind == "memory":
+        return BoundedMemorySaver(
+            keep_last=keep_last,
+            ttl=ttl,
+            max_bytes=_optional_int("AGENT_CHECKPOINT_MAX_BYTES", DEFAULT_MAX_BYTES),
+        )
+    if kind == "sqlite":
+        # needs the optional langgraph-checkpoint-sqlite package, pinned in requirements.txt
+        from .sqlite_checkpointer import BoundedSqliteSaver
+
+        return BoundedSqliteSaver.from_path(
+            os.getenv("AGENT_CHECKPOINT_DB", DEFAULT_CHECKPOINT_DB),
+            keep_last=keep_last,
+            ttl=ttl,
+        )
+    raise ValueError(f"Unknown checkpointer '{kind}', use 'memory' or 'sqlite'.")
+
+
+_checkpointer = None
+_checkpointer_lock = threading.Lock()
+
+
+def get_checkpointer():
+    """
+    Get the process-wide checkpointer shared by the agent graphs, created on first use.
+    """
+    global _checkpointer
+    with _checkpointer_lock:
+        if _checkpointer is None:
+            _checkpointer = create_checkpointer()
+        return _checkpointer
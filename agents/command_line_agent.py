@@ -1,4 +1,3 @@
-from langchain.schema import AIMessage, HumanMessage, SystemMessage
 from langchain_core.runnables import Runnable
 from typing import List, Dict, Any, Optional
 from .agent import Agent
@@ -8,7 +7,16 @@ class CommandLineAgent(Agent):
     Command line agent.
     """
 
-    def __init__(self, model, tools, agent_prompt, messages=None):
+    def __init__(
+        self,
+        model,
+        tools,
+        agent_prompt,
+        messages=None,
+        context_manager=None,
+        response_cache=None,
+        scheduler=None,
+    ):
         """
         Initialize the command line agent.
         """
@@ -45,4 +53,7 @@ class CommandLineAgent(Agent):
             messages,
             message_listener=message_listener,
             user_input_listener=user_input_listener,
+            context_manager=context_manager,
+            response_cache=response_cache,
+            scheduler=scheduler,
         )
@@ -0,0 +1,268 @@
+import threading
+
+from langchain_core.messages import (
+    HumanMessage,
+    RemoveMessage,
+    SystemMessage,
+    ToolMessage,
+)
+from langgraph.graph.message import REMOVE_ALL_MESSAGES
+
+from . import instrumentation
+
+# Name given to the system message that holds the summary of trimmed turns
+SUMMARY_NAME = "conversation_summary"
+
+SUMMARY_PROMPT = """
+Summarise the conversation below between a user, an assistant and its tools. Keep every fact, ID, name and decision that could matter later, and drop everything else. Reply with the summary only.
+"""
+
+
+def approximate_tokens(text) -> int:
+    """
+    Rough token count of a text, about four characters per token.
+    """
+    return len(str(text)) // 4 + 1
+
+
+class ContextManager:
+    """
+    Keeps the message history of an agent within a token budget.
+
+    Large tool outputs are truncated first. If the history is still over
+    max_tokens, the oldest turns are dropped, always keeping the system prompt
+    and the last keep_last turns. An AI message and the tool messages answering
+    its tool calls count as one turn so they are never split. When a summarizer
+    model is given, dropped turns are folded into a summary message instead of
+    being lost.
+    """
+
+    def __init__(
+        self,
+        max_tokens=8000,
+        max_tool_tokens=1000,
+        keep_last=6,
+        summarizer=None,
+        count_tokens=approximate_tokens,
+    ):
+        """
+        Initialize the context manager.
+        Args:
+            max_tokens: The token budget of the whole history.
+            max_tool_tokens: The token budget of a single tool output.
+            keep_last: The number of most recent turns that are never dropped.
+            summarizer: Model used to summarise dropped turns. (optional)
+            count_tokens: Function that counts the tokens of a text. (optional)
+        """
+        self.max_tokens = max_tokens
+        self.max_tool_tokens = max_tool_tokens
+        self.keep_last = keep_last
+        self.summarizer = summarizer
+        self.count_tokens = count_tokens
+
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.trimmed_calls = 0
+        self.tokens_before = 0
+        self.tokens_after = 0
+        self.last_tokens_saved = 0
+
+    def message_tokens(self, message) -> int:
+        """
+        Count the tokens of a message, including its tool calls.
+        """
+        tokens = self.count_tokens(message.content) + 4
+        for tool_call in getattr(message, "tool_calls", None) or []:
+            tokens += self.count_tokens(tool_call["name"]) + self.count_tokens(tool_call["args"])
+        return tokens
+
+    def prepare(self, messages, invoke=None):
+        """
+        Fit messages into the token budget.
+        Args:
+            messages: The message history.
+            invoke: Function called with the summarizer and the messages to send it,
+                e.g. Agent.invoke_model so the call goes through the scheduler.
+                (optional, defaults to calling the summarizer directly)
+        Returns:
+            The new list of messages, or None if nothing had to change.
+        """
+        before, system, turns, dropped, changed = self._fit(messages)
+        if dropped and self.summarizer is not None:
+            request = self._summary_request(system, dropped)
+            summary = invoke(self.summarizer, request) if invoke else self.summarizer.invoke(request)
+            system = self._with_summary(system, summary)
+        return self._result(before, system, turns, changed)
+
+    async def aprepare(self, messages, ainvoke=None):
+        """
+        Async version of prepare, ainvoke is a coroutine function, e.g. Agent.ainvoke_model.
+        """
+        before, system, turns, dropped, changed = self._fit(messages)
+        if dropped and self.summarizer is not None:
+            request = self._summary_request(system, dropped)
+            if ainvoke:
+                summary = await ainvoke(self.summarizer, request)
+            else:
+                summary = await self.summarizer.ainvoke(request)
+            system = self._with_summary(system, summary)
+        return self._result(before, system, turns, changed)
+
+    def _fit(self, messages):
+        """
+        Truncate large tool outputs and drop the oldest turns over the budget.
+        """
+        before = sum(self.message_tokens(message) for message in messages)
+
+        changed = False
+        fitted = []
+        for message in messages:
+            truncated = self._truncate_tool_output(message)
+            changed = changed or truncated is not message
+            fitted.append(truncated)
+
+        system, turns = self._split_turns(fitted)
+        total = sum(self.message_tokens(message) for message in fitted)
+
+        dropped = []
+        while total > self.max_tokens and len(turns) > self.keep_last:
+            turn = turns.pop(0)
+            dropped.extend(turn)
+            total -= sum(self.message_tokens(message) for message in turn)
+
+        return before, system, turns, dropped, changed or bool(dropped)
+
+    def _result(self, before, system, turns, changed):
+        result = system + [message for turn in turns for message in turn]
+        after = sum(self.message_tokens(message) for message in result)
+        self._record(before, after)
+
+        return result if changed else None
+
+    def stats(self) -> dict:
+        """
+        Get the token savings so far.
+        """
+        with self._lock:
+            return {
+                "calls": self.calls,
+                "trimmed_calls": self.trimmed_calls,
+                "tokens_before": self.tokens_before,
+                "tokens_after": self.tokens_after,
+                "tokens_saved": self.tokens_before - self.tokens_after,
+                "last_tokens_saved": self.last_tokens_saved,
+            }
+
+    def _truncate_tool_output(self, message):
+        if not isinstance(message, ToolMessage) or not isinstance(message.content, str):
+            return message
+        if message.response_metadata.get("truncated"):
+            return message
+        if self.count_tokens(message.content) <= self.max_tool_tokens:
+            return message
+
+        keep = self.max_tool_tokens * 4
+        content = (
+            message.content[:keep]
+            + f"\n...[truncated {len(message.content) - keep} characters]"
+        )
+        return message.model_copy(
+            update={
+                "content": content,
+                "response_metadata": {**message.response_metadata, "truncated": True},
+            }
+        )
+
+    def _split_turns(self, messages):
+        """
+        Split messages into the leading system messages and a list of turns.
+        """
+        index = 0
+        while index < len(messages) and isinstance(messages[index], SystemMessage):
+            index += 1
+
+        turns = []
+        for message in messages[index:]:
+            if isinstance(message, ToolMessage) and turns:
+                # tool results belong to the turn of the AI message that asked for them
+                turns[-1].append(message)
+            else:
+                turns.append([message])
+        return messages[:index], turns
+
+    def _summary_request(self, system, dropped):
+        """
+        Build the messages asking the summarizer to fold the dropped turns, and
+        any previous summary, into one summary.
+        """
+        previous = [message for message in system if message.name == SUMMARY_NAME]
+
+        lines = []
+        for message in previous + dropped:
+            line = f"{message.type}: {message.content}"
+            if getattr(message, "tool_calls", None):
+                line += f" (tool calls: {message.tool_calls})"
+            lines.append(line)
+        transcript = "\n".join(lines)
+        return [SystemMessage(content=SUMMARY_PROMPT), HumanMessage(content=transcript)]
+
+    def _with_summary(self, system, summary):
+        """
+        Replace the previous summary message with the new summary.
+        """
+        system = [message for message in system if message.name != SUMMARY_NAME]
+        return system + [
+            SystemMessage(
+                content=f"Summary of the earlier conversation:\n{summary.content}",
+                name=SUMMARY_NAME,
+            )
+        ]
+
+    def _record(self, before, after):
+        with self._lock:
+            self.calls += 1
+            self.tokens_before += before
+            self.tokens_after += after
+            self.last_tokens_saved = before - after
+            if after < before:
+                self.trimmed_calls += 1
+        if instrumentation.enabled():
+            instrumentation.metrics.increment(
+                "agent_context_calls_total", result="trimmed" if after < before else "unchanged"
+            )
+            if after < before:
+                instrumentation.metrics.increment("agent_context_tokens_saved_total", before - after)
+
+
+def manage_context(state, config):
+    """
+    Graph node that fits the message history of the agent into its token budget.
+    It is a no-op for agents without a context manager. The summarizer is called
+    through the agent, so it shares the response cache and the scheduler.
+    """
+    agent = config["configurable"]["agent"]
+    if agent.context_manager is None:
+        return {}
+
+    messages = agent.context_manager.prepare(state["messages"], invoke=agent.invoke_model)
+    return _replace_history(messages)
+
+
+async def amanage_context(state, config):
+    """
+    Async version of manage_context, used when the graph runs with astream/ainvoke.
+    """
+    agent = config["configurable"]["agent"]
+    if agent.context_manager is None:
+        return {}
+
+    messages = await agent.context_manager.aprepare(state["messages"], ainvoke=agent.ainvoke_model)
+    return _replace_history(messages)
+
+
+def _replace_history(messages):
+    if messages is None:
+        return {}
+
+    # replace the whole history, so the order of the messages is kept
+    return {"messages": [RemoveMessage(id=REMOVE_ALL_MESSAGES), *messages]}
@@ -0,0 +1,114 @@
+import threading
+
+from langchain_core.runnables import RunnableLambda
+from langgraph.graph import MessagesState, StateGraph
+
+from .checkpointer import get_checkpointer
+from .context_manager import amanage_context, manage_context
+from .parallel_tools import ParallelToolNode
+
+# Process-wide caches, shared by every Agent instance. Compiled graphs are
+# keyed by (graph shape, tool set) and tool-bound models by (model, tool set).
+# The cached values hold on to the model and tools so their ids stay valid.
+_lock = threading.Lock()
+_compiled_graphs = {}
+_bound_models = {}
+
+# The shape of the graph built by build_graph, bump it when the shape changes
+GRAPH_SHAPE = "context->agent->tools->context"
+
+
+def tools_key(tools):
+    """
+    Build a hashable key that identifies a set of tools, in any order.
+    Args:
+        tools: The tools to identify.
+    """
+    return tuple(sorted(id(tool) for tool in tools))
+
+
+def sorted_tools(tools):
+    """
+    Sort tools by name, so the tool schemas sent to the model are always in the
+    same order and the prompt prefix stays cacheable by the model provider.
+    """
+    return sorted(tools, key=lambda tool: getattr(tool, "name", None) or getattr(tool, "__name__", ""))
+
+
+def call_agent_model(state: MessagesState, config):
+    """
+    Graph node that calls the model of the agent that owns the current thread.
+    The agent is passed through the thread config so that one compiled graph
+    can be shared by all agents with the same tools.
+    """
+    agent = config["configurable"]["agent"]
+    return agent.call_model(state)
+
+
+async def acall_agent_model(state: MessagesState, config):
+    """
+    Async version of call_agent_model, used when the graph runs with astream/ainvoke.
+    """
+    agent = config["configurable"]["agent"]
+    return await agent.acall_model(state)
+
+
+def build_graph(tools):
+    """
+    Build and compile the agent graph for the given tools.
+    Args:
+        tools: The tools to use.
+    """
+    graph = StateGraph(MessagesState)
+    graph.add_node("context", RunnableLambda(manage_context, afunc=amanage_context))
+    graph.add_node("agent", RunnableLambda(call_agent_model, afunc=acall_agent_model))
+    # the tool calls of one model turn run concurrently
+    graph.add_node("tools", ParallelToolNode(tools))
+    graph.add_edge("context", "agent")
+    graph.add_edge("agent", "tools")
+    graph.add_edge("tools", "context")
+
+    graph.set_entry_point("context")
+
+    # all graphs share one checkpointer, so its memory bounds hold process-wide
+    return graph.compile(checkpointer=get_checkpointer())
+
+
+def get_compiled_graph(tools):
+    """
+    Get the compiled graph for the given tools, compiling it on first use.
+    Args:
+        tools: The tools to use.
+    """
+    key = (GRAPH_SHAPE, tools_key(tools))
+    with _lock:
+        cached = _compiled_graphs.get(key)
+        if cached is None:
+            cached = (list(tools), build_graph(tools))
+            _compiled_graphs[key] = cached
+    return cached[1]
+
+
+def get_bound_model(model, tools):
+    """
+    Get the model with the given tools bound to it, binding them on first use.
+    Args:
+        model: The model to use.
+        tools: The tools to bind.
+    """
+    key = (id(model), tools_key(tools))
+    with _lock:
+        cached = _bound_models.get(key)
+        if cached is None:
+            cached = (model, list(tools), model.bind_tools(sorted_tools(tools), tool_choice="auto"))
+            _bound_models[key] = cached
+    return cached[2]
+
+
+def clear_cache():
+    """
+    Drop all cached graphs and bound models.
+    """
+    with _lock:
+        _compiled_graphs.clear()
+        _bound_models.clear()
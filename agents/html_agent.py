@@ -1,76 +1,234 @@
 import json
-import os
-from flask import jsonify
+from contextlib import aclosing
 
-from bs4 import BeautifulSoup
-from dotenv import load_dotenv
 from langchain_core.tools import tool
-from langchain_openai import AzureChatOpenAI
 
-from .agent import Agent
+from .agent import Agent, token_text
+from .html_detector import HTMLPageDetector, is_html_page
+from .model_policy import LARGE
+from .model_provider import get_agent_model
+from .model_scheduler import PAGE
+from .page_cache import get_page_cache
 from .workflow_agent import WorkflowAgent
 
 
+class PageTokens:
+    """
+    Picks the streamed model tokens of the turn that writes the page.
+
+    The text of a turn is held back until it starts like a page, so the text
+    of a tool calling turn is never sent. When the agent has a ModelPolicy,
+    the turns routed to the small model are not streamed at all, since their
+    answer can still be rejected and asked again of the large model. A page
+    that was not streamed is sent whole once it is found.
+    """
+
+    def __init__(self, agent):
+        self.agent = agent
+        # ids of the messages whose tokens were streamed
+        self.streamed = set()
+        # message id -> text held back until the message starts like a page
+        self._held = {}
+        self._stream_turn = True
+
+    def next_turn(self, messages) -> None:
+        """
+        Decide whether to stream the next model turn, from the messages it gets.
+        """
+        policy = self.agent.model_policy
+        if policy is not None and messages:
+            self._stream_turn = policy.route(self.agent, messages) == LARGE
+
+    def feed(self, chunk, metadata):
+        """
+        Get the text to stream for a token, or None.
+        """
+        text = token_text(chunk, metadata)
+        if text is None or not self._stream_turn:
+            return None
+        if chunk.id in self.streamed:
+            return text
+
+        held = self._held.get(chunk.id, "") + text
+        if held.lstrip()[:1] in ("<", "`"):
+            self._held.pop(chunk.id, None)
+            self.streamed.add(chunk.id)
+            return held
+        self._held[chunk.id] = held
+        return None
+
+
 class HTMLAgent(Agent):
     """
     This class is responsible for rendering HTML pages using the Azure OpenAI model.
     """
 
-    def __init__(self, model, tools, agent_prompt, messages=None):
+    heavy_generation = True
+    # pages wait behind the interactive model calls
+    priority = PAGE
+
+    def __init__(
+        self,
+        model,
+        tools,
+        agent_prompt,
+        messages=None,
+        html_validator=None,
+        response_cache=None,
+        prompt_variables=None,
+        scheduler=None,
+    ):
+        """
+        Initialize the HTML agent.
+        Args:
+            html_validator: Optional extra check run once on a detected page, e.g.
+                html_detector.beautifulsoup_validator("lxml").
+            response_cache: Optional ResponseCache for model turns.
+            prompt_variables: Optional per-request values for a static system prompt.
+            scheduler: Optional ModelScheduler for the model calls.
+        """
         super().__init__(
             model,
             tools,
             agent_prompt,
             messages,
+            response_cache=response_cache,
+            prompt_variables=prompt_variables,
+            scheduler=scheduler,
         )
+        self.html_validator = html_validator
+        # the last complete page found by stream_html/astream_html
+        self.page = None
+        # scans each message once, instead of re-parsing it on every event
+        self.html_detector = HTMLPageDetector(html_validator)
 
     def is_html_page(self, input_string):
         """
         Check if the input string is a valid HTML page.
         """
-        soup = BeautifulSoup(input_string, "html.parser")
-        return bool(soup.find("html") and soup.find("body"))  # Returns True if the string contains <html> and <body> tags
+        # Returns True if the string contains <html> and <body> tags
+        return is_html_page(input_string, self.html_validator)
+
+    def is_valid_response(self, message) -> bool:
+        """
+        Check a model response, a final answer must be a complete HTML page.
+        """
+        if message.tool_calls or message.invalid_tool_calls:
+            return super().is_valid_response(message)
+        return isinstance(message.content, str) and self.is_html_page(message.content)
 
     def render_html(self, data):
         """
         Run the HTML agent, tries to return an HTML page
         """
         # Add the data to the messages
-        self.state["messages"].extend({"role": "user", "content": json.dumps(data)})
+        self.state["messages"].append({"role": "user", "content": json.dumps(data)})
 
-        for event in self.graph.stream(
-            self.state, config=self.thread_config, stream_mode="values"
-        ):
-            try:
-                content = event["messages"][-1].content
+        for event in self.stream_values(self.next_input()):
+            content = self.extract_html(event)
+            if content is not None:
+                return content
 
-                if self.is_html_page(content):
-                    return content
+        return None
+
+    async def arender_html(self, data):
+        """
+        Run the HTML agent asynchronously, tries to return an HTML page
+        """
+        # Add the data to the messages
+        self.state["messages"].append({"role": "user", "content": json.dumps(data)})
 
-            except Exception as e:
-                pass
+        # closed on return, so the run's trace is finished before the agent is reused
+        async with aclosing(self.astream_values(self.next_input())) as events:
+            async for event in events:
+                content = self.extract_html(event)
+                if content is not None:
+                    return content
 
         return None
 
+    def stream_html(self, data):
+        """
+        Run the HTML agent, yielding the page text as the model generates it.
+        Once the complete page is found it is also stored in self.page.
+        """
+        self.page = None
+        # Add the data to the messages
+        self.state["messages"].append({"role": "user", "content": json.dumps(data)})
+
+        config, trace = self.start_trace()
+        tokens = PageTokens(self)
+        try:
+            for mode, payload in self.graph.stream(
+                self.next_input(), config=config, stream_mode=["messages", "values"]
+            ):
+                if mode == "messages":
+                    text = tokens.feed(*payload)
+                    if text is not None:
+                        yield text
+                else:
+                    content = self.extract_html(payload)
+                    if content is not None:
+                        self.page = content
+                        if payload["messages"][-1].id not in tokens.streamed:
+                            # the page was not generated token by token, e.g. a cached or escalated response
+                            yield content
+                        return
+                    tokens.next_turn(payload.get("messages"))
+        finally:
+            self.finish_trace(trace)
+
+    async def astream_html(self, data):
+        """
+        Async version of stream_html.
+        """
+        self.page = None
+        # Add the data to the messages
+        self.state["messages"].append({"role": "user", "content": json.dumps(data)})
+
+        config, trace = self.start_trace()
+        tokens = PageTokens(self)
+        try:
+            stream = self.graph.astream(
+                self.next_input(), config=config, stream_mode=["messages", "values"]
+            )
+            async with aclosing(stream):
+                async for mode, payload in stream:
+                    if mode == "messages":
+                        text = tokens.feed(*payload)
+                        if text is not None:
+                            yield text
+                    else:
+                        content = self.extract_html(payload)
+                        if content is not None:
+                            self.page = content
+                            if payload["messages"][-1].id not in tokens.streamed:
+                                # the page was not generated token by token, e.g. a cached or escalated response
+                                yield content
+                            return
+                        tokens.next_turn(payload.get("messages"))
+        finally:
+            self.finish_trace(trace)
+
+    def extract_html(self, event):
+        """
+        Try to get the HTML page from an event, returns None if there is none yet.
+        """
+        try:
+            message = event["messages"][-1]
+            content = message.content
 
-# Load environment variables from .env file
-load_dotenv()
+            if self.html_detector.check(content, key=message.id):
+                return content
 
-# Initialize the model
-model = AzureChatOpenAI(
-    azure_endpoint=os.getenv("AZURE_OPENAI_ENDPOINT"),
-    api_version=os.getenv("AZURE_OPENAI_API_VERSION"),
-    api_key=os.getenv("AZURE_OPENAI_KEY"),
-    deployment_name=os.getenv("AZURE_OPENAI_DEPLOYMENT_NAME"),
-    temperature=0,
-)
+        except Exception as e:
+            pass
 
+        return None
 
-@tool
-def render_search_page() -> str:
-    """Renders the search page, returns HTML."""
 
-    render_search_prompt = """
+# The prompt of the page rendered by the render_search_page tool
+SEARCH_PAGE_PROMPT = """
 You are an amazing web developer that loves to use bootstrap. Your job is to create a front end for a search page. The search page is for a database of document.  Use bootstrap for styling, html, and vanilla javascript as much as possible. What you return should be a complete html page that can be rendered in a browser. Do not add any additional text or explanation.
 
 The search page should include the following:
@@ -94,29 +252,45 @@ IMPORTANT:
 - Each row should have a button to delete the document, and a button to update the document. The update button should take the user to a new page with a form to update the document.
 - Try your best to respond quickly, the user is waiting for you.
 """
-    # Check if the templates directory exists, if not create it
-    if not os.path.exists("templates"):
-        os.makedirs("templates")
-
-    result = ""
-    # Check if the search.html file exists, if not call the renderer
-    if not os.path.exists("templates/search.html"):
-
-        renderer = HTMLAgent(
-            model=model,
-            tools=[],
-            agent_prompt=render_search_prompt,
-        )
 
-        result = renderer.render_html({})
 
-        # save the result to a file in the templates directory
-        with open("templates/search.html", "w") as f:
-            f.write(result)
+def search_page_key():
+    """
+    Get the page cache key of the search page of render_search_page.
+    """
+    return get_page_cache().make_key("search", SEARCH_PAGE_PROMPT, [])
+
+
+def generate_search_page():
+    """
+    Generate the search page of render_search_page, returns the HTML or None.
+    """
+    renderer = HTMLAgent(
+        model=get_agent_model(),
+        tools=[],
+        agent_prompt=SEARCH_PAGE_PROMPT,
+    )
+
+    return renderer.render_html({})
+
+
+@tool
+def render_search_page() -> str:
+    """Renders the search page, returns HTML."""
+
+    # Serve the page from the generated page cache if it is there
+    page_cache = get_page_cache()
+    cache_key = search_page_key()
+    cached = page_cache.get(cache_key)
+
+    if cached is not None:
+        result = cached[0]
     else:
-        # read the file and return it
-        with open("templates/search.html", "r") as f:
-            result = f.read()
+        result = generate_search_page()
+
+        # save the result to the page cache
+        if result is not None:
+            page_cache.put(cache_key, result)
 
     return {'page': result}
 
@@ -156,7 +330,7 @@ IMPORTANT:
 """
 
     renderer = WorkflowAgent(
-        model=model,
+        model=get_agent_model(),
         tools=[],
         agent_prompt=render_create_prompt,
     )
@@ -0,0 +1,103 @@
+import re
+
+# Start tags that make a string an HTML page, like <html lang="en"> or <BODY>
+_PAGE_TAG = re.compile(r"<(html|body)[\s/>]", re.IGNORECASE)
+# Characters kept from the previous chunk, so a tag split across chunks is found
+_TAIL_LENGTH = len("<html ") - 1
+
+
+def beautifulsoup_validator(parser="html.parser"):
+    """
+    Build a validator that parses the page with BeautifulSoup, e.g. with "lxml".
+    Args:
+        parser: The parser BeautifulSoup should use.
+    """
+
+    def validate(content):
+        from bs4 import BeautifulSoup
+
+        soup = BeautifulSoup(content, parser)
+        return bool(soup.find("html") and soup.find("body"))
+
+    return validate
+
+
+class HTMLPageDetector:
+    """
+    Detects an HTML page in text that grows, only scanning the text it has not seen.
+
+    A page is detected once both an <html> and a <body> start tag were seen.
+    When a validator is given, it is only run on the full text from that point
+    on, and not again while the text is unchanged, instead of parsing the text
+    on every check. Checking complete texts with no key, as is_html_page does,
+    makes it a plain fast page check.
+    """
+
+    def __init__(self, validator=None):
+        """
+        Initialize the detector.
+        Args:
+            validator: Optional function called with the full text once the page
+                structure is detected, it returns whether the page is valid.
+        """
+        self.validator = validator
+        self.reset()
+
+    def reset(self, key=None) -> None:
+        """
+        Forget everything that was scanned, e.g. for a new message.
+        """
+        self.key = key
+        self.scanned = 0
+        self.tail = ""
+        self.tags = set()
+        self.result = None
+
+    def feed(self, text) -> bool:
+        """
+        Scan the next chunk of text.
+        Returns:
+            Whether an HTML page has been detected so far.
+        """
+        self.scanned += len(text)
+        if len(self.tags) < 2:
+            window = self.tail + text
+            for match in _PAGE_TAG.finditer(window):
+                self.tags.add(match.group(1).lower())
+                if len(self.tags) == 2:
+                    break
+            self.tail = window[-_TAIL_LENGTH:]
+        return len(self.tags) == 2
+
+    def check(self, content, key=None) -> bool:
+        """
+        Check whether the full content so far is an HTML page.
+        Content with the same key as the last check is expected to have only grown,
+        so just the new part is scanned.
+        Args:
+            content: The full text so far.
+            key: Identifies the text, e.g. the message id. (optional)
+        """
+        if key != self.key or key is None or len(content) < self.scanned:
+            self.reset(key)
+        elif self.result is not None and len(content) == self.scanned:
+            # nothing new since the last check
+            return self.result
+
+        if not self.feed(content[self.scanned :]):
+            self.result = False
+        elif self.validator is None:
+            self.result = True
+        else:
+            self.result = bool(self.validator(content))
+        return self.result
+
+
+def is_html_page(content, validator=None) -> bool:
+    """
+    Check if a string is an HTML page, i.e. it contains <html> and <body> tags.
+    Args:
+        content: The string to check.
+        validator: Optional extra validity check, see HTMLPageDetector.
+    """
+    return HTMLPageDetector(validator).check(content)
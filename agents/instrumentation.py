@@ -0,0 +1,316 @@
+import json
+import os
+import threading
+import time
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+# Histogram buckets for durations in seconds and sizes in bytes
+SECONDS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+BYTES_BUCKETS = (1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+# Help text of the exported metrics
+METRICS_HELP = {
+    "agent_runs_total": "Agent graph runs.",
+    "agent_run_seconds": "Duration of agent graph runs.",
+    "agent_node_seconds": "Duration of graph node executions.",
+    "agent_model_seconds": "Duration of model calls.",
+    "agent_model_tokens_total": "Model tokens used, by type. prompt_cached are the prompt tokens read from the provider's prompt cache.",
+    "agent_tool_seconds": "Duration of tool calls.",
+    "agent_tool_errors_total": "Tool calls that raised an error.",
+    "agent_tool_parallel_saved_seconds": "Wall-clock time saved per model turn by running its tool calls concurrently.",
+    "agent_retries_total": "Retried calls, by kind.",
+    "agent_checkpoint_put_seconds": "Duration of checkpoint writes.",
+    "agent_checkpoint_bytes": "Serialized size of written checkpoints.",
+    "agent_response_cache_total": "Model response cache lookups, by result.",
+    "agent_search_cache_total": "Search result cache lookups, by result: hit or miss.",
+    "agent_context_calls_total": "Context manager passes over the message history, by result: trimmed or unchanged.",
+    "agent_context_tokens_saved_total": "Tokens the context manager removed from the message history before model calls.",
+    "agent_model_tier_calls_total": "Model calls of a ModelPolicy, by tier.",
+    "agent_model_tier_seconds": "Duration of the model calls of a ModelPolicy, by tier.",
+    "agent_model_queue_seconds": "Time model calls waited in the scheduler queue, by priority.",
+    "agent_single_flight_total": "Coalesced requests, by result: run, shared, timeout or abandoned.",
+    "agent_page_warmup_total": "Pages of a warm-up, by status: cached, generated, in_flight or failed.",
+    "agent_page_warmup_seconds": "Generation time of warmed up pages, by page.",
+    "agent_model_escalations_total": "Small model answers that failed validation and were asked again of the large model.",
+}
+
+
+def _is_true(value) -> bool:
+    return str(value).strip().lower() in ("1", "true", "yes", "on")
+
+
+_enabled = _is_true(os.getenv("AGENT_METRICS", "false"))
+
+
+def enabled() -> bool:
+    """
+    Whether instrumentation is on, set with the AGENT_METRICS environment variable.
+    """
+    return _enabled
+
+
+def set_enabled(value) -> None:
+    """
+    Turn instrumentation on or off.
+    """
+    global _enabled
+    _enabled = bool(value)
+
+
+class MetricsRegistry:
+    """
+    Process-wide counters and histograms, exported in the Prometheus text format.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # (name, labels) -> value
+        self._counters = {}
+        # (name, labels) -> [bucket bounds, bucket counts, sum, count]
+        self._histograms = {}
+
+    def increment(self, name, amount=1, **labels) -> None:
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    def observe(self, name, value, buckets=SECONDS_BUCKETS, **labels) -> None:
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = [buckets, [0] * len(buckets), 0.0, 0]
+                self._histograms[key] = histogram
+            for index, bound in enumerate(buckets):
+                if value <= bound:
+                    histogram[1][index] += 1
+            histogram[2] += value
+            histogram[3] += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+
+    def prometheus(self) -> str:
+        """
+        Export the metrics in the Prometheus text exposition format.
+        """
+        with self._lock:
+            counters = sorted(self._counters.items())
+            histograms = sorted(
+                (key, [value[0], list(value[1]), value[2], value[3]])
+                for key, value in self._histograms.items()
+            )
+
+        lines = []
+        described = set()
+
+        def describe(name, kind):
+            if name not in described:
+                described.add(name)
+                lines.append(f"# HELP {name} {METRICS_HELP.get(name, name)}")
+                lines.append(f"# TYPE {name} {kind}")
+
+        for (name, labels), value in counters:
+            describe(name, "counter")
+            lines.append(f"{name}{_format_labels(labels)} {value}")
+
+        for (name, labels), (buckets, counts, total, count) in histograms:
+            describe(name, "histogram")
+            for bound, bucket_count in zip(buckets, counts):
+                lines.append(
+                    f"{name}_bucket{_format_labels(labels + (('le', bound),))} {bucket_count}"
+                )
+            lines.append(f"{name}_bucket{_format_labels(labels + (('le', '+Inf'),))} {count}")
+            lines.append(f"{name}_sum{_format_labels(labels)} {total}")
+            lines.append(f"{name}_count{_format_labels(labels)} {count}")
+
+        return "\n".join(lines) + "\n"
+
+
+def _format_labels(labels) -> str:
+    if not labels:
+        return ""
+    parts = []
+    for key, value in labels:
+        value = str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        parts.append(f'{key}="{value}"')
+    return "{" + ",".join(parts) + "}"
+
+
+metrics = MetricsRegistry()
+
+
+def record_retry(kind) -> None:
+    """
+    Count a retried call, e.g. a model call retried after a rate limit.
+    """
+    if _enabled:
+        metrics.increment("agent_retries_total", kind=kind)
+
+
+def record_checkpoint(seconds, size) -> None:
+    """
+    Record a checkpoint write and the size of the written checkpoint.
+    """
+    if _enabled:
+        metrics.observe("agent_checkpoint_put_seconds", seconds)
+        metrics.observe("agent_checkpoint_bytes", size, buckets=BYTES_BUCKETS)
+
+
+class RunTrace(BaseCallbackHandler):
+    """
+    Records one agent run, as metrics and as a trace of timed spans.
+
+    It is passed to the graph as a callback handler, so it sees every node,
+    model call and tool call of the run, including the tools that run on
+    other threads.
+    """
+
+    # called on the thread of the event, no need to hop to an executor
+    run_inline = True
+
+    def __init__(self, agent_name, thread_id):
+        self.agent_name = agent_name
+        self.thread_id = thread_id
+        self.started = time.time()
+        self._start = time.perf_counter()
+        self._lock = threading.Lock()
+        # run id -> (span kind, name, start)
+        self._open = {}
+        self.spans = []
+        self.prompt_tokens = 0
+        # prompt tokens the model provider served from its prompt cache
+        self.cached_prompt_tokens = 0
+        self.completion_tokens = 0
+        self.retries = 0
+        self.duration = None
+
+    def on_chain_start(self, serialized, inputs, *, run_id, metadata=None, **kwargs):
+        node = (metadata or {}).get("langgraph_node")
+        # only the node itself, not the runnables inside it
+        if node is not None and kwargs.get("name") == node:
+            self._begin(run_id, "node", node)
+
+    def on_chain_end(self, outputs, *, run_id, **kwargs):
+        self._end(run_id)
+
+    def on_chain_error(self, error, *, run_id, **kwargs):
+        self._end(run_id, error=error)
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, **kwargs):
+        self._begin(run_id, "model", kwargs.get("name") or (serialized or {}).get("name", "model"))
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        prompt_tokens = cached_prompt_tokens = completion_tokens = 0
+        for generations in response.generations:
+            for generation in generations:
+                usage = getattr(getattr(generation, "message", None), "usage_metadata", None)
+                if usage:
+                    prompt_tokens += usage.get("input_tokens", 0)
+                    completion_tokens += usage.get("output_tokens", 0)
+                    cached_prompt_tokens += (usage.get("input_token_details") or {}).get("cache_read") or 0
+        with self._lock:
+            self.prompt_tokens += prompt_tokens
+            self.cached_prompt_tokens += cached_prompt_tokens
+            self.completion_tokens += completion_tokens
+        metrics.increment("agent_model_tokens_total", prompt_tokens, type="prompt")
+        metrics.increment("agent_model_tokens_total", cached_prompt_tokens, type="prompt_cached")
+        metrics.increment("agent_model_tokens_total", completion_tokens, type="completion")
+        self._end(
+            run_id,
+            prompt_tokens=prompt_tokens,
+            cached_prompt_tokens=cached_prompt_tokens,
+            completion_tokens=completion_tokens,
+        )
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        self._end(run_id, error=error)
+
+    def on_tool_start(self, serialized, input_str, *, run_id, **kwargs):
+        self._begin(run_id, "tool", kwargs.get("name") or (serialized or {}).get("name", "tool"))
+
+    def on_tool_end(self, output, *, run_id, **kwargs):
+        self._end(run_id)
+
+    def on_tool_error(self, error, *, run_id, **kwargs):
+        self._end(run_id, error=error)
+
+    def on_retry(self, retry_state, *, run_id, **kwargs):
+        with self._lock:
+            self.retries += 1
+        record_retry("runnable")
+
+    def finish(self, error=None) -> dict:
+        """
+        End the run, record it and get its trace.
+        """
+        if self.duration is None:
+            self.duration = time.perf_counter() - self._start
+            metrics.increment("agent_runs_total", agent=self.agent_name)
+            metrics.observe("agent_run_seconds", self.duration, agent=self.agent_name)
+        return self.to_dict(error)
+
+    def to_dict(self, error=None) -> dict:
+        with self._lock:
+            return {
+                "agent": self.agent_name,
+                "thread_id": self.thread_id,
+                "started": self.started,
+                "duration": self.duration,
+                "prompt_tokens": self.prompt_tokens,
+                "cached_prompt_tokens": self.cached_prompt_tokens,
+                "prompt_cache_hit_rate": (
+                    self.cached_prompt_tokens / self.prompt_tokens if self.prompt_tokens else 0.0
+                ),
+                "completion_tokens": self.completion_tokens,
+                "retries": self.retries,
+                "error": None if error is None else repr(error),
+                "spans": sorted(self.spans, key=lambda span: span["start"]),
+            }
+
+    def _begin(self, run_id, kind, name):
+        with self._lock:
+            self._open[run_id] = (kind, name, time.perf_counter())
+
+    def _end(self, run_id, error=None, **attributes):
+        end = time.perf_counter()
+        with self._lock:
+            opened = self._open.pop(run_id, None)
+            if opened is None:
+                return
+            kind, name, start = opened
+            span = {
+                "kind": kind,
+                "name": name,
+                "start": start - self._start,
+                "duration": end - start,
+                **attributes,
+            }
+            if error is not None:
+                span["error"] = repr(error)
+            self.spans.append(span)
+
+        if kind == "node":
+            metrics.observe("agent_node_seconds", end - start, node=name)
+        elif kind == "model":
+            metrics.observe("agent_model_seconds", end - start)
+        else:
+            metrics.observe("agent_tool_seconds", end - start, tool=name)
+            if error is not None:
+                metrics.increment("agent_tool_errors_total", tool=name)
+
+
+def write_trace(trace) -> None:
+    """
+    Write a run trace as JSON to the AGENT_TRACE_DIR directory, if it is set.
+    """
+    directory = os.getenv("AGENT_TRACE_DIR")
+    if not directory:
+        return
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f"{trace['thread_id']}-{int(trace['started'] * 1000)}.json")
+    with open(path, "w", encoding="utf-8") as file:
+        json.dump(trace, file, indent=2, default=str)
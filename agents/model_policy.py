@@ -0,0 +1,134 @@
+import threading
+import time
+
+from . import instrumentation
+
+SMALL = "small"
+LARGE = "large"
+
+
+def default_route(agent, messages) -> str:
+    """
+    Pick the tier of a model turn.
+
+    Turns that pick tools or write a short answer go to the small model. An
+    agent that generates large outputs, like HTMLAgent's pages, writes them
+    with the large model: when it has no tools, or once tool results came in,
+    its turns go to the large model, and its small model turns are only kept
+    when they call tools (see ModelPolicy.accepts), so a page the small model
+    writes on a tool selection turn is asked again of the large model.
+    """
+    if not agent.heavy_generation:
+        return SMALL
+    if agent.tools and messages and getattr(messages[-1], "type", None) != "tool":
+        return SMALL
+    return LARGE
+
+
+class ModelPolicy:
+    """
+    Routes the model turns of an agent between a small, fast model and a large one.
+
+    Pass it to an agent in place of the model. Each turn goes to the tier picked
+    by route, and an answer of the small model that is not accepted, e.g. a
+    WorkflowAgent answer that is not JSON, is asked again of the large model.
+    The latency of each tier and the escalation rate are kept in stats() and,
+    when instrumentation is on, in the metrics.
+    """
+
+    def __init__(self, small, large, route=default_route):
+        """
+        Initialize the policy.
+        Args:
+            small: The fast model, for routing, tool selection and short turns.
+            large: The model for heavy generation, and for escalations.
+            route: Function called with the agent and the messages of a turn that
+                returns SMALL or LARGE. (optional, defaults to default_route)
+        """
+        self.models = {SMALL: small, LARGE: large}
+        self.route = route
+
+        self._lock = threading.Lock()
+        # tier -> [calls, seconds]
+        self._tiers = {SMALL: [0, 0.0], LARGE: [0, 0.0]}
+        self.escalations = 0
+
+    def invoke(self, agent, messages):
+        """
+        Get the response of a model turn, escalating an invalid small model answer.
+        """
+        tier = self.route(agent, messages)
+        response = self._call(agent, tier, messages)
+        if tier == SMALL and not self.accepts(agent, response):
+            self._escalated()
+            response = self._call(agent, LARGE, messages)
+        return response
+
+    async def ainvoke(self, agent, messages):
+        """
+        Async version of invoke.
+        """
+        tier = self.route(agent, messages)
+        response = await self._acall(agent, tier, messages)
+        if tier == SMALL and not self.accepts(agent, response):
+            self._escalated()
+            response = await self._acall(agent, LARGE, messages)
+        return response
+
+    def accepts(self, agent, response) -> bool:
+        """
+        Whether a small model answer is kept. It must pass the agent's
+        is_valid_response check, and for an agent that generates large outputs
+        it must call tools, as the output itself is written by the large model.
+        """
+        if agent.heavy_generation and not response.tool_calls:
+            return False
+        return agent.is_valid_response(response)
+
+    def stats(self) -> dict:
+        """
+        Get the calls and mean latency of each tier, and the escalation rate.
+        """
+        with self._lock:
+            stats = {
+                tier: {
+                    "calls": calls,
+                    "mean_seconds": seconds / calls if calls else None,
+                }
+                for tier, (calls, seconds) in self._tiers.items()
+            }
+            small_calls = self._tiers[SMALL][0]
+            stats["escalations"] = self.escalations
+            stats["escalation_rate"] = self.escalations / small_calls if small_calls else 0.0
+            return stats
+
+    def _call(self, agent, tier, messages):
+        # small model answers that are not accepted are escalated, so they are not cached
+        is_valid = (lambda response: self.accepts(agent, response)) if tier == SMALL else None
+        start = time.perf_counter()
+        try:
+            return agent.invoke_model(agent.tier_models[tier], messages, is_valid)
+        finally:
+            self._record(tier, time.perf_counter() - start)
+
+    async def _acall(self, agent, tier, messages):
+        is_valid = (lambda response: self.accepts(agent, response)) if tier == SMALL else None
+        start = time.perf_counter()
+        try:
+            return await agent.ainvoke_model(agent.tier_models[tier], messages, is_valid)
+        finally:
+            self._record(tier, time.perf_counter() - start)
+
+    def _record(self, tier, seconds):
+        with self._lock:
+            self._tiers[tier][0] += 1
+            self._tiers[tier][1] += seconds
+        if instrumentation.enabled():
+            instrumentation.metrics.increment("agent_model_tier_calls_total", tier=tier)
+            instrumentation.metrics.observe("agent_model_tier_seconds", seconds, tier=tier)
+
+    def _escalated(self):
+        with self._lock:
+            self.escalations += 1
+        if instrumentation.enabled():
+            instrumentation.metrics.increment("agent_model_escalations_total")
@@ -0,0 +1,83 @@
+import os
+import threading
+
+from dotenv import load_dotenv
+
+from .model_policy import ModelPolicy
+from .model_scheduler import get_model_scheduler
+
+_model = None
+_small_model = None
+_model_policy = None
+_model_lock = threading.Lock()
+
+
+def create_model(deployment_name=None):
+    """
+    Create the Azure OpenAI chat model from the environment.
+    Args:
+        deployment_name: The deployment to use. (optional, defaults to AZURE_OPENAI_DEPLOYMENT_NAME)
+    """
+    # langchain_openai (and openai) are slow to import, so only load them when a model is needed
+    from langchain_openai import AzureChatOpenAI
+
+    # Load environment variables from .env file
+    load_dotenv()
+
+    options = {}
+    if get_model_scheduler() is not None:
+        # the scheduler retries rate limited calls, pausing every agent at once
+        options["max_retries"] = 0
+
+    return AzureChatOpenAI(
+        azure_endpoint=os.getenv("AZURE_OPENAI_ENDPOINT"),
+        api_version=os.getenv("AZURE_OPENAI_API_VERSION"),
+        api_key=os.getenv("AZURE_OPENAI_KEY"),
+        deployment_name=deployment_name or os.getenv("AZURE_OPENAI_DEPLOYMENT_NAME"),
+        temperature=0,
+        **options,
+    )
+
+
+def get_model():
+    """
+    Get the process-wide chat model, it is created on first use.
+    """
+    global _model
+    with _model_lock:
+        if _model is None:
+            _model = create_model()
+        return _model
+
+
+def get_agent_model():
+    """
+    Get the model to give agents: a ModelPolicy over a small and the large model
+    when AZURE_OPENAI_SMALL_DEPLOYMENT_NAME is set (or a small model was set with
+    set_model), otherwise the chat model.
+    """
+    global _small_model, _model_policy
+    model = get_model()
+    small_deployment = os.getenv("AZURE_OPENAI_SMALL_DEPLOYMENT_NAME")
+    with _model_lock:
+        if _small_model is None and small_deployment:
+            _small_model = create_model(small_deployment)
+        if _small_model is None:
+            return model
+        if _model_policy is None:
+            _model_policy = ModelPolicy(_small_model, model)
+        return _model_policy
+
+
+def set_model(model, small_model=None) -> None:
+    """
+    Replace the process-wide chat models, e.g. with scripted models for benchmarks.
+    Args:
+        model: The chat model, the large model of the model policy.
+        small_model: The small model of the model policy. (optional)
+    """
+    global _model, _small_model, _model_policy
+    with _model_lock:
+        _model = model
+        _small_model = small_model
+        _model_policy = None
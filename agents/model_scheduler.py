@@ -0,0 +1,390 @@
+import asyncio
+import heapq
+import itertools
+import json
+import os
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+
+from . import instrumentation
+from .context_manager import approximate_tokens
+
+# Priority classes, lower runs first
+INTERACTIVE = 0  # command line and API requests, a user waits on each turn
+PAGE = 1  # UI page generation
+PRIORITY_NAMES = {INTERACTIVE: "interactive", PAGE: "page"}
+
+# The burst a rate limit allows, in seconds of its budget
+DEFAULT_BURST_SECONDS = 10
+# Tokens reserved for the answer when the model has no max_tokens
+DEFAULT_COMPLETION_TOKENS = 1000
+DEFAULT_MAX_RETRIES = 6
+# Backoff after a rate limit without Retry-After, doubled on each one in a row
+DEFAULT_BASE_DELAY = 1.0
+DEFAULT_MAX_DELAY = 60.0
+# How long a waiter sleeps before checking the queue again, when it is not first in line
+SYNC_POLL_INTERVAL = 1.0
+ASYNC_POLL_INTERVAL = 0.05
+
+
+def is_rate_limit(error) -> bool:
+    """
+    Whether an error is the provider refusing a call over its rate limit (HTTP 429).
+    """
+    status = getattr(error, "status_code", None)
+    if status is None:
+        status = getattr(getattr(error, "response", None), "status_code", None)
+    return status == 429 or type(error).__name__ == "RateLimitError"
+
+
+def retry_after(error):
+    """
+    Get the seconds to wait from the Retry-After headers of a rate limit error, or None.
+    """
+    headers = getattr(getattr(error, "response", None), "headers", None)
+    if not headers:
+        return None
+    try:
+        if headers.get("retry-after-ms"):
+            return float(headers["retry-after-ms"]) / 1000
+        value = headers.get("retry-after")
+        if not value:
+            return None
+        try:
+            return float(value)
+        except ValueError:
+            return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class TokenBucket:
+    """
+    A budget of units per minute, refilled continuously. It holds at most
+    burst_seconds worth of units, as providers check their limits over short
+    windows rather than a whole minute.
+    """
+
+    def __init__(self, per_minute, burst_seconds=DEFAULT_BURST_SECONDS):
+        self.rate = per_minute / 60.0
+        self.capacity = max(1.0, self.rate * burst_seconds)
+        self.level = self.capacity
+        self.updated = time.monotonic()
+
+    def wait_time(self, amount, now) -> float:
+        """
+        Seconds until amount units are available, 0 if they are now.
+        """
+        self._refill(now)
+        amount = min(amount, self.capacity)
+        if self.level >= amount:
+            return 0.0
+        return (amount - self.level) / self.rate
+
+    def take(self, amount, now) -> None:
+        self._refill(now)
+        self.level -= min(amount, self.capacity)
+
+    def adjust(self, amount) -> None:
+        """
+        Give back (or take, when negative) units once the real usage is known.
+        """
+        self.level = min(self.capacity, self.level + amount)
+
+    def _refill(self, now):
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+
+class _Lane:
+    """
+    The queue and the rate limits of one model deployment.
+    """
+
+    def __init__(self, tokens_per_minute, requests_per_minute):
+        self.tokens = TokenBucket(tokens_per_minute) if tokens_per_minute else None
+        self.requests = TokenBucket(requests_per_minute) if requests_per_minute else None
+        # heap of (priority, sequence) tickets
+        self.queue = []
+        # every call waits while the deployment is backing off from a rate limit
+        self.paused_until = 0.0
+        # rate limits in a row, for the exponential backoff
+        self.failures = 0
+
+
+class ModelScheduler:
+    """
+    Schedules the model calls of every agent in the process.
+
+    Calls wait in one queue per model deployment, ordered by priority class and
+    then by arrival, and start only when the deployment's token-per-minute and
+    request-per-minute budgets have room for them. Token use is estimated
+    before the call and corrected with the usage the model reports. When the
+    provider still answers with a rate limit, the whole deployment pauses for
+    Retry-After, or an exponential backoff, and the call is retried in its
+    place in the queue, so agents do not all retry at once.
+    """
+
+    def __init__(
+        self,
+        tokens_per_minute=None,
+        requests_per_minute=None,
+        max_retries=DEFAULT_MAX_RETRIES,
+        base_delay=DEFAULT_BASE_DELAY,
+        max_delay=DEFAULT_MAX_DELAY,
+    ):
+        """
+        Initialize the scheduler.
+        Args:
+            tokens_per_minute: The token budget of each deployment. (optional, no limit)
+            requests_per_minute: The request budget of each deployment. (optional, no limit)
+            max_retries: How many times a rate limited call is retried.
+            base_delay: The first backoff after a rate limit without Retry-After, in seconds.
+            max_delay: The longest backoff, in seconds.
+        """
+        self.tokens_per_minute = tokens_per_minute
+        self.requests_per_minute = requests_per_minute
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+        self._condition = threading.Condition()
+        self._sequence = itertools.count()
+        # deployment -> _Lane
+        self._lanes = {}
+        # id(model) -> (model, tokens of its tool schemas)
+        self._schema_tokens = {}
+
+        # priority -> [calls started, seconds queued]
+        self._queued = {priority: [0, 0.0] for priority in PRIORITY_NAMES}
+        self.rate_limited = 0
+
+    def invoke(self, model, messages, priority=INTERACTIVE):
+        """
+        Call model.invoke(messages) once the rate limits allow it.
+        """
+        lane = self._lane(model)
+        tokens = self.estimate_tokens(model, messages)
+        ticket = (priority, next(self._sequence))
+        for attempt in itertools.count():
+            self._acquire(lane, ticket, tokens)
+            try:
+                response = model.invoke(messages)
+            except Exception as e:
+                if attempt >= self.max_retries or not self._back_off(lane, e):
+                    raise
+                continue
+            self._completed(lane, tokens, response)
+            return response
+
+    async def ainvoke(self, model, messages, priority=INTERACTIVE):
+        """
+        Async version of invoke, waiting without blocking the event loop.
+        """
+        lane = self._lane(model)
+        tokens = self.estimate_tokens(model, messages)
+        ticket = (priority, next(self._sequence))
+        for attempt in itertools.count():
+            await self._aacquire(lane, ticket, tokens)
+            try:
+                response = await model.ainvoke(messages)
+            except Exception as e:
+                if attempt >= self.max_retries or not self._back_off(lane, e):
+                    raise
+                continue
+            self._completed(lane, tokens, response)
+            return response
+
+    def estimate_tokens(self, model, messages) -> int:
+        """
+        Estimate the tokens a call counts against the quota: the prompt, the tool
+        schemas and the answer, which the provider counts as max_tokens.
+        """
+        cached = self._schema_tokens.get(id(model))
+        if cached is None:
+            tools = getattr(model, "kwargs", {}).get("tools")
+            cached = (model, approximate_tokens(json.dumps(tools, default=str)) if tools else 0)
+            self._schema_tokens[id(model)] = cached
+
+        bound = getattr(model, "bound", model)
+        completion = getattr(bound, "max_tokens", None) or DEFAULT_COMPLETION_TOKENS
+        prompt = sum(approximate_tokens(_content(message)) for message in messages)
+        return prompt + cached[1] + completion
+
+    def stats(self) -> dict:
+        """
+        Get the calls and mean queue time of each priority class, the calls
+        waiting now and the rate limits hit.
+        """
+        with self._condition:
+            stats = {
+                name: {
+                    "calls": self._queued[priority][0],
+                    "mean_queue_seconds": (
+                        self._queued[priority][1] / self._queued[priority][0]
+                        if self._queued[priority][0]
+                        else None
+                    ),
+                }
+                for priority, name in PRIORITY_NAMES.items()
+            }
+            stats["waiting"] = sum(len(lane.queue) for lane in self._lanes.values())
+            stats["rate_limited"] = self.rate_limited
+            return stats
+
+    def _lane(self, model):
+        bound = getattr(model, "bound", model)
+        key = (
+            getattr(bound, "deployment_name", None)
+            or getattr(bound, "model_name", None)
+            or type(bound).__name__
+        )
+        with self._condition:
+            lane = self._lanes.get(key)
+            if lane is None:
+                lane = _Lane(self.tokens_per_minute, self.requests_per_minute)
+                self._lanes[key] = lane
+            return lane
+
+    def _try_start(self, lane, ticket, tokens):
+        """
+        Start the call of a ticket if it is first in line and the budgets allow it.
+        The caller holds the lock.
+        Returns:
+            0 when the call started, else the seconds to wait, or None if it is not first in line.
+        """
+        if lane.queue[0] != ticket:
+            return None
+        now = time.monotonic()
+        wait = lane.paused_until - now
+        if lane.requests is not None:
+            wait = max(wait, lane.requests.wait_time(1, now))
+        if lane.tokens is not None:
+            wait = max(wait, lane.tokens.wait_time(tokens, now))
+        if wait > 0:
+            return wait
+
+        heapq.heappop(lane.queue)
+        if lane.requests is not None:
+            lane.requests.take(1, now)
+        if lane.tokens is not None:
+            lane.tokens.take(tokens, now)
+        return 0
+
+    def _acquire(self, lane, ticket, tokens):
+        start = time.monotonic()
+        with self._condition:
+            heapq.heappush(lane.queue, ticket)
+            try:
+                while True:
+                    wait = self._try_start(lane, ticket, tokens)
+                    if wait == 0:
+                        break
+                    self._condition.wait(SYNC_POLL_INTERVAL if wait is None else wait)
+            except BaseException:
+                self._leave(lane, ticket)
+                raise
+            # the next call in line may be able to start now
+            self._condition.notify_all()
+        self._record_queue(ticket[0], time.monotonic() - start)
+
+    async def _aacquire(self, lane, ticket, tokens):
+        start = time.monotonic()
+        with self._condition:
+            heapq.heappush(lane.queue, ticket)
+        try:
+            while True:
+                with self._condition:
+                    wait = self._try_start(lane, ticket, tokens)
+                    if wait == 0:
+                        self._condition.notify_all()
+                        break
+                await asyncio.sleep(
+                    ASYNC_POLL_INTERVAL if wait is None else min(wait, ASYNC_POLL_INTERVAL * 10)
+                )
+        except BaseException:
+            # e.g. the request was cancelled while it waited
+            with self._condition:
+                self._leave(lane, ticket)
+            raise
+        self._record_queue(ticket[0], time.monotonic() - start)
+
+    def _leave(self, lane, ticket):
+        """
+        Take a ticket out of the queue, the caller holds the lock.
+        """
+        if ticket in lane.queue:
+            lane.queue.remove(ticket)
+            heapq.heapify(lane.queue)
+            self._condition.notify_all()
+
+    def _back_off(self, lane, error) -> bool:
+        """
+        Pause the deployment after a rate limit.
+        Returns:
+            Whether the error was a rate limit, and the call should be retried.
+        """
+        if not is_rate_limit(error):
+            return False
+        with self._condition:
+            delay = retry_after(error)
+            if delay is None:
+                delay = min(self.max_delay, self.base_delay * 2**lane.failures)
+                # spread the retries of the waiting calls
+                delay *= random.uniform(0.5, 1.0)
+            lane.failures += 1
+            lane.paused_until = max(lane.paused_until, time.monotonic() + delay)
+            self.rate_limited += 1
+        instrumentation.record_retry("rate_limit")
+        return True
+
+    def _completed(self, lane, tokens, response):
+        """
+        Correct the token budget with the usage the model reported.
+        """
+        usage = getattr(response, "usage_metadata", None)
+        with self._condition:
+            lane.failures = 0
+            if lane.tokens is not None and usage and usage.get("total_tokens"):
+                lane.tokens.adjust(tokens - usage["total_tokens"])
+
+    def _record_queue(self, priority, seconds):
+        with self._condition:
+            self._queued[priority][0] += 1
+            self._queued[priority][1] += seconds
+        if instrumentation.enabled():
+            instrumentation.metrics.observe(
+                "agent_model_queue_seconds", seconds, priority=PRIORITY_NAMES[priority]
+            )
+
+
+def _content(message):
+    if isinstance(message, dict):
+        return message.get("content", "")
+    return message.content
+
+
+_model_scheduler = None
+_model_scheduler_lock = threading.Lock()
+
+
+def get_model_scheduler():
+    """
+    Get the process-wide model scheduler, or None when neither AGENT_MODEL_TPM
+    nor AGENT_MODEL_RPM is set.
+    """
+    global _model_scheduler
+    tokens_per_minute = int(os.getenv("AGENT_MODEL_TPM", 0)) or None
+    requests_per_minute = int(os.getenv("AGENT_MODEL_RPM", 0)) or None
+    if tokens_per_minute is None and requests_per_minute is None:
+        return None
+    with _model_scheduler_lock:
+        if _model_scheduler is None:
+            _model_scheduler = ModelScheduler(
+                tokens_per_minute=tokens_per_minute,
+                requests_per_minute=requests_per_minute,
+                max_retries=int(os.getenv("AGENT_MODEL_MAX_RETRIES", DEFAULT_MAX_RETRIES)),
+            )
+        return _model_scheduler
@@ -0,0 +1,224 @@
+import hashlib
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from urllib.parse import quote
+
+# Default location and size cap of the generated page cache
+DEFAULT_CACHE_DIR = os.path.join("templates", "cache")
+DEFAULT_MAX_BYTES = 50 * 1024 * 1024
+
+PAGE_SUFFIX = ".html"
+# Age after which a partly written page is left over from a crashed process
+STALE_TMP_SECONDS = 600
+
+
+class PageCache:
+    """
+    On-disk cache for generated HTML pages with LRU eviction.
+
+    Pages are keyed by the UI path plus a hash of the prompt and tool set that
+    generated them, so changing either one produces a new page. Writes are
+    atomic, recency is kept in the file modification times so it survives a
+    restart, and the total size of the cache is capped at max_bytes. Several
+    processes can share the directory: reads go to disk, the ETag is the hash
+    of the content read, and invalidation removes the pages of every process.
+    The size accounting is per process though, each one only evicts the pages
+    it indexed, so the directory can grow past max_bytes until a restart
+    indexes it again.
+    """
+
+    def __init__(self, directory=DEFAULT_CACHE_DIR, max_bytes=DEFAULT_MAX_BYTES):
+        """
+        Initialize the cache and index the pages already on disk.
+        Args:
+            directory: The directory where the pages are stored.
+            max_bytes: The maximum total size of the cached pages.
+        """
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        # key -> size, least recently used first
+        self._index = OrderedDict()
+        self._size = 0
+
+        os.makedirs(self.directory, exist_ok=True)
+        self._load_index()
+
+    @staticmethod
+    def make_key(path, prompt, tools):
+        """
+        Build the cache key for a page.
+        Args:
+            path: The UI path of the page.
+            prompt: The prompt used to generate the page.
+            tools: The tools available while generating the page.
+        """
+        digest = hashlib.sha256(prompt.encode("utf-8"))
+        for tool in tools:
+            digest.update(b"\0" + getattr(tool, "name", str(tool)).encode("utf-8"))
+        return f"{_quote_path(path)}.{digest.hexdigest()[:16]}"
+
+    @staticmethod
+    def make_etag(content):
+        """
+        Build the ETag of a page.
+        """
+        return hashlib.sha256(content.encode("utf-8")).hexdigest()[:32]
+
+    def get(self, key):
+        """
+        Get a page from the cache. A page missing from the index is looked up
+        on disk, since another process, e.g. the warm-pages command, may have
+        written it.
+        Returns:
+            A (content, etag) tuple, or None if the page is not cached.
+        """
+        with self._lock:
+            try:
+                with open(self._file(key), "rb") as f:
+                    data = f.read()
+                # persist the recency so the LRU order survives a restart
+                os.utime(self._file(key))
+            except OSError:
+                self._forget(key)
+                return None
+
+            # the size may have changed if another process replaced the page
+            self._size += len(data) - self._index.get(key, 0)
+            self._index[key] = len(data)
+            self._index.move_to_end(key)
+            self._evict()
+
+        content = data.decode("utf-8")
+        # the ETag comes from the content read, so it changes with the page on disk
+        return content, self.make_etag(content)
+
+    def put(self, key, content):
+        """
+        Atomically write a page to the cache, evicting old pages if needed.
+        Returns:
+            The ETag of the page.
+        """
+        data = content.encode("utf-8")
+        etag = self.make_etag(content)
+
+        with self._lock:
+            fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+            try:
+                with os.fdopen(fd, "wb") as f:
+                    f.write(data)
+                os.replace(tmp_path, self._file(key))
+            except OSError:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+                raise
+
+            self._size += len(data) - self._index.get(key, 0)
+            self._index[key] = len(data)
+            self._index.move_to_end(key)
+            self._evict()
+
+        return etag
+
+    def invalidate(self, path=None):
+        """
+        Remove pages from the cache.
+        Args:
+            path: Only remove the pages for this UI path. (optional, default all)
+        Returns:
+            The number of pages removed.
+        """
+        prefix = None if path is None else _quote_path(path) + "."
+        with self._lock:
+            # list the directory, the pages may have been written by another process
+            keys = [
+                name[: -len(PAGE_SUFFIX)]
+                for name in os.listdir(self.directory)
+                if name.endswith(PAGE_SUFFIX) and (prefix is None or name.startswith(prefix))
+            ]
+            removed = 0
+            for key in keys:
+                removed += self._remove(key)
+            # forget the indexed pages another process removed meanwhile
+            for key in [key for key in self._index if prefix is None or key.startswith(prefix)]:
+                self._forget(key)
+        return removed
+
+    def _file(self, key):
+        return os.path.join(self.directory, key + PAGE_SUFFIX)
+
+    def _load_index(self):
+        """
+        Index the pages on disk, oldest first.
+        """
+        entries = []
+        for name in os.listdir(self.directory):
+            file_path = os.path.join(self.directory, name)
+            try:
+                if name.endswith(".tmp"):
+                    # left over from an interrupted write, unless another process is writing it now
+                    if time.time() - os.stat(file_path).st_mtime > STALE_TMP_SECONDS:
+                        os.remove(file_path)
+                elif name.endswith(PAGE_SUFFIX):
+                    stat = os.stat(file_path)
+                    entries.append((stat.st_mtime, name[: -len(PAGE_SUFFIX)], stat.st_size))
+            except FileNotFoundError:
+                # removed by another process meanwhile
+                continue
+
+        for _, key, size in sorted(entries):
+            self._index[key] = size
+            self._size += size
+        self._evict()
+
+    def _evict(self):
+        """
+        Remove the least recently used pages until the cache fits in max_bytes.
+        """
+        while self._size > self.max_bytes and len(self._index) > 1:
+            self._remove(next(iter(self._index)))
+
+    def _remove(self, key) -> bool:
+        """
+        Remove a page, returns whether its file was still on disk.
+        """
+        try:
+            os.remove(self._file(key))
+            removed = True
+        except FileNotFoundError:
+            removed = False
+        self._forget(key)
+        return removed
+
+    def _forget(self, key):
+        entry = self._index.pop(key, None)
+        if entry is not None:
+            self._size -= entry
+
+
+def _quote_path(path):
+    """
+    Turn a UI path into a file name safe prefix without any dots.
+    """
+    return quote(path.strip("/"), safe="").replace(".", "%2E")
+
+
+_page_cache = None
+_page_cache_lock = threading.Lock()
+
+
+def get_page_cache():
+    """
+    Get the process-wide page cache, configured from the environment.
+    """
+    global _page_cache
+    with _page_cache_lock:
+        if _page_cache is None:
+            _page_cache = PageCache(
+                directory=os.getenv("UI_PAGE_CACHE_DIR", DEFAULT_CACHE_DIR),
+                max_bytes=int(os.getenv("UI_PAGE_CACHE_MAX_BYTES", DEFAULT_MAX_BYTES)),
+            )
+        return _page_cache
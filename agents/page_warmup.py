@@ -0,0 +1,197 @@
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from . import instrumentation
+from .page_cache import get_page_cache
+from .single_flight import make_key
+
+# The UI pages generated ahead of their first visitor, and how many at once
+DEFAULT_PATHS = ("search", "create", "update", "delete")
+DEFAULT_WORKERS = 4
+
+# The file a process holds while it warms up the pages in the background, so
+# only one of the server's processes does it, and the age after which it is stale
+LOCK_FILE = "warmup.lock"
+LOCK_STALE_SECONDS = 1800
+
+# Results of a page warm-up
+CACHED = "cached"
+GENERATED = "generated"
+IN_FLIGHT = "in_flight"
+FAILED = "failed"
+
+
+class WarmupPage:
+    """
+    A page to generate ahead of time: its name, its page cache key and the
+    function that generates it, returning the HTML or None.
+    """
+
+    def __init__(self, name, cache_key, render):
+        self.name = name
+        self.cache_key = cache_key
+        self.render = render
+
+
+class PageWarmer:
+    """
+    Generates pages before anyone asks for them.
+
+    The pages are generated in parallel on a worker pool, and each one is
+    written to the page cache when it is complete, atomically replacing the
+    page that was served until then. Pages already cached are skipped unless
+    force is set. When flights is given, visitors that ask for a page while it
+    is generated wait on it instead of generating it again. The generation time
+    of each page is kept in results and, when instrumentation is on, in the
+    metrics.
+    """
+
+    def __init__(self, page_cache=None, flights=None, workers=DEFAULT_WORKERS):
+        """
+        Initialize the warmer.
+        Args:
+            page_cache: The cache the pages are written to. (optional, defaults to get_page_cache())
+            flights: The SingleFlight of the page requests, keyed with make_key(flights.name, name). (optional)
+            workers: How many pages are generated at once.
+        """
+        self.page_cache = page_cache or get_page_cache()
+        self.flights = flights
+        self.workers = workers
+
+        self._lock = threading.Lock()
+        self._thread = None
+        # name -> result of the latest warm-up of the page
+        self.results = {}
+
+    def warm(self, pages, force=False):
+        """
+        Generate the pages and wait for them.
+        Args:
+            pages: The WarmupPages to generate.
+            force: Regenerate the pages that are already cached.
+        Returns:
+            A result per page: its name, status, generation seconds and error.
+        """
+        pages = list(pages)
+        if not pages:
+            return []
+        with ThreadPoolExecutor(
+            max_workers=min(self.workers, len(pages)), thread_name_prefix="page-warmup"
+        ) as executor:
+            return list(executor.map(lambda page: self._warm_page(page, force), pages))
+
+    def start(self, pages, force=False):
+        """
+        Generate the pages in the background, e.g. when the server starts.
+        When several processes share the page cache, e.g. the workers of one
+        server, only the first one to start warms up the pages.
+        Returns:
+            The background thread, the one already running, or None if
+            another process is warming up the pages.
+        """
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return self._thread
+            if not self._claim():
+                return None
+            self._thread = threading.Thread(
+                target=self._warm_claimed, args=(list(pages), force), name="page-warmup", daemon=True
+            )
+            self._thread.start()
+            return self._thread
+
+    def _warm_claimed(self, pages, force):
+        try:
+            self.warm(pages, force)
+        finally:
+            try:
+                os.remove(self._lock_file())
+            except FileNotFoundError:
+                pass
+
+    def _lock_file(self):
+        return os.path.join(self.page_cache.directory, LOCK_FILE)
+
+    def _claim(self) -> bool:
+        """
+        Create the lock file, replacing it if a crashed process left it behind.
+        """
+        path = self._lock_file()
+        try:
+            if time.time() - os.stat(path).st_mtime > LOCK_STALE_SECONDS:
+                os.remove(path)
+        except FileNotFoundError:
+            pass
+        try:
+            os.close(os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+        except FileExistsError:
+            return False
+        return True
+
+    def _warm_page(self, page, force):
+        if not force and self.page_cache.get(page.cache_key) is not None:
+            return self._record(page, CACHED)
+
+        flight = None
+        if self.flights is not None:
+            flight_key = make_key(self.flights.name, page.name)
+            flight, leader = self.flights.join(flight_key)
+            if not leader:
+                # a visitor is generating the page already, it caches it itself
+                return self._record(page, IN_FLIGHT)
+
+        start = time.perf_counter()
+        html = None
+        try:
+            html = page.render()
+            if html is None:
+                return self._record(page, FAILED, time.perf_counter() - start, "no page generated")
+            self.page_cache.put(page.cache_key, html)
+        except Exception as e:
+            return self._record(page, FAILED, time.perf_counter() - start, str(e))
+        finally:
+            if flight is not None and html is not None:
+                self.flights.finish(flight_key, flight, html)
+            elif flight is not None:
+                # the waiting visitors generate the page themselves
+                self.flights.abandon(flight_key, flight)
+        return self._record(page, GENERATED, time.perf_counter() - start)
+
+    def _record(self, page, status, seconds=None, error=None):
+        result = {"page": page.name, "status": status, "seconds": seconds, "error": error}
+        with self._lock:
+            self.results[page.name] = result
+        if instrumentation.enabled():
+            instrumentation.metrics.increment("agent_page_warmup_total", status=status)
+            if seconds is not None:
+                instrumentation.metrics.observe("agent_page_warmup_seconds", seconds, page=page.name)
+        return result
+
+
+def warmup_paths():
+    """
+    Get the UI paths to warm up, a comma separated UI_WARMUP_PATHS list.
+    """
+    paths = os.getenv("UI_WARMUP_PATHS")
+    if paths is None:
+        return list(DEFAULT_PATHS)
+    return [path.strip().strip("/") for path in paths.split(",") if path.strip().strip("/")]
+
+
+def warmup_on_start() -> bool:
+    """
+    Whether the pages are warmed up when the server starts, set with UI_WARMUP_ON_START.
+    """
+    return os.getenv("UI_WARMUP_ON_START", "false").strip().lower() in ("1", "true", "yes", "on")
+
+
+def create_page_warmer(flights=None):
+    """
+    Create a PageWarmer, its worker count can be set with UI_WARMUP_WORKERS.
+    """
+    return PageWarmer(
+        flights=flights,
+        workers=int(os.getenv("UI_WARMUP_WORKERS", DEFAULT_WORKERS)),
+    )
@@ -0,0 +1,305 @@
+import asyncio
+import contextvars
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from concurrent.futures import TimeoutError as FutureTimeoutError
+
+from langchain_core.messages import ToolMessage
+from langchain_core.runnables.config import ContextThreadPoolExecutor, get_config_list
+from langgraph.prebuilt import ToolNode
+
+from . import instrumentation
+
+# The number of worker threads shared by all tool nodes
+DEFAULT_MAX_WORKERS = 8
+# The longest a tool call may take in seconds, including waiting for a free slot
+DEFAULT_TIMEOUT = 60
+
+# How deep the current code is nested in tool calls, e.g. 1 inside a tool that runs an agent
+_tool_depth = contextvars.ContextVar("agent_tool_depth", default=0)
+
+# nesting depth -> thread pool
+_executors = {}
+_executor_lock = threading.Lock()
+
+
+def get_tool_executor(depth=None):
+    """
+    Get the process-wide thread pool the tool calls run on, created on first use.
+    The tool calls of agents that run inside a tool get a pool of their own, one
+    per nesting depth, so they never wait on the workers their caller holds.
+    Args:
+        depth: The nesting depth, defaults to the depth of the current call.
+    """
+    if depth is None:
+        depth = _tool_depth.get()
+    with _executor_lock:
+        executor = _executors.get(depth)
+        if executor is None:
+            executor = ContextThreadPoolExecutor(
+                max_workers=int(os.getenv("AGENT_TOOL_WORKERS", DEFAULT_MAX_WORKERS)),
+                thread_name_prefix=f"agent-tool-{depth}" if depth else "agent-tool",
+            )
+            _executors[depth] = executor
+        return executor
+
+
+class ToolLimit:
+    """
+    The most concurrent calls of a tool, shared by the sync and async calls.
+
+    A call asks for a slot and gets a future that resolves once it may start,
+    so a waiting call holds neither a worker thread nor the event loop.
+    """
+
+    def __init__(self, limit):
+        self.limit = limit
+        self.active = 0
+        self._lock = threading.Lock()
+        self._waiting = deque()
+
+    def acquire(self) -> Future:
+        """
+        Ask for a slot. Cancelling the future before it resolves gives up the place in line,
+        once it has resolved the slot must be released.
+        """
+        slot = Future()
+        with self._lock:
+            granted = self.active < self.limit
+            if granted:
+                self.active += 1
+            else:
+                self._waiting.append(slot)
+        if granted:
+            slot.set_running_or_notify_cancel()
+            slot.set_result(None)
+        return slot
+
+    def release(self) -> None:
+        """
+        Give a slot back, handing it to the next call in line.
+        """
+        with self._lock:
+            while self._waiting:
+                slot = self._waiting.popleft()
+                # skips the calls that gave up waiting
+                if slot.set_running_or_notify_cancel():
+                    break
+            else:
+                slot = None
+                self.active -= 1
+        if slot is not None:
+            slot.set_result(None)
+
+
+class ParallelToolNode(ToolNode):
+    """
+    A tool node that runs the tool calls of one model turn concurrently.
+
+    The calls run on a bounded thread pool shared by all agents, also when the
+    graph runs async, and the calls of agents nested in a tool run on a pool of
+    their own. A tool can be limited to a number of concurrent calls and given
+    a timeout, with the constructor or with "max_concurrency" and "timeout" in
+    its metadata. Calls over the limit wait for a slot without taking a worker.
+    A call that times out returns an error message to the model. If it had
+    started, its thread is left to finish in the background and keeps its slot
+    until then, as it still uses what the limit protects.
+
+    It overrides internals of ToolNode (_func, _afunc, _parse_input, _run_one,
+    _arun_one and _combine_tool_outputs), so langgraph and langgraph-prebuilt
+    are pinned in requirements.txt to the versions it was tested with.
+    """
+
+    def __init__(self, tools, tool_limits=None, tool_timeouts=None, default_timeout=None):
+        """
+        Initialize the tool node.
+        Args:
+            tools: The tools to use.
+            tool_limits: The most concurrent calls per tool name. (optional)
+            tool_timeouts: The timeout in seconds per tool name. (optional)
+            default_timeout: The timeout of the other tools, defaults to AGENT_TOOL_TIMEOUT.
+        """
+        super().__init__(tools=tools)
+        if default_timeout is None:
+            default_timeout = float(os.getenv("AGENT_TOOL_TIMEOUT", DEFAULT_TIMEOUT))
+
+        self.default_timeout = default_timeout
+        self.limits = {}
+        self.timeouts = {}
+        for name, tool in self.tools_by_name.items():
+            metadata = tool.metadata or {}
+            limit = (tool_limits or {}).get(name, metadata.get("max_concurrency"))
+            if limit:
+                self.limits[name] = ToolLimit(limit)
+            self.timeouts[name] = (tool_timeouts or {}).get(
+                name, metadata.get("timeout", default_timeout)
+            )
+
+        self._stats_lock = threading.Lock()
+        self.turns = 0
+        self.tool_calls = 0
+        self.timed_out = 0
+        self.tool_seconds = 0.0
+        self.wall_seconds = 0.0
+
+    def _func(self, input, config, *, store):
+        tool_calls, input_type = self._parse_input(input, store)
+        config_list = get_config_list(config, len(tool_calls))
+
+        start = time.perf_counter()
+        futures = [
+            self._submit(call, input_type, call_config)
+            for call, call_config in zip(tool_calls, config_list)
+        ]
+        results = []
+        for call, future in zip(tool_calls, futures):
+            remaining = start + self.timeout_for(call["name"]) - time.perf_counter()
+            try:
+                results.append(future.result(timeout=max(remaining, 0)))
+            except FutureTimeoutError:
+                # only stops a call that is still waiting to start
+                future.cancel()
+                results.append((self._timeout_message(call), 0.0))
+
+        self._record(results, time.perf_counter() - start)
+        return self._combine_tool_outputs([output for output, _ in results], input_type)
+
+    async def _afunc(self, input, config, *, store):
+        tool_calls, input_type = self._parse_input(input, store)
+        config_list = get_config_list(config, len(tool_calls))
+
+        async def run(call, call_config):
+            tool = self.tools_by_name.get(call["name"])
+            if tool is not None and getattr(tool, "func", None) is None:
+                # a tool with only a coroutine runs on the event loop
+                coroutine = self._arun_limited(call, input_type, call_config)
+            else:
+                coroutine = asyncio.wrap_future(self._submit(call, input_type, call_config))
+            try:
+                return await asyncio.wait_for(coroutine, self.timeout_for(call["name"]))
+            except asyncio.TimeoutError:
+                return self._timeout_message(call), 0.0
+
+        start = time.perf_counter()
+        results = await asyncio.gather(
+            *(run(call, call_config) for call, call_config in zip(tool_calls, config_list))
+        )
+
+        self._record(results, time.perf_counter() - start)
+        return self._combine_tool_outputs([output for output, _ in results], input_type)
+
+    def timeout_for(self, name):
+        """
+        Get the timeout of a tool in seconds.
+        """
+        return self.timeouts.get(name, self.default_timeout)
+
+    def stats(self) -> dict:
+        """
+        Get the tool call counts and the wall-clock time saved by running them concurrently.
+        """
+        with self._stats_lock:
+            return {
+                "turns": self.turns,
+                "tool_calls": self.tool_calls,
+                "timed_out": self.timed_out,
+                "tool_seconds": self.tool_seconds,
+                "wall_seconds": self.wall_seconds,
+                "saved_seconds": self.tool_seconds - self.wall_seconds,
+            }
+
+    def _submit(self, call, input_type, config) -> Future:
+        """
+        Run a tool call on the thread pool, once the tool has a free slot.
+        Returns:
+            A future of the tool message and the seconds the call took.
+        """
+        executor = get_tool_executor()
+        limit = self.limits.get(call["name"])
+        if limit is None:
+            return executor.submit(self._run_timed, call, input_type, config)
+
+        result = Future()
+
+        def finish(future):
+            limit.release()
+            if future.cancelled():
+                result.cancel()
+            elif future.exception() is not None:
+                result.set_exception(future.exception())
+            else:
+                result.set_result(future.result())
+
+        def start(slot):
+            # the call timed out while it waited for the slot
+            if not result.set_running_or_notify_cancel():
+                limit.release()
+                return
+            executor.submit(self._run_timed, call, input_type, config).add_done_callback(finish)
+
+        limit.acquire().add_done_callback(start)
+        return result
+
+    def _run_timed(self, call, input_type, config):
+        depth = _tool_depth.set(_tool_depth.get() + 1)
+        try:
+            start = time.perf_counter()
+            output = self._run_one(call, input_type, config)
+            return output, time.perf_counter() - start
+        finally:
+            _tool_depth.reset(depth)
+
+    async def _arun_limited(self, call, input_type, config):
+        """
+        Run a coroutine tool call once the tool has a free slot.
+        """
+        limit = self.limits.get(call["name"])
+        if limit is None:
+            return await self._arun_timed(call, input_type, config)
+
+        slot = limit.acquire()
+        try:
+            await asyncio.wrap_future(slot)
+        except asyncio.CancelledError:
+            # the slot may have been handed over just as the call was cancelled
+            if not slot.cancel():
+                limit.release()
+            raise
+        try:
+            return await self._arun_timed(call, input_type, config)
+        finally:
+            limit.release()
+
+    async def _arun_timed(self, call, input_type, config):
+        depth = _tool_depth.set(_tool_depth.get() + 1)
+        try:
+            start = time.perf_counter()
+            output = await self._arun_one(call, input_type, config)
+            return output, time.perf_counter() - start
+        finally:
+            _tool_depth.reset(depth)
+
+    def _timeout_message(self, call):
+        with self._stats_lock:
+            self.timed_out += 1
+        return ToolMessage(
+            content=f"Error: the tool '{call['name']}' timed out after {self.timeout_for(call['name'])} seconds.",
+            name=call["name"],
+            tool_call_id=call["id"],
+            status="error",
+        )
+
+    def _record(self, results, wall_seconds):
+        with self._stats_lock:
+            self.turns += 1
+            self.tool_calls += len(results)
+            tool_seconds = sum(seconds for _, seconds in results)
+            self.tool_seconds += tool_seconds
+            self.wall_seconds += wall_seconds
+        if instrumentation.enabled():
+            instrumentation.metrics.observe(
+                "agent_tool_parallel_saved_seconds", max(tool_seconds - wall_seconds, 0.0)
+            )
@@ -0,0 +1,338 @@
+import hashlib
+import json
+import math
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from array import array
+
+from langchain_core.messages import message_to_dict, messages_from_dict
+
+from . import instrumentation
+
+DEFAULT_CACHE_PATH = "response_cache.sqlite"
+# Default time to live of a cached response, in seconds
+DEFAULT_TTL = 3600
+# Default size budget of the cache, in bytes of stored responses
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+# Default cosine similarity a cached turn needs to be reused for a similar one
+DEFAULT_SIMILARITY = 0.97
+# The most recent cached turns compared by embedding on a miss
+SIMILARITY_CANDIDATES = 500
+
+
+def _normalise_message(message) -> dict:
+    """
+    The parts of a message that decide the model's answer, without ids.
+    """
+    normalised = {"type": message.type, "content": message.content}
+    if isinstance(normalised["content"], str):
+        normalised["content"] = " ".join(normalised["content"].split())
+    if getattr(message, "tool_calls", None):
+        normalised["tool_calls"] = [[call["name"], call["args"]] for call in message.tool_calls]
+    if getattr(message, "name", None):
+        normalised["name"] = message.name
+    return normalised
+
+
+def _hash(value) -> str:
+    return hashlib.sha256(
+        json.dumps(value, sort_keys=True, default=str).encode("utf-8")
+    ).hexdigest()
+
+
+def model_key(model) -> str:
+    """
+    Identify a model and the tools bound to it, for cache keys.
+    """
+    bound = getattr(model, "bound", model)
+    kwargs = getattr(model, "kwargs", {})
+    try:
+        params = bound._identifying_params
+    except Exception:
+        params = {"class": type(bound).__name__}
+    return _hash({"model": params, "bound": kwargs})
+
+
+def _text(message) -> str:
+    content = message.content
+    if isinstance(content, str):
+        return content
+    return json.dumps(content, sort_keys=True, default=str)
+
+
+def _cosine(first, second) -> float:
+    dot = sum(a * b for a, b in zip(first, second))
+    norm = math.sqrt(sum(a * a for a in first)) * math.sqrt(sum(b * b for b in second))
+    return dot / norm if norm else 0.0
+
+
+class ResponseCache:
+    """
+    A disk-backed cache of model responses, keyed by the messages sent.
+
+    The key is a hash of the normalised messages, without message and tool call
+    ids, and of the model with its bound tools, so the same turn of any thread
+    hits the cache. With an embeddings model, a miss falls back to the cached
+    turn whose last message is most similar, among the turns with exactly the
+    same earlier messages and a plain answer, without tool calls. Responses expire after ttl seconds, and the least
+    recently used are evicted when the stored responses pass max_bytes.
+    """
+
+    def __init__(
+        self,
+        path=DEFAULT_CACHE_PATH,
+        ttl=DEFAULT_TTL,
+        max_bytes=DEFAULT_MAX_BYTES,
+        embeddings=None,
+        similarity=DEFAULT_SIMILARITY,
+    ):
+        """
+        Initialize the cache.
+        Args:
+            path: The SQLite database file, ":memory:" for a cache that is not kept.
+            ttl: How long a response stays valid, in seconds.
+            max_bytes: The maximum total size of the stored responses.
+            embeddings: Optional langchain Embeddings model for similarity matches.
+            similarity: The cosine similarity a similarity match needs.
+        """
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.embeddings = embeddings
+        self.similarity = similarity
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.executescript(
+            """
+            PRAGMA journal_mode=WAL;
+            CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                prefix TEXT NOT NULL,
+                created REAL NOT NULL,
+                last_used REAL NOT NULL,
+                size INTEGER NOT NULL,
+                message TEXT NOT NULL,
+                embedding BLOB
+            );
+            CREATE INDEX IF NOT EXISTS responses_prefix ON responses (prefix, last_used);
+            CREATE INDEX IF NOT EXISTS responses_last_used ON responses (last_used);
+            """
+        )
+        self._size = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        # id(model) -> (model, key), the model is kept so its id stays valid
+        self._model_keys = {}
+
+        self.hits = 0
+        self.similar_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def make_keys(self, model, messages):
+        """
+        Build the cache keys of a model turn.
+        Returns:
+            The exact key, and the key of the earlier messages used for similarity matches.
+        """
+        cached = self._model_keys.get(id(model))
+        if cached is None:
+            cached = (model, model_key(model))
+            self._model_keys[id(model)] = cached
+
+        normalised = [_normalise_message(message) for message in messages]
+        prefix = _hash([cached[1], normalised[:-1]])
+        return _hash([prefix, normalised[-1:]]), prefix
+
+    def get(self, model, messages):
+        """
+        Get the cached response to messages, or None.
+        """
+        key, prefix = self.make_keys(model, messages)
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT message FROM responses WHERE key = ? AND created >= ?",
+                (key, now - self.ttl),
+            ).fetchone()
+            if row is not None:
+                self._conn.execute("UPDATE responses SET last_used = ? WHERE key = ?", (now, key))
+                self._conn.commit()
+                self.hits += 1
+                self._count("hit")
+                return self._load(row[0])
+
+        if self.embeddings is not None and messages:
+            message = self._similar(prefix, messages[-1], now)
+            if message is not None:
+                return message
+
+        with self._lock:
+            self.misses += 1
+        self._count("miss")
+        return None
+
+    def put(self, model, messages, response) -> None:
+        """
+        Cache the response to messages.
+        """
+        key, prefix = self.make_keys(model, messages)
+        stored = json.dumps(message_to_dict(response))
+        embedding = None
+        # tool calls carry the arguments of their own request, e.g. a document id,
+        # so only plain answers can be reused for a similar request
+        if self.embeddings is not None and messages and not getattr(response, "tool_calls", None):
+            embedding = array("f", self.embeddings.embed_query(_text(messages[-1]))).tobytes()
+        size = len(stored) + (len(embedding) if embedding else 0)
+
+        now = time.time()
+        with self._lock:
+            previous = self._conn.execute("SELECT size FROM responses WHERE key = ?", (key,)).fetchone()
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (key, prefix, now, now, size, stored, embedding),
+            )
+            self._size += size - (previous[0] if previous else 0)
+            self._evict(now)
+            self._conn.commit()
+
+    def clear(self) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM responses")
+            self._conn.commit()
+            self._size = 0
+
+    def stats(self) -> dict:
+        """
+        Get the hit rate and size of the cache.
+        """
+        with self._lock:
+            lookups = self.hits + self.similar_hits + self.misses
+            return {
+                "hits": self.hits,
+                "similar_hits": self.similar_hits,
+                "misses": self.misses,
+                "hit_rate": (self.hits + self.similar_hits) / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "bytes": self._size,
+            }
+
+    def _similar(self, prefix, message, now):
+        """
+        Find the cached turn with the same earlier messages and the most similar last message.
+        """
+        vector = self.embeddings.embed_query(_text(message))
+        with self._lock:
+            rows = self._conn.execute(
+                """
+                SELECT key, embedding, message FROM responses
+                WHERE prefix = ? AND created >= ? AND embedding IS NOT NULL
+                ORDER BY last_used DESC LIMIT ?
+                """,
+                (prefix, now - self.ttl, SIMILARITY_CANDIDATES),
+            ).fetchall()
+
+        best = None
+        best_score = self.similarity
+        for key, embedding, stored in rows:
+            score = _cosine(vector, array("f", embedding))
+            if score >= best_score:
+                best, best_score = (key, stored), score
+        if best is None:
+            return None
+        message = self._load(best[1])
+        if getattr(message, "tool_calls", None):
+            # stored before tool calls were left out of similarity matches
+            return None
+
+        with self._lock:
+            self._conn.execute("UPDATE responses SET last_used = ? WHERE key = ?", (now, best[0]))
+            self._conn.commit()
+            self.similar_hits += 1
+        self._count("similar_hit")
+        return message
+
+    def _load(self, stored):
+        """
+        Load a cached response, with new ids so it can be added to any thread.
+        """
+        message = messages_from_dict([json.loads(stored)])[0]
+        update = {"id": None}
+        if getattr(message, "tool_calls", None):
+            update["tool_calls"] = [
+                {**call, "id": f"call_{uuid.uuid4().hex[:24]}"} for call in message.tool_calls
+            ]
+        return message.model_copy(update=update)
+
+    def _evict(self, now):
+        """
+        Drop expired responses, then the least recently used while over max_bytes.
+        The caller holds the lock.
+        """
+        expired = self._conn.execute(
+            "SELECT COALESCE(SUM(size), 0), COUNT(*) FROM responses WHERE created < ?",
+            (now - self.ttl,),
+        ).fetchone()
+        if expired[1]:
+            self._conn.execute("DELETE FROM responses WHERE created < ?", (now - self.ttl,))
+            self._size -= expired[0]
+            self.evictions += expired[1]
+
+        while self._size > self.max_bytes:
+            rows = self._conn.execute(
+                "SELECT key, size FROM responses ORDER BY last_used LIMIT 100"
+            ).fetchall()
+            if not rows:
+                break
+            for key, size in rows:
+                if self._size <= self.max_bytes:
+                    break
+                self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self._size -= size
+                self.evictions += 1
+
+    @staticmethod
+    def _count(result):
+        if instrumentation.enabled():
+            instrumentation.metrics.increment("agent_response_cache_total", result=result)
+
+
+def _create_embeddings():
+    """
+    Create the embeddings model for similarity matches, if a deployment is configured.
+    """
+    deployment = os.getenv("AGENT_RESPONSE_CACHE_EMBEDDINGS_DEPLOYMENT")
+    if not deployment:
+        return None
+    from langchain_openai import AzureOpenAIEmbeddings
+
+    return AzureOpenAIEmbeddings(
+        azure_endpoint=os.getenv("AZURE_OPENAI_ENDPOINT"),
+        api_version=os.getenv("AZURE_OPENAI_API_VERSION"),
+        api_key=os.getenv("AZURE_OPENAI_KEY"),
+        azure_deployment=deployment,
+    )
+
+
+_response_cache = None
+_response_cache_lock = threading.Lock()
+
+
+def get_response_cache():
+    """
+    Get the process-wide response cache, or None when AGENT_RESPONSE_CACHE is off.
+    """
+    global _response_cache
+    if os.getenv("AGENT_RESPONSE_CACHE", "false").strip().lower() not in ("1", "true", "yes", "on"):
+        return None
+    with _response_cache_lock:
+        if _response_cache is None:
+            _response_cache = ResponseCache(
+                path=os.getenv("AGENT_RESPONSE_CACHE_PATH", DEFAULT_CACHE_PATH),
+                ttl=float(os.getenv("AGENT_RESPONSE_CACHE_TTL", DEFAULT_TTL)),
+                max_bytes=int(os.getenv("AGENT_RESPONSE_CACHE_MAX_BYTES", DEFAULT_MAX_BYTES)),
+                embeddings=_create_embeddings(),
+                similarity=float(os.getenv("AGENT_RESPONSE_CACHE_SIMILARITY", DEFAULT_SIMILARITY)),
+            )
+        return _response_cache
@@ -0,0 +1,186 @@
+import asyncio
+import os
+import threading
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager, contextmanager
+
+# The HTTP header that ties requests to a session
+SESSION_HEADER = "X-Session-Id"
+# Idle agents are dropped after this many seconds
+DEFAULT_IDLE_TIMEOUT = 600
+# The most sessions that keep idle agents
+DEFAULT_MAX_SESSIONS = 1000
+# The most idle agents kept for one session
+DEFAULT_MAX_PER_SESSION = 2
+
+
+class AgentPool:
+    """
+    A pool of warm agents, keyed by session.
+
+    An agent is checked out for one request at a time, so two requests never
+    run on the same thread at once. Returned agents keep their thread and
+    history, and the next request of the same session continues with them,
+    only sending its new messages. Requests without a session get a fresh
+    agent that is not kept.
+    """
+
+    def __init__(
+        self,
+        factory,
+        idle_timeout=DEFAULT_IDLE_TIMEOUT,
+        max_sessions=DEFAULT_MAX_SESSIONS,
+        max_per_session=DEFAULT_MAX_PER_SESSION,
+    ):
+        """
+        Initialize the pool.
+        Args:
+            factory: Function that creates a new agent.
+            idle_timeout: Seconds an idle agent is kept.
+            max_sessions: The most sessions with idle agents, the least recently used are dropped.
+            max_per_session: The most idle agents kept for one session.
+        """
+        self.factory = factory
+        self.idle_timeout = idle_timeout
+        self.max_sessions = max_sessions
+        self.max_per_session = max_per_session
+
+        self._lock = threading.Lock()
+        # session id -> [(agent, returned at)], least recently used session first
+        self._idle = OrderedDict()
+        self.created = 0
+        self.reused = 0
+        self.evicted = 0
+
+    def checkout(self, session_id=None):
+        """
+        Take an agent for a session, reusing an idle one if there is one.
+        """
+        with self._lock:
+            self._evict_idle()
+            agents = self._idle.get(session_id) if session_id else None
+            if agents:
+                agent, _ = agents.pop()
+                if not agents:
+                    del self._idle[session_id]
+                self.reused += 1
+                return agent
+            self.created += 1
+
+        return self.factory()
+
+    def checkin(self, session_id, agent) -> None:
+        """
+        Give an agent back after a request, keeping it for the session's next request.
+        """
+        dropped = []
+        with self._lock:
+            if not session_id:
+                dropped.append(agent)
+            else:
+                agents = self._idle.setdefault(session_id, [])
+                self._idle.move_to_end(session_id)
+                agents.append((agent, time.monotonic()))
+                while len(agents) > self.max_per_session:
+                    dropped.append(agents.pop(0)[0])
+                while len(self._idle) > self.max_sessions:
+                    _, oldest = self._idle.popitem(last=False)
+                    dropped.extend(agent for agent, _ in oldest)
+                    self.evicted += len(oldest)
+
+        self._discard(dropped)
+
+    def discard(self, agent) -> None:
+        """
+        Drop a checked out agent instead of returning it, e.g. after a failed request.
+        """
+        self._discard([agent])
+
+    @contextmanager
+    def session(self, session_id=None):
+        """
+        Check out an agent for the duration of a with block.
+        The agent is returned if the block succeeds and discarded if it fails.
+        """
+        agent = self.checkout(session_id)
+        try:
+            yield agent
+        except BaseException:
+            self.discard(agent)
+            raise
+        self.checkin(session_id, agent)
+
+    @asynccontextmanager
+    async def asession(self, session_id=None):
+        """
+        Async version of session. Checking out may create an agent and giving
+        it back may delete the threads of dropped agents, both run in a worker
+        thread so they don't block the event loop.
+        """
+        agent = await asyncio.to_thread(self.checkout, session_id)
+        try:
+            yield agent
+        except BaseException:
+            await asyncio.to_thread(self.discard, agent)
+            raise
+        await asyncio.to_thread(self.checkin, session_id, agent)
+
+    def evict_idle(self) -> int:
+        """
+        Drop the agents that were idle for longer than the idle timeout.
+        Returns:
+            The number of agents dropped.
+        """
+        with self._lock:
+            dropped = self._evict_idle()
+        self._discard(dropped)
+        return len(dropped)
+
+    def stats(self) -> dict:
+        """
+        Get the size of the pool and how often agents were reused.
+        """
+        with self._lock:
+            return {
+                "sessions": len(self._idle),
+                "idle_agents": sum(len(agents) for agents in self._idle.values()),
+                "created": self.created,
+                "reused": self.reused,
+                "evicted": self.evicted,
+            }
+
+    def _evict_idle(self):
+        """
+        Remove the expired agents from the pool, the caller holds the lock.
+        """
+        deadline = time.monotonic() - self.idle_timeout
+        dropped = []
+        for session_id in list(self._idle):
+            agents = self._idle[session_id]
+            expired = [agent for agent, returned in agents if returned < deadline]
+            if expired:
+                dropped.extend(expired)
+                agents[:] = [(agent, returned) for agent, returned in agents if returned >= deadline]
+                if not agents:
+                    del self._idle[session_id]
+        self.evicted += len(dropped)
+        return dropped
+
+    def _discard(self, agents):
+        # free the checkpoints of agents that will not be used again
+        for agent in agents:
+            agent.delete_thread()
+
+
+def create_agent_pool(factory):
+    """
+    Create an agent pool, configured from the environment.
+    Args:
+        factory: Function that creates a new agent.
+    """
+    return AgentPool(
+        factory,
+        idle_timeout=float(os.getenv("API_SESSION_IDLE_TIMEOUT", DEFAULT_IDLE_TIMEOUT)),
+        max_sessions=int(os.getenv("API_SESSION_MAX", DEFAULT_MAX_SESSIONS)),
+    )
@@ -0,0 +1,242 @@
+import asyncio
+import hashlib
+import json
+import os
+import threading
+import time
+
+from . import instrumentation
+
+# Default seconds a request waits on another identical request before running itself
+DEFAULT_TIMEOUT = 120
+
+
+def make_key(route, path, payload=None):
+    """
+    Build the key of a request: the route, the normalised path and a hash of the payload.
+    """
+    normalised = "/".join(part for part in str(path).lower().split("/") if part)
+    digest = hashlib.sha256(
+        json.dumps(payload, sort_keys=True, separators=(",", ":"), default=str).encode("utf-8")
+    ).hexdigest()
+    return (route, normalised, digest)
+
+
+class Flight:
+    """
+    One in-flight run, that other callers with the same key wait on.
+    """
+
+    def __init__(self, timeout):
+        self.started = time.monotonic()
+        self.timeout = timeout
+        self.result = None
+        self.error = None
+        # the leader stopped without a result, the waiting callers run the request themselves
+        self.abandoned = False
+        self._event = threading.Event()
+        self._lock = threading.Lock()
+        # (loop, future) of the callers waiting on an event loop
+        self._futures = []
+
+    @property
+    def expired(self) -> bool:
+        return time.monotonic() - self.started > self.timeout
+
+    def wait(self, timeout) -> bool:
+        """
+        Wait for the run to finish, returns False on timeout.
+        """
+        return self._event.wait(timeout)
+
+    async def async_wait(self, timeout) -> bool:
+        """
+        Wait for the run to finish without blocking the event loop, returns False on timeout.
+        """
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        with self._lock:
+            if self._event.is_set():
+                return True
+            self._futures.append((loop, future))
+        try:
+            await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            return False
+        return True
+
+    def resolve(self, result=None, error=None, abandoned=False) -> None:
+        with self._lock:
+            self.result = result
+            self.error = error
+            self.abandoned = abandoned
+            self._event.set()
+            futures, self._futures = self._futures, []
+        for loop, future in futures:
+            loop.call_soon_threadsafe(_set_done, future)
+
+
+def _set_done(future):
+    if not future.done():
+        future.set_result(True)
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent identical requests.
+
+    The first caller of a key runs it, and callers with the same key that come
+    while it runs wait and share its result, or its error, instead of starting
+    their own run. A caller that waits longer than the timeout runs the request
+    itself, and a run older than the timeout no longer takes new waiters.
+    """
+
+    def __init__(self, name, timeout=DEFAULT_TIMEOUT):
+        """
+        Initialize the coalescer.
+        Args:
+            name: The name of the coalesced requests, in the metrics.
+            timeout: How long callers wait on a run, in seconds.
+        """
+        self.name = name
+        self.timeout = timeout
+
+        self._lock = threading.Lock()
+        # key -> Flight
+        self._flights = {}
+        self.runs = 0
+        self.shared = 0
+        self.timeouts = 0
+
+    def join(self, key, timeout=None):
+        """
+        Join the run of a key, starting it if there is none.
+        Args:
+            key: The key of the request, see make_key.
+            timeout: How long to wait on the run. (optional, defaults to self.timeout)
+        Returns:
+            The flight, and whether the caller leads it. The leader must call
+            finish, the others wait on the flight.
+        """
+        with self._lock:
+            flight = self._flights.get(key)
+            if flight is not None and not flight.expired:
+                return flight, False
+            flight = Flight(self.timeout if timeout is None else timeout)
+            self._flights[key] = flight
+            self.runs += 1
+        return flight, True
+
+    def finish(self, key, flight, result=None, error=None) -> None:
+        """
+        End the run of a key, passing its result or error to the callers waiting on it.
+        """
+        with self._lock:
+            if self._flights.get(key) is flight:
+                del self._flights[key]
+        flight.resolve(result, error)
+        # counted once the waiting callers are released
+        self._count("run")
+
+    def abandon(self, key, flight) -> None:
+        """
+        End the run of a key without a result, e.g. when it was cancelled.
+        The callers waiting on it run the request themselves.
+        """
+        with self._lock:
+            if self._flights.get(key) is flight:
+                del self._flights[key]
+        flight.resolve(abandoned=True)
+        self._count("run")
+
+    def shared_result(self, flight, done):
+        """
+        Count a wait on a flight, and get the result it shared.
+        Returns:
+            Whether the run finished in time with a result to share, and the result.
+            The run's error is raised.
+        """
+        if done and flight.abandoned:
+            self._count("abandoned")
+            return False, None
+        if not done:
+            with self._lock:
+                self.timeouts += 1
+            self._count("timeout")
+            return False, None
+        with self._lock:
+            self.shared += 1
+        self._count("shared")
+        if flight.error is not None:
+            raise flight.error
+        return True, flight.result
+
+    def do(self, key, function, timeout=None):
+        """
+        Run function for a key, or share the result of the run already in flight.
+        """
+        flight, leader = self.join(key, timeout)
+        if not leader:
+            done, result = self.shared_result(flight, flight.wait(flight.timeout))
+            if done:
+                return result
+            return function()
+
+        try:
+            result = function()
+        except Exception as e:
+            self.finish(key, flight, error=e)
+            raise
+        except BaseException:
+            self.abandon(key, flight)
+            raise
+        self.finish(key, flight, result)
+        return result
+
+    async def ado(self, key, function, timeout=None):
+        """
+        Async version of do, function is a coroutine function.
+        """
+        flight, leader = self.join(key, timeout)
+        if not leader:
+            done, result = self.shared_result(flight, await flight.async_wait(flight.timeout))
+            if done:
+                return result
+            return await function()
+
+        try:
+            result = await function()
+        except Exception as e:
+            self.finish(key, flight, error=e)
+            raise
+        except BaseException:
+            # e.g. cancelled, the waiting callers run the request themselves
+            self.abandon(key, flight)
+            raise
+        self.finish(key, flight, result)
+        return result
+
+    def stats(self) -> dict:
+        """
+        Get the runs started, the runs saved by sharing a result, and the waits that timed out.
+        """
+        with self._lock:
+            return {
+                "runs": self.runs,
+                "saved": self.shared,
+                "timeouts": self.timeouts,
+                "in_flight": len(self._flights),
+            }
+
+    def _count(self, result):
+        if instrumentation.enabled():
+            instrumentation.metrics.increment(
+                "agent_single_flight_total", flight=self.name, result=result
+            )
+
+
+def create_single_flight(name, timeout=DEFAULT_TIMEOUT):
+    """
+    Create a SingleFlight, its timeout can be set with <NAME>_COALESCE_TIMEOUT, e.g. API_COALESCE_TIMEOUT.
+    """
+    return SingleFlight(name, timeout=float(os.getenv(f"{name.upper()}_COALESCE_TIMEOUT", timeout)))
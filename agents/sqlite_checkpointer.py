@@ -0,0 +1,172 @@
+import asyncio
+import sqlite3
+import time
+
+from langgraph.checkpoint.sqlite import SqliteSaver
+from langgraph.constants import INTERRUPT
+
+from . import instrumentation
+from .checkpointer import DEFAULT_KEEP_LAST, DEFAULT_THREAD_TTL
+
+# Run the expiry of old threads at most this often, in seconds
+EXPIRE_INTERVAL = 60
+
+
+class BoundedSqliteSaver(SqliteSaver):
+    """
+    A SQLite checkpointer that keeps the database small.
+
+    Only the last keep_last checkpoints of each thread are kept, with their
+    pending writes, and threads that were not used for ttl seconds are deleted,
+    except the ones paused at an interrupt, waiting for the user.
+    The async methods run the sync ones in a worker thread, so the same saver
+    works for the Flask and the ASGI app.
+    """
+
+    def __init__(self, conn, keep_last=DEFAULT_KEEP_LAST, ttl=DEFAULT_THREAD_TTL):
+        """
+        Initialize the checkpointer.
+        Args:
+            conn: The SQLite connection, opened with check_same_thread=False.
+            keep_last: The number of checkpoints kept per thread and namespace.
+            ttl: Seconds a thread is kept after its last use, None keeps it forever.
+        """
+        super().__init__(conn)
+        self.keep_last = max(1, keep_last)
+        self.ttl = ttl
+        self._last_expired = 0
+
+    @classmethod
+    def from_path(cls, path, keep_last=DEFAULT_KEEP_LAST, ttl=DEFAULT_THREAD_TTL):
+        """
+        Open the checkpoint database at a path, creating it if needed.
+        """
+        conn = sqlite3.connect(path, check_same_thread=False)
+        return cls(conn, keep_last=keep_last, ttl=ttl)
+
+    def setup(self) -> None:
+        if self.is_setup:
+            return
+        super().setup()
+        self.conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS thread_activity (
+                thread_id TEXT PRIMARY KEY,
+                last_used REAL NOT NULL
+            )
+            """
+        )
+        self.conn.execute(
+            "CREATE INDEX IF NOT EXISTS thread_activity_last_used ON thread_activity (last_used)"
+        )
+
+    def put(self, config, checkpoint, metadata, new_versions):
+        start = time.perf_counter()
+        saved = super().put(config, checkpoint, metadata, new_versions)
+
+        thread_id = str(config["configurable"]["thread_id"])
+        checkpoint_ns = config["configurable"]["checkpoint_ns"]
+        with self.cursor() as cur:
+            # checkpoint ids are time ordered
+            cur.execute(
+                """
+                SELECT checkpoint_id FROM checkpoints
+                WHERE thread_id = ? AND checkpoint_ns = ?
+                ORDER BY checkpoint_id DESC LIMIT -1 OFFSET ?
+                """,
+                (thread_id, checkpoint_ns, self.keep_last),
+            )
+            old = [(thread_id, checkpoint_ns, row[0]) for row in cur.fetchall()]
+            if old:
+                cur.executemany(
+                    "DELETE FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id = ?",
+                    old,
+                )
+                cur.executemany(
+                    "DELETE FROM writes WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id = ?",
+                    old,
+                )
+            self._touch(cur, thread_id)
+
+            if instrumentation.enabled():
+                cur.execute(
+                    """
+                    SELECT length(checkpoint) + length(metadata) FROM checkpoints
+                    WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id = ?
+                    """,
+                    (thread_id, checkpoint_ns, checkpoint["id"]),
+                )
+                row = cur.fetchone()
+                instrumentation.record_checkpoint(
+                    time.perf_counter() - start, row[0] if row else 0
+                )
+
+        self._expire()
+        return saved
+
+    def put_writes(self, config, writes, task_id, task_path=""):
+        super().put_writes(config, writes, task_id, task_path)
+        with self.cursor() as cur:
+            self._touch(cur, str(config["configurable"]["thread_id"]))
+
+    def delete_thread(self, thread_id):
+        super().delete_thread(thread_id)
+        with self.cursor() as cur:
+            cur.execute("DELETE FROM thread_activity WHERE thread_id = ?", (str(thread_id),))
+
+    async def aget_tuple(self, config):
+        return await asyncio.to_thread(self.get_tuple, config)
+
+    async def alist(self, config, *, filter=None, before=None, limit=None):
+        checkpoints = await asyncio.to_thread(
+            lambda: list(self.list(config, filter=filter, before=before, limit=limit))
+        )
+        for checkpoint in checkpoints:
+            yield checkpoint
+
+    async def aput(self, config, checkpoint, metadata, new_versions):
+        return await asyncio.to_thread(self.put, config, checkpoint, metadata, new_versions)
+
+    async def aput_writes(self, config, writes, task_id, task_path=""):
+        return await asyncio.to_thread(self.put_writes, config, writes, task_id, task_path)
+
+    async def adelete_thread(self, thread_id):
+        return await asyncio.to_thread(self.delete_thread, thread_id)
+
+    def _touch(self, cur, thread_id):
+        cur.execute(
+            "INSERT OR REPLACE INTO thread_activity (thread_id, last_used) VALUES (?, ?)",
+            (thread_id, time.time()),
+        )
+
+    def _expire(self):
+        """
+        Delete the threads that were not used within the ttl.
+        """
+        now = time.time()
+        if self.ttl is None or now - self._last_expired < EXPIRE_INTERVAL:
+            return
+        self._last_expired = now
+
+        with self.cursor() as cur:
+            # a thread is paused when its latest checkpoint has an interrupt write
+            cur.execute(
+                """
+                SELECT thread_id FROM thread_activity AS activity
+                WHERE last_used < ? AND NOT EXISTS (
+                    SELECT 1 FROM writes
+                    WHERE writes.thread_id = activity.thread_id AND writes.channel = ?
+                    AND writes.checkpoint_id = (
+                        SELECT MAX(checkpoint_id) FROM checkpoints
+                        WHERE checkpoints.thread_id = writes.thread_id
+                        AND checkpoints.checkpoint_ns = writes.checkpoint_ns
+                    )
+                )
+                """,
+                (now - self.ttl, INTERRUPT),
+            )
+            expired = cur.fetchall()
+            if expired:
+                cur.executemany("DELETE FROM checkpoints WHERE thread_id = ?", expired)
+                cur.executemany("DELETE FROM writes WHERE thread_id = ?", expired)
+                cur.executemany("DELETE FROM thread_activity WHERE thread_id = ?", expired)
@@ -1,42 +1,183 @@
 import json
+import re
+from contextlib import aclosing
+
+from langchain_core.messages import AIMessage, ToolMessage
 
 from .agent import Agent
 
+# A markdown code fence around the JSON, like ```json ... ```
+_CODE_FENCE = re.compile(r"```(?:json)?\s*(.*?)\s*```", re.DOTALL)
+
+
+def extract_json(text, is_valid=None):
+    """
+    Find the JSON result in a model or tool response.
+    Accepts plain JSON, JSON in a markdown code fence, or JSON after some text.
+    Only a JSON object or array counts as a result, a bare string or number does not.
+    Args:
+        text: The response text.
+        is_valid: Optional check, the first object or array in the text that passes it
+            is returned, e.g. the one with the keys of a result schema.
+    Returns:
+        The decoded value, or None if the text holds no valid JSON object or array.
+    """
+    if not isinstance(text, str):
+        return None
+
+    for value in _json_candidates(text):
+        if isinstance(value, (dict, list)) and (is_valid is None or is_valid(value)):
+            return value
+    return None
+
+
+def _json_candidates(text):
+    """
+    Yield the JSON values found in a text, the code fenced ones first.
+    """
+    for fenced in _CODE_FENCE.finditer(text):
+        try:
+            yield json.loads(fenced.group(1))
+        except ValueError:
+            pass
+
+    try:
+        yield json.loads(text)
+        return
+    except ValueError:
+        pass
+
+    # fall back to each JSON object or array in the text
+    decoder = json.JSONDecoder()
+    end = 0
+    for start, char in enumerate(text):
+        if char in "{[" and start >= end:
+            try:
+                value, end = decoder.raw_decode(text, start)
+            except ValueError:
+                continue
+            yield value
+
 
 class WorkflowAgent(Agent):
     """
     Workflow agent.
     """
 
-    def __init__(self, model, tools, agent_prompt, messages=None):
+    def __init__(
+        self,
+        model,
+        tools,
+        agent_prompt,
+        messages=None,
+        result_schema=None,
+        passthrough_tools=None,
+        quiet=True,
+        context_manager=None,
+        response_cache=None,
+        prompt_variables=None,
+        scheduler=None,
+    ):
+        """
+        Initialize the workflow agent.
+        Args:
+            result_schema: Optional check for the result, either a list of keys the
+                result must have or a function that returns whether a result is valid.
+            passthrough_tools: Names of the tools whose result is returned as the
+                workflow result, without another model turn. Only list tools whose
+                result is final on its own. (optional, default none)
+            quiet: Do not print the events while the workflow runs, False prints
+                each event for debugging. (optional, default True)
+            context_manager: Optional ContextManager, for agents that are reused across runs.
+            response_cache: Optional ResponseCache for model turns.
+            prompt_variables: Optional per-request values for a static system prompt.
+            scheduler: Optional ModelScheduler for the model calls.
+        """
         super().__init__(
             model,
             tools,
             agent_prompt,
             messages,
+            context_manager=context_manager,
+            response_cache=response_cache,
+            prompt_variables=prompt_variables,
+            scheduler=scheduler,
         )
+        self.result_schema = result_schema
+        self.passthrough_tools = set(passthrough_tools or ())
+        self.quiet = quiet
 
     def run_workflow(self, data):
         """
         Run the workflow agent, tries to return a dictionary from JSON.
         """
         # Add the data to the messages
-        self.state['messages'].extend({"role": "user", "content": json.dumps(data)})
+        self.state["messages"].append({"role": "user", "content": json.dumps(data)})
 
-        for event in self.graph.stream(
-            self.state, config=self.thread_config, stream_mode="values"
-        ):
+        for event in self.stream_values(self.next_input()):
+            result = self.extract_result(event)
+            if result is not None:
+                return result
+
+        return None
+
+    async def arun_workflow(self, data):
+        """
+        Run the workflow agent asynchronously, tries to return a dictionary from JSON.
+        """
+        # Add the data to the messages
+        self.state["messages"].append({"role": "user", "content": json.dumps(data)})
+
+        # closed on return, so the run's trace is finished before the agent is reused
+        async with aclosing(self.astream_values(self.next_input())) as events:
+            async for event in events:
+                result = self.extract_result(event)
+                if result is not None:
+                    return result
+
+        return None
+
+    def extract_result(self, event):
+        """
+        Try to get the workflow result from an event, returns None if there is none yet.
+        The result is the JSON in the last message, either a final model answer or
+        the output of a passthrough tool.
+        """
+        if not self.quiet:
             print(event)
-            
-            try:
-                content = event["messages"][-1].content
 
-                content = json.loads(event["messages"][-1].content)
+        message = event["messages"][-1]
+
+        if isinstance(message, ToolMessage):
+            if message.name not in self.passthrough_tools:
+                return None
+            result = extract_json(message.content, self.is_valid_result)
+            if result is None and extract_json(message.content) is None:
+                # a passthrough tool returns its plain text result too
+                result = message.content
+        elif isinstance(message, AIMessage) and not message.tool_calls:
+            result = extract_json(message.content, self.is_valid_result)
+        else:
+            return None
 
-                if content != "" and content != "content":
-                    return content
+        if result is None or not self.is_valid_result(result):
+            return None
+        return result
 
-            except Exception as e:
-                pass
+    def is_valid_response(self, message) -> bool:
+        """
+        Check a model response, a final answer must hold a valid JSON result.
+        """
+        if message.tool_calls or message.invalid_tool_calls:
+            return super().is_valid_response(message)
+        return extract_json(message.content, self.is_valid_result) is not None
 
-        return None
\ No newline at end of file
+    def is_valid_result(self, result) -> bool:
+        """
+        Check a result against the result schema.
+        """
+        if self.result_schema is None:
+            return True
+        if callable(self.result_schema):
+            return bool(self.result_schema(result))
+        return isinstance(result, dict) and all(key in result for key in self.result_schema)
@@ -1,14 +1,25 @@
-from flask import Flask, request, jsonify
+import hmac
 import os
+
+import click
+from flask import Flask, Response, jsonify, make_response, request, stream_with_context
 from dotenv import load_dotenv
-from langchain_openai import AzureChatOpenAI
 
+from agents import instrumentation
+from agents.context_manager import ContextManager
+from agents.model_provider import get_agent_model
+from agents.session_pool import SESSION_HEADER, create_agent_pool
+from agents.single_flight import create_single_flight, make_key
 from agents.workflow_agent import WorkflowAgent
+from tools.api_dispatch import dispatch_api_request
 from tools.ai_search_tools import (
     search,
     delete_document,
     update_document,
     create_document,
+    delete_documents,
+    update_documents,
+    create_documents,
 )
 from tools.html_tools import (
     html_template,
@@ -18,6 +29,16 @@ from tools.html_tools import (
 )
 from agents.html_agent import (
     HTMLAgent,
+    generate_search_page,
+    search_page_key,
+)
+from agents.page_cache import get_page_cache
+from agents.page_warmup import (
+    FAILED,
+    WarmupPage,
+    create_page_warmer,
+    warmup_on_start,
+    warmup_paths,
 )
 
 # Create Flask app
@@ -26,27 +47,36 @@ app = Flask(__name__, static_folder="static", template_folder="templates")
 # Load environment variables from .env file
 load_dotenv()
 
-# Initialize the model
-model = AzureChatOpenAI(
-    azure_endpoint=os.getenv("AZURE_OPENAI_ENDPOINT"),
-    api_version=os.getenv("AZURE_OPENAI_API_VERSION"),
-    api_key=os.getenv("AZURE_OPENAI_KEY"),
-    deployment_name=os.getenv("AZURE_OPENAI_DEPLOYMENT_NAME"),
-    temperature=0,
-)
+# The tools available to the API and UI agents
+API_TOOLS = [
+    search,
+    delete_document,
+    update_document,
+    create_document,
+    delete_documents,
+    update_documents,
+    create_documents,
+]
 
-@app.route("/api/<path:path>", methods=["GET", "POST"])
-def api(path):
-    """API endpoint for various operations"""
-    data = request.json
+UI_TOOLS = [
+    html_template,
+    button,
+    search_bar,
+    javascript_list_to_html,
+]
 
-    api_agent_prompt = f"""
+
+# The system prompt of the API agent. It is the same for every request, so the
+# model provider can cache it, and the request itself is sent as a user message.
+API_AGENT_PROMPT = """
 You are a REST API implementation service. Follow these instructions precisely.
 
 STEP 1: IDENTIFY THE OPERATION TYPE
-The current API path is: ```{path}```
-The request data is: ```{data}```
-The request method is: ```{request.method}```
+Each request is a user message with a JSON object holding:
+- "path": the current API path
+- "data": the request data
+- "method": the request method
+Earlier messages are previous requests of the same session, only handle the latest request.
 
 First check if this is a standard operation:
 - If path equals "search" or contains words like "find", "get", "query": This is a SEARCH operation
@@ -60,8 +90,8 @@ For unanticipated URLs:
 - Consider URL structure, HTTP method, and data payload when determining intent
 - If the path seems like a custom endpoint (e.g., "/api/documents/latest", "/api/filter-by-category"), interpret what the user is trying to accomplish
 
-STEP 2: EXECUTE THE CORRECT TOOL
-Based on the operation identified, execute EXACTLY ONE of these tools:
+STEP 2: EXECUTE THE CORRECT TOOLS
+Based on the operation identified, use the matching tool below. A standard operation needs one call of its tool, an unanticipated URL may need several calls, for example a search and then a delete for each result:
 
 For SEARCH operations:
 - Use the **search** tool with "query" parameter from the data
@@ -82,41 +112,58 @@ For UPDATE operations:
 - Use the **update_document** tool with the document data
 - Example: update_document(document=data)
 
+For operations on many documents at once, e.g. a list of documents or ids in the data:
+- Use **create_documents**, **update_documents** or **delete_documents** with the whole list in one call
+- Example: delete_documents(ids=[document["id"] for document in data["documents"]])
+
 STEP 3: RETURN RESULTS
 Return ONLY the JSON result from the tool without any additional text or explanation.
 
-IMPORTANT: Feel free to use the tools in any order you see fit, but ensure that you only execute one tool at a time. If multiple tools are needed, run them sequentially and return the final result.
+IMPORTANT: Feel free to use the tools in any order you see fit. If several independent tool calls are needed, for example to search or delete multiple documents, make them together in one turn and they will run in parallel. Only call a tool after another one when it needs the other tool's result. Return the final result.
 """
 
-    # Initialize the workflow agent with a higher recursion limit
-    api_agent = WorkflowAgent(
-        model=model,
-        tools=[
-            search,
-            delete_document,
-            update_document,
-            create_document,
-        ],
-        agent_prompt=api_agent_prompt,
+
+def build_api_request(path, data, method):
+    """Build the user message of the API agent for a request"""
+    return {"path": path, "data": data, "method": method}
+
+
+def create_api_agent():
+    """Create an API agent, the pool keeps them warm per session"""
+    return WorkflowAgent(
+        model=get_agent_model(),
+        tools=API_TOOLS,
+        agent_prompt=API_AGENT_PROMPT,
+        # no passthrough tools, a custom path can chain tools, e.g. search then delete
+        context_manager=ContextManager(),
     )
 
-    # Pass path directly rather than as action to make it clearer
-    result = api_agent.run_workflow({})
 
-    return jsonify(result)
+api_agents = create_agent_pool(create_api_agent)
 
+# Concurrent identical requests share one agent run
+api_flights = create_single_flight("api", timeout=60)
+page_flights = create_single_flight("ui", timeout=120)
 
+# Words of the API paths that change documents, identical requests to them each run
+MUTATING_PATH_WORDS = ("create", "add", "new", "update", "change", "modify", "delete", "remove", "trash")
 
 
-@app.route("/ui/<path:path>", methods=["GET"])
-def user_interface(path):
-    """User interface for the application"""
+def can_coalesce(path, session_id):
+    """Whether identical concurrent API requests can share one run: read only, and not part of a session"""
+    if session_id is not None:
+        return False
+    path = path.lower()
+    return not any(word in path for word in MUTATING_PATH_WORDS)
+
 
-    ui_agent_prompt = f"""
+# The system prompt of the UI agent. It is the same for every page, so the model
+# provider can cache it, and the path is sent in a prompt variables message.
+UI_AGENT_PROMPT = """
 You are an amazing web developer that loves to use bootstrap. Your job is to create a front end for a create page. The create page is for a database of document.  Use bootstrap for styling, html, and vanilla javascript as much as possible. What you return should be a complete html page that can be rendered in a browser. Do not add any additional text or explanation.
 
 STEP 1: IDENTIFY THE OPERATION TYPE
-Use the path to identify the user intent. The current URL path is: ```{path}```
+Use the path to identify the user intent. The current URL path is the "path" variable of this request.
 
 First check if this is a standard operation:
 - If path equals "search" or contains words like "find", "get", "query": This is a SEARCH operation and you should create a SEARCH PAGE
@@ -138,26 +185,208 @@ For all of the different operations on the page, attach the correct API endpoint
 - If the button is for a update operation, use the something like 127.0.0.1:5000/api/update endpoint
 
 
-IMPORTANT: Feel free to use the tools in any order you see fit, but ensure that you only execute one tool at a time. If multiple tools are needed, run them sequentially and return the final result. Feel free to generate any additional HTML, CSS, or JavaScript code needed to create a complete web page.
+IMPORTANT: Feel free to use the tools in any order you see fit. If several independent tool calls are needed, for example to search or delete multiple documents, make them together in one turn and they will run in parallel. Only call a tool after another one when it needs the other tool's result. Return the final result. Feel free to generate any additional HTML, CSS, or JavaScript code needed to create a complete web page.
 """
-    # Initialize the workflow agent with a higher recursion limit
-    api_agent = HTMLAgent(
-        model=model,
-        tools=[
-            html_template,
-            button,
-            search_bar,
-            javascript_list_to_html,
-        ],
-        agent_prompt=ui_agent_prompt,
+
+
+def create_ui_agent(path):
+    """Create the HTML agent that generates the page of a UI path"""
+    return HTMLAgent(
+        model=get_agent_model(),
+        tools=UI_TOOLS,
+        agent_prompt=UI_AGENT_PROMPT,
+        prompt_variables={"path": path},
     )
 
-    # Pass path directly rather than as action to make it clearer
-    result = api_agent.render_html({})
 
-    return result
+def warmup_pages(paths=None):
+    """The pages generated ahead of their first visitor: the UI paths and the search tool's page"""
+    page_cache = get_page_cache()
+    pages = [
+        WarmupPage(
+            path,
+            page_cache.make_key(path, UI_AGENT_PROMPT, UI_TOOLS),
+            lambda path=path: create_ui_agent(path).render_html({}),
+        )
+        for path in (warmup_paths() if paths is None else paths)
+    ]
+    pages.append(WarmupPage("tool:search", search_page_key(), generate_search_page))
+    return pages
+
+
+page_warmer = create_page_warmer(flights=page_flights)
+
+
+@app.route("/api/<path:path>", methods=["GET", "POST"])
+def api(path):
+    """API endpoint for various operations"""
+    data = request.json
+
+    # Standard operations with well-formed payloads go straight to the tools
+    result = dispatch_api_request(path, data)
+    if result is not None:
+        return jsonify(result)
+
+    session_id = request.headers.get(SESSION_HEADER)
+    api_request = build_api_request(path, data, request.method)
+
+    def run_agent():
+        # Requests with a session header continue on that session's warm agent
+        with api_agents.session(session_id) as api_agent:
+            return api_agent.run_workflow(api_request)
+
+    if can_coalesce(path, session_id):
+        result = api_flights.do(make_key("api", path, api_request), run_agent)
+    else:
+        result = run_agent()
+
+    return jsonify(result)
+
+
+
+
+@app.route("/ui/<path:path>", methods=["GET"])
+def user_interface(path):
+    """User interface for the application"""
+
+    # Serve the page from the cache if it was already generated
+    page_cache = get_page_cache()
+    cache_key = page_cache.make_key(path, UI_AGENT_PROMPT, UI_TOOLS)
+    cached = page_cache.get(cache_key)
+
+    if cached is not None:
+        result, etag = cached
+        response = make_response(result)
+        response.set_etag(etag)
+        return response.make_conditional(request)
+
+    # If the same page is being generated for another request, wait for it
+    flight_key = make_key("ui", path)
+    flight, leader = page_flights.join(flight_key)
+    if not leader:
+        done, page = page_flights.shared_result(flight, flight.wait(flight.timeout))
+        if done:
+            response = make_response(page)
+            response.set_etag(page_cache.make_etag(page))
+            return response.make_conditional(request)
+
+    try:
+        api_agent = create_ui_agent(path)
+    except BaseException:
+        if leader:
+            page_flights.abandon(flight_key, flight)
+        raise
+
+    def generate():
+        # Flush the page to the browser as the model writes it
+        yield from api_agent.stream_html({})
+
+        # Cache the page once it is complete
+        if api_agent.page is not None:
+            page_cache.put(cache_key, api_agent.page)
+
+    response = Response(stream_with_context(generate()), mimetype="text/html")
+    if leader:
+        # Runs once the response is closed, also when the client left before the body was sent
+        response.call_on_close(lambda: resolve_page_flight(flight_key, flight, api_agent.page))
+    return response
+
+
+def resolve_page_flight(flight_key, flight, page):
+    """End the generation of a page, sharing it with the requests waiting on it"""
+    if page is not None:
+        page_flights.finish(flight_key, flight, page)
+    else:
+        # the waiting requests generate the page themselves
+        page_flights.abandon(flight_key, flight)
+
+
+# The header that carries UI_CACHE_ADMIN_TOKEN on the cache admin routes
+ADMIN_TOKEN_HEADER = "X-Admin-Token"
+
+
+def is_admin_request(headers):
+    """
+    Check the admin token of a request. The admin routes are off when
+    UI_CACHE_ADMIN_TOKEN is not set.
+    """
+    token = os.getenv("UI_CACHE_ADMIN_TOKEN")
+    given = headers.get(ADMIN_TOKEN_HEADER)
+    if not token or not given:
+        return False
+    return hmac.compare_digest(given.encode(), token.encode())
+
+
+@app.route("/ui-cache/invalidate", methods=["POST"])
+def invalidate_ui_cache():
+    """Remove generated pages from the UI cache, all of them or one path"""
+    # every removed page is generated again through the model, so only admins may do it
+    if not is_admin_request(request.headers):
+        return jsonify({"error": "Forbidden"}), 403
+
+    data = request.get_json(silent=True) or {}
+    removed = get_page_cache().invalidate(data.get("path"))
+
+    return jsonify({"removed": removed})
+
+
+@app.route("/metrics", methods=["GET"])
+def metrics():
+    """Agent metrics in the Prometheus text format, recorded when AGENT_METRICS is on"""
+    return Response(instrumentation.metrics.prometheus(), mimetype="text/plain; version=0.0.4")
+
+
+@app.route("/ui-cache/warmup", methods=["GET"])
+def ui_cache_warmup():
+    """Result of the latest warm-up of each page"""
+    return jsonify(page_warmer.results)
+
+
+@app.cli.command("warm-pages")
+@click.option("--force", is_flag=True, help="Regenerate the pages that are already cached.")
+@click.option("--workers", type=int, default=None, help="How many pages to generate at once.")
+@click.argument("paths", nargs=-1)
+def warm_pages(force, workers, paths):
+    """Generate the UI pages in parallel and swap them into the page cache"""
+    if workers is not None:
+        page_warmer.workers = workers
+
+    failed = 0
+    for result in page_warmer.warm(warmup_pages(paths or None), force=force):
+        seconds = "" if result["seconds"] is None else f" in {result['seconds']:.1f}s"
+        error = "" if result["error"] is None else f": {result['error']}"
+        click.echo(f"{result['page']}: {result['status']}{seconds}{error}")
+        failed += result["status"] == FAILED
+
+    if failed:
+        raise click.ClickException(f"{failed} page(s) failed to generate")
+
+
+@app.cli.command("invalidate-pages")
+@click.argument("path", required=False)
+def invalidate_pages(path):
+    """Remove generated pages from the UI cache, all of them or one path"""
+    removed = get_page_cache().invalidate(path)
+    click.echo(f"removed {removed} page(s)")
+
+
+def start_page_warmup():
+    """
+    Generate the pages in the background if UI_WARMUP_ON_START is on. Called by
+    the server entry points, not on import, so CLI commands such as warm-pages
+    don't start a warm-up of their own. Under a WSGI server call it from a
+    worker hook, e.g. gunicorn's post_worker_init. Only the first of the
+    server's processes warms up the pages, the others read them from the shared
+    page cache.
+    """
+    if warmup_on_start():
+        return page_warmer.start(warmup_pages())
+    return None
+
 
 if __name__ == "__main__":
+    start_page_warmup()
+
     # Run the Flask app in debug mode
     app.run(debug=True)
 
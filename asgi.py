@@ -0,0 +1,165 @@
+import asyncio
+
+from quart import Quart, Response, jsonify, make_response, request
+
+from agents import instrumentation
+from agents.page_cache import get_page_cache
+from agents.session_pool import SESSION_HEADER
+from agents.single_flight import make_key
+from app import (
+    UI_AGENT_PROMPT,
+    UI_TOOLS,
+    api_agents,
+    api_flights,
+    build_api_request,
+    can_coalesce,
+    create_ui_agent,
+    is_admin_request,
+    page_flights,
+    page_warmer,
+    resolve_page_flight,
+    start_page_warmup,
+)
+from tools.api_dispatch import dispatch_api_request
+
+# ASGI version of the Flask app in app.py. The agents run on the event loop
+# with ainvoke/astream, so a single process can hold many requests in flight
+# while they wait on the model. Serve it with any ASGI server, for example:
+#   hypercorn asgi:app
+app = Quart(__name__, static_folder="static", template_folder="templates")
+
+
+@app.before_serving
+async def warm_up_pages():
+    """Generate the UI pages in the background once the server starts, if UI_WARMUP_ON_START is on"""
+    start_page_warmup()
+
+
+@app.route("/api/<path:path>", methods=["GET", "POST"])
+async def api(path):
+    """API endpoint for various operations"""
+    data = await request.get_json()
+
+    # Standard operations with well-formed payloads go straight to the tools
+    result = await asyncio.to_thread(dispatch_api_request, path, data)
+    if result is not None:
+        return jsonify(result)
+
+    session_id = request.headers.get(SESSION_HEADER)
+    api_request = build_api_request(path, data, request.method)
+
+    async def run_agent():
+        # Requests with a session header continue on that session's warm agent
+        async with api_agents.asession(session_id) as api_agent:
+            return await api_agent.arun_workflow(api_request)
+
+    if can_coalesce(path, session_id):
+        result = await api_flights.ado(make_key("api", path, api_request), run_agent)
+    else:
+        result = await run_agent()
+
+    return jsonify(result)
+
+
+@app.route("/ui/<path:path>", methods=["GET"])
+async def user_interface(path):
+    """User interface for the application"""
+
+    # Serve the page from the cache if it was already generated
+    page_cache = get_page_cache()
+    cache_key = page_cache.make_key(path, UI_AGENT_PROMPT, UI_TOOLS)
+    cached = await asyncio.to_thread(page_cache.get, cache_key)
+
+    if cached is not None:
+        result, etag = cached
+        response = await make_response(result)
+        response.set_etag(etag)
+        return await response.make_conditional(request)
+
+    # If the same page is being generated for another request, wait for it
+    flight_key = make_key("ui", path)
+    flight, leader = page_flights.join(flight_key)
+    if not leader:
+        done, page = page_flights.shared_result(flight, await flight.async_wait(flight.timeout))
+        if done:
+            response = await make_response(page)
+            response.set_etag(page_cache.make_etag(page))
+            return await response.make_conditional(request)
+
+    try:
+        ui_agent = create_ui_agent(path)
+    except BaseException:
+        if leader:
+            page_flights.abandon(flight_key, flight)
+        raise
+
+    async def generate():
+        # Flush the page to the browser as the model writes it
+        async for text in ui_agent.astream_html({}):
+            yield text
+
+        # Cache the page once it is complete
+        if ui_agent.page is not None:
+            await asyncio.to_thread(page_cache.put, cache_key, ui_agent.page)
+
+    body = generate()
+    if leader:
+        body = ClosingStream(body, lambda: resolve_page_flight(flight_key, flight, ui_agent.page))
+    return Response(body, mimetype="text/html")
+
+
+class ClosingStream:
+    """
+    A streamed response body that calls on_close once the server closes it.
+    Unlike the finally block of an async generator, it also runs when the
+    client left before the body was iterated.
+    """
+
+    def __init__(self, stream, on_close):
+        self.stream = stream
+        self.on_close = on_close
+        self.closed = False
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        return await self.stream.__anext__()
+
+    async def aclose(self):
+        try:
+            await self.stream.aclose()
+        finally:
+            if not self.closed:
+                self.closed = True
+                self.on_close()
+
+
+@app.route("/ui-cache/invalidate", methods=["POST"])
+async def invalidate_ui_cache():
+    """Remove generated pages from the UI cache, all of them or one path"""
+    # every removed page is generated again through the model, so only admins may do it
+    if not is_admin_request(request.headers):
+        return jsonify({"error": "Forbidden"}), 403
+
+    data = await request.get_json(silent=True) or {}
+    removed = get_page_cache().invalidate(data.get("path"))
+
+    return jsonify({"removed": removed})
+
+
+@app.route("/metrics", methods=["GET"])
+async def metrics():
+    """Agent metrics in the Prometheus text format, recorded when AGENT_METRICS is on"""
+    return Response(instrumentation.metrics.prometheus(), mimetype="text/plain; version=0.0.4")
+
+
+@app.route("/ui-cache/warmup", methods=["GET"])
+async def ui_cache_warmup():
+    """Result of the latest warm-up of each page"""
+    return jsonify(page_warmer.results)
+
+
+if __name__ == "__main__":
+    # Run the ASGI app with Quart's built in hypercorn server
+    app.run(debug=True)
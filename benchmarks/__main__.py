@@ -0,0 +1,56 @@
+import argparse
+import json
+import sys
+
+from .runner import compare, format_report, run_scenario
+from .scenarios import SCENARIOS, prepare_environment
+
+
+def main(argv=None):
+    """
+    Run the benchmark scenarios and print a report.
+    """
+    parser = argparse.ArgumentParser(
+        prog="python -m benchmarks",
+        description="Offline benchmarks of the agents, with a scripted model and a local search index.",
+    )
+    parser.add_argument("scenarios", nargs="*", help=f"scenarios to run (default all): {', '.join(SCENARIOS)}")
+    parser.add_argument("--iterations", type=int, default=50, help="timed operations per scenario")
+    parser.add_argument("--warmup", type=int, default=3, help="untimed operations before timing")
+    parser.add_argument("--concurrency", type=int, default=None, help="operations in flight at once (default per scenario)")
+    parser.add_argument("--latency", type=float, default=0.05, help="simulated seconds per model call")
+    parser.add_argument("--token-latency", type=float, default=0.0, help="simulated seconds per streamed chunk")
+    parser.add_argument("--json", dest="json_path", help="write the reports as JSON to this file")
+    parser.add_argument("--baseline", help="compare against the JSON reports of an earlier run")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed slowdown against the baseline")
+    options = parser.parse_args(argv)
+
+    unknown = [name for name in options.scenarios if name not in SCENARIOS]
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(unknown)}")
+
+    prepare_environment()
+
+    reports = []
+    for name in options.scenarios or list(SCENARIOS):
+        report = run_scenario(SCENARIOS[name], options)
+        print(format_report(report), flush=True)
+        reports.append(report)
+
+    if options.json_path:
+        with open(options.json_path, "w", encoding="utf-8") as file:
+            json.dump(reports, file, indent=2)
+
+    if options.baseline:
+        with open(options.baseline, encoding="utf-8") as file:
+            baseline = json.load(file)
+        regressions = compare(reports, baseline, options.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,110 @@
+import argparse
+import os
+import subprocess
+import sys
+
+# The repository root, where the app modules are imported from
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Packages that are slow to import, only loaded when a model or search client is first used
+LAZY_MODULES = ("langchain_openai", "openai", "azure.search.documents", "bs4")
+
+# The frameworks main and app need at startup anyway, their import time is the baseline
+BASELINE_MODULES = ("dotenv", "flask", "langchain_core.messages", "langgraph.graph")
+
+# The most a startup module may take to import, as a multiple of the baseline, see import_budget_ms
+DEFAULT_BUDGET_RATIO = 2.0
+
+
+def measure_import(module) -> dict:
+    """
+    Import a module in a fresh interpreter with -X importtime.
+    Args:
+        module: The module to import, or several separated by commas.
+    Returns:
+        The import time of every module loaded, as (self, cumulative) microseconds by module name.
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True,
+        text=True,
+        cwd=ROOT,
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"Importing {module} failed: {result.stderr.strip().splitlines()[-1]}")
+
+    times = {}
+    for line in result.stderr.splitlines():
+        # import time: self [us] | cumulative | imported package
+        if not line.startswith("import time:"):
+            continue
+        parts = line[len("import time:") :].split("|")
+        if len(parts) != 3 or not parts[0].strip().isdigit():
+            continue
+        times[parts[2].strip()] = (int(parts[0]), int(parts[1]))
+    return times
+
+
+def lazy_modules_loaded(times) -> list:
+    """
+    Get the slow packages of LAZY_MODULES that were imported.
+    """
+    return [name for name in LAZY_MODULES if name in times]
+
+
+def total_ms(times) -> float:
+    """
+    Get the time spent importing all the modules of a measure_import result, in milliseconds.
+    """
+    return sum(own for own, _ in times.values()) / 1000
+
+
+def best_import_ms(module, repeat=2) -> float:
+    """
+    Get the fastest of a few imports of a module, in milliseconds.
+    """
+    return min(total_ms(measure_import(module)) for _ in range(repeat))
+
+
+def import_budget_ms(repeat=2) -> float:
+    """
+    Get the import time budget of main and app: the import time of BASELINE_MODULES,
+    measured on this machine, times IMPORT_TIME_BUDGET_RATIO (2 by default).
+    """
+    ratio = float(os.getenv("IMPORT_TIME_BUDGET_RATIO", DEFAULT_BUDGET_RATIO))
+    return ratio * best_import_ms(", ".join(BASELINE_MODULES), repeat)
+
+
+def main(argv=None):
+    """
+    Print the import time of modules and the slowest imports they load.
+    """
+    parser = argparse.ArgumentParser(
+        prog="python -m benchmarks.importtime",
+        description="Measure the import time of the app modules with python -X importtime.",
+    )
+    parser.add_argument("modules", nargs="*", default=["main", "app"], help="modules to import (default main app)")
+    parser.add_argument("--top", type=int, default=10, help="number of slowest imports to list")
+    options = parser.parse_args(argv)
+
+    budget = import_budget_ms()
+    print(f"budget: {budget:.1f}ms")
+    status = 0
+    for module in options.modules:
+        times = measure_import(module)
+        print(f"{module}: {total_ms(times):.1f}ms")
+        for name, (own, _) in sorted(times.items(), key=lambda item: item[1][0], reverse=True)[: options.top]:
+            print(f"  {own / 1000:8.1f}ms  {name}")
+
+        loaded = lazy_modules_loaded(times)
+        if loaded:
+            print(f"  imported at startup: {', '.join(loaded)}")
+            status = 1
+        if best_import_ms(module) > budget:
+            print(f"  over the {budget:.0f}ms budget")
+            status = 1
+    return status
+
+
+if __name__ == "__main__":
+    sys.exit(main())
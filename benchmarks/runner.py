@@ -0,0 +1,157 @@
+import asyncio
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+
+# Operations run under tracemalloc to measure memory, kept small since it slows them down
+MEMORY_ITERATIONS = 5
+
+
+def percentile(values, fraction):
+    """
+    Get a percentile of a list of values, with linear interpolation.
+    """
+    if not values:
+        return None
+    ordered = sorted(values)
+    position = (len(ordered) - 1) * fraction
+    lower = int(position)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (position - lower)
+
+
+def _timed(operation):
+    start = time.perf_counter()
+    try:
+        operation()
+    except Exception as e:
+        return time.perf_counter() - start, e
+    return time.perf_counter() - start, None
+
+
+async def _atimed(operation):
+    start = time.perf_counter()
+    try:
+        await operation()
+    except Exception as e:
+        return time.perf_counter() - start, e
+    return time.perf_counter() - start, None
+
+
+def _run_sync(operation, iterations, concurrency):
+    if concurrency <= 1:
+        return [_timed(operation) for _ in range(iterations)]
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        return list(executor.map(lambda _: _timed(operation), range(iterations)))
+
+
+async def _run_async(operation, iterations, concurrency):
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def limited():
+        async with semaphore:
+            return await _atimed(operation)
+
+    return await asyncio.gather(*(limited() for _ in range(iterations)))
+
+
+def _run(scenario, operation, iterations, concurrency):
+    if scenario.is_async:
+        return asyncio.run(_run_async(operation, iterations, concurrency))
+    return _run_sync(operation, iterations, concurrency)
+
+
+def run_scenario(scenario, options) -> dict:
+    """
+    Run a scenario and measure its latency, throughput and memory.
+    Returns:
+        The report, a dictionary with the timings in milliseconds.
+    """
+    concurrency = options.concurrency or scenario.concurrency
+    operation = scenario.build(options)
+    iterations, warmup = options.iterations, options.warmup
+    if scenario.max_iterations is not None:
+        iterations = min(iterations, scenario.max_iterations)
+        warmup = min(warmup, 1)
+
+    if warmup:
+        _run(scenario, operation, warmup, concurrency)
+
+    start = time.perf_counter()
+    results = _run(scenario, operation, iterations, concurrency)
+    wall = time.perf_counter() - start
+
+    # memory is measured in a separate, smaller pass
+    tracemalloc.start()
+    try:
+        _run(scenario, operation, min(iterations, MEMORY_ITERATIONS), concurrency)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    latencies = [seconds * 1000 for seconds, error in results if error is None]
+    errors = [repr(error) for _, error in results if error is not None]
+    return {
+        "scenario": scenario.name,
+        "iterations": iterations,
+        "concurrency": concurrency,
+        "model_latency_ms": options.latency * 1000,
+        "errors": len(errors),
+        "first_error": errors[0] if errors else None,
+        "p50_ms": percentile(latencies, 0.5),
+        "p95_ms": percentile(latencies, 0.95),
+        "p99_ms": percentile(latencies, 0.99),
+        "mean_ms": sum(latencies) / len(latencies) if latencies else None,
+        "max_ms": max(latencies) if latencies else None,
+        "throughput_per_s": len(latencies) / wall if wall else None,
+        "peak_memory_kb": peak / 1024,
+    }
+
+
+def format_report(report) -> str:
+    """
+    Format a report as one line of text.
+    """
+
+    def number(value, digits=2):
+        return "-" if value is None else f"{value:.{digits}f}"
+
+    line = (
+        f"{report['scenario']:<20} n={report['iterations']:<5} c={report['concurrency']:<4} "
+        f"p50={number(report['p50_ms'])}ms p95={number(report['p95_ms'])}ms "
+        f"p99={number(report['p99_ms'])}ms {number(report['throughput_per_s'], 1)}/s "
+        f"peak={number(report['peak_memory_kb'], 0)}KB"
+    )
+    if report["errors"]:
+        line += f" errors={report['errors']} ({report['first_error']})"
+    return line
+
+
+def compare(reports, baseline, tolerance) -> list:
+    """
+    Compare reports against the reports of an earlier run.
+    Returns:
+        A description of every scenario that got slower than the tolerance allows.
+    """
+    previous = {report["scenario"]: report for report in baseline}
+    regressions = []
+    for report in reports:
+        before = previous.get(report["scenario"])
+        if before is None:
+            continue
+        if report["errors"] and not before["errors"]:
+            regressions.append(f"{report['scenario']}: {report['errors']} errors")
+        if before["p95_ms"] and report["p95_ms"] and report["p95_ms"] > before["p95_ms"] * (1 + tolerance):
+            regressions.append(
+                f"{report['scenario']}: p95 {before['p95_ms']:.2f}ms -> {report['p95_ms']:.2f}ms"
+            )
+        if (
+            before["throughput_per_s"]
+            and report["throughput_per_s"] is not None
+            and report["throughput_per_s"] < before["throughput_per_s"] * (1 - tolerance)
+        ):
+            regressions.append(
+                f"{report['scenario']}: throughput {before['throughput_per_s']:.1f}/s -> "
+                f"{report['throughput_per_s']:.1f}/s"
+            )
+    return regressions
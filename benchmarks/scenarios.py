@@ -0,0 +1,467 @@
+import contextlib
+import io
+import itertools
+import os
+
+from .scripted_model import ScriptedChatModel, respond, tool_call
+
+# Words the seeded documents and the scripted searches are made of
+WORDS = (
+    "azure search index document agent graph model tool query vector cache "
+    "latency token stream page python flask batch schema field result"
+).split()
+
+# Dummy settings so the app modules can be imported without a real service
+DUMMY_ENVIRONMENT = {
+    "AZURE_OPENAI_ENDPOINT": "https://benchmark.invalid",
+    "AZURE_OPENAI_KEY": "benchmark",
+    "AZURE_OPENAI_DEPLOYMENT_NAME": "benchmark",
+    "AZURE_OPENAI_API_VERSION": "2024-06-01",
+    "AZURE_SEARCH_ENDPOINT": "https://benchmark.invalid",
+    "AZURE_SEARCH_INDEX": "documents",
+    "AZURE_SEARCH_KEY": "benchmark",
+}
+
+
+class Scenario:
+    """
+    A benchmark scenario.
+    """
+
+    def __init__(self, name, description, build, is_async=False, concurrency=1, max_iterations=None):
+        """
+        Initialize the scenario.
+        Args:
+            name: The name used on the command line.
+            description: One line about what is measured.
+            build: Function called with the options that returns the operation to time,
+                a function, or a coroutine function when is_async is set.
+            is_async: Whether the operation is a coroutine function.
+            concurrency: The default number of operations in flight at once.
+            max_iterations: The most operations timed and warmed up, for slow
+                baselines. (optional, defaults to the --iterations and --warmup options)
+        """
+        self.name = name
+        self.description = description
+        self.build = build
+        self.is_async = is_async
+        self.concurrency = concurrency
+        self.max_iterations = max_iterations
+
+
+def prepare_environment():
+    """
+    Point the agents at a seeded local search index, with no external services.
+    """
+    for name, value in DUMMY_ENVIRONMENT.items():
+        os.environ.setdefault(name, value)
+    os.environ["SEARCH_BACKEND"] = "local"
+
+    from tools.ai_search_tools import create_documents
+    from tools.search_backends import LocalSearchBackend, set_search_backend
+
+    set_search_backend(LocalSearchBackend(default_index="documents"))
+    documents = [
+        {
+            "id": str(number),
+            "title": " ".join(WORDS[(number + offset) % len(WORDS)] for offset in range(3)),
+            "content": " ".join(WORDS[(number * 7 + offset) % len(WORDS)] for offset in range(40)),
+        }
+        for number in range(500)
+    ]
+    create_documents.invoke({"documents": documents})
+
+
+def _queries():
+    return itertools.cycle([f"{first} {second}" for first in WORDS for second in WORDS[:5]])
+
+
+def _last_tool_content(messages):
+    for message in reversed(messages):
+        if message.type == "tool":
+            return message.content
+    return "[]"
+
+
+def _model(options, script):
+    return ScriptedChatModel(
+        script=script,
+        latency=options.latency,
+        token_latency=options.token_latency,
+    )
+
+
+def _search_script(queries):
+    # search, then answer with the search results as JSON
+    return [
+        lambda messages: respond(tool_calls=[tool_call("search", query=next(queries))]),
+        lambda messages: respond(content=_last_tool_content(messages)),
+    ]
+
+
+def _tool_set(count):
+    """
+    The first count of the repo's tools, 1, 4 (the API tools) or 10.
+    """
+    from tools import ask_for_instruction, report_progress
+    from tools.ai_search_tools import create_document, delete_document, search, update_document
+    from tools.html_tools import button, html_template, javascript_list_to_html, search_bar
+
+    tools = [
+        search,
+        delete_document,
+        update_document,
+        create_document,
+        html_template,
+        button,
+        search_bar,
+        javascript_list_to_html,
+        ask_for_instruction,
+        report_progress,
+    ]
+    return tools[:count]
+
+
+def build_graph_construction(count):
+    """
+    Construct an Agent, its graph and tool-bound model come from the process-wide cache.
+    """
+
+    def build(options):
+        from agents.agent import Agent
+        from agents.model_provider import create_model
+
+        # the Azure model, so binding converts the tool schemas like it does in the app
+        model = create_model()
+        tools = _tool_set(count)
+
+        def construct():
+            Agent(model, tools, "You are a benchmark agent.")
+
+        return construct
+
+    return build
+
+
+def build_graph_uncached(count):
+    """
+    Build and compile the graph and bind the tools for every agent, as before the cache.
+    """
+
+    def build(options):
+        from agents.graph_cache import build_graph, sorted_tools
+        from agents.model_provider import create_model
+
+        # the Azure model, so binding converts the tool schemas like it does in the app
+        model = create_model()
+        tools = _tool_set(count)
+
+        def construct():
+            build_graph(tools)
+            model.bind_tools(sorted_tools(tools), tool_choice="auto")
+
+        return construct
+
+    return build
+
+
+def build_cli(options):
+    from agents.command_line_agent import CommandLineAgent
+    from tools import ask_for_instruction, report_progress
+    from tools.ai_search_tools import search
+
+    queries = _queries()
+    script = [
+        respond(tool_calls=[tool_call("ask_for_instruction")]),
+        lambda messages: respond(
+            tool_calls=[
+                tool_call("report_progress", str="Searching the index"),
+                tool_call("search", query=next(queries)),
+            ]
+        ),
+        respond(content="Agent >> Here are the results."),
+        respond(tool_calls=[tool_call("ask_for_instruction")]),
+    ]
+    model = _model(options, script)
+    tools = [ask_for_instruction, report_progress, search]
+
+    def run_session():
+        agent = CommandLineAgent(model, tools, "You are a benchmark agent.")
+        answers = iter(["search the index", None])
+        agent.user_input_listener = lambda event: next(answers)
+        # the command line agent prints, keep the report readable
+        with contextlib.redirect_stdout(io.StringIO()):
+            agent.run()
+        agent.delete_thread()
+
+    return run_session
+
+
+def build_workflow(options):
+    from agents.workflow_agent import WorkflowAgent
+    from tools.ai_search_tools import search
+
+    model = _model(options, _search_script(_queries()))
+
+    def run_workflow():
+        agent = WorkflowAgent(model, [search], "Search and return JSON.", quiet=True, passthrough_tools=[])
+        agent.run_workflow({"query": "benchmark"})
+        agent.delete_thread()
+
+    return run_workflow
+
+
+def build_workflow_async(options):
+    from agents.workflow_agent import WorkflowAgent
+    from tools.ai_search_tools import search
+
+    model = _model(options, _search_script(_queries()))
+
+    async def run_workflow():
+        agent = WorkflowAgent(model, [search], "Search and return JSON.", quiet=True, passthrough_tools=[])
+        await agent.arun_workflow({"query": "benchmark"})
+        agent.delete_thread()
+
+    return run_workflow
+
+
+def build_workflow_tiered(options):
+    from agents.model_policy import ModelPolicy
+    from agents.workflow_agent import WorkflowAgent
+    from tools.ai_search_tools import search
+
+    queries = _queries()
+    answers = itertools.count()
+    # the small model is faster, and every fourth answer it writes is not JSON
+    small = ScriptedChatModel(
+        script=[
+            lambda messages: respond(tool_calls=[tool_call("search", query=next(queries))]),
+            lambda messages: respond(
+                content="Here are the results." if next(answers) % 4 == 3 else _last_tool_content(messages)
+            ),
+        ],
+        latency=options.latency / 4,
+        token_latency=options.token_latency,
+    )
+    policy = ModelPolicy(small, _model(options, _search_script(queries)))
+
+    def run_workflow():
+        agent = WorkflowAgent(policy, [search], "Search and return JSON.", quiet=True, passthrough_tools=[])
+        agent.run_workflow({"query": "benchmark"})
+        agent.delete_thread()
+
+    return run_workflow
+
+
+def _page(rows=400):
+    body = "\n".join(
+        f"<tr><td>{number}</td><td>{' '.join(WORDS[number % len(WORDS):][:4])}</td></tr>"
+        for number in range(rows)
+    )
+    return (
+        '<!DOCTYPE html>\n<html lang="en">\n<head><title>Search</title></head>\n'
+        f"<body>\n<table>\n{body}\n</table>\n</body>\n</html>"
+    )
+
+
+def build_html(options):
+    from agents.html_agent import HTMLAgent
+    from tools.html_tools import html_template
+
+    page = _page()
+    model = _model(
+        options,
+        [
+            respond(tool_calls=[tool_call("html_template", title="Search", body="", style="", script="")]),
+            respond(content=page),
+        ],
+    )
+
+    def stream_page():
+        agent = HTMLAgent(model, [html_template], "Write a page.")
+        for _ in agent.stream_html({}):
+            pass
+        if agent.page is None:
+            raise RuntimeError("No page was generated.")
+        agent.delete_thread()
+
+    return stream_page
+
+
+def _flask_client(options, script):
+    prepare_environment()
+    import app as flask_app
+    from agents.model_provider import set_model
+
+    # the API agents are created by the pool with the shared model
+    set_model(_model(options, script))
+    return flask_app.app.test_client()
+
+
+def build_api_dispatch(options):
+    client = _flask_client(options, [respond("{}")])
+    queries = _queries()
+
+    def post():
+        response = client.post("/api/search", json={"query": next(queries)})
+        if response.status_code != 200:
+            raise RuntimeError(f"Status {response.status_code}")
+
+    return post
+
+
+def build_api_agent(options):
+    client = _flask_client(options, _search_script(_queries()))
+    sessions = itertools.cycle([f"session-{number}" for number in range(8)])
+
+    def post():
+        response = client.post(
+            "/api/find-latest",
+            json={"topic": "benchmark"},
+            headers={"X-Session-Id": next(sessions)},
+        )
+        if response.status_code != 200 or response.get_json() is None:
+            raise RuntimeError(f"Status {response.status_code}")
+
+    return post
+
+
+def build_api_burst(options):
+    client = _flask_client(options, _search_script(_queries()))
+
+    def post():
+        # identical requests without a session, concurrent ones share one agent run
+        response = client.post("/api/find-latest", json={"topic": "burst"})
+        if response.status_code != 200 or response.get_json() is None:
+            raise RuntimeError(f"Status {response.status_code}")
+
+    return post
+
+
+def _beautifulsoup_check(content):
+    """
+    The page check HTMLAgent ran before HTMLPageDetector: a full BeautifulSoup parse of the text.
+    """
+    from bs4 import BeautifulSoup
+
+    soup = BeautifulSoup(content, "html.parser")
+    return bool(soup.find("html") and soup.find("body"))
+
+
+def build_html_detection(rows, chunk_size, baseline=False):
+    """
+    Check a page that grows chunk by chunk, with HTMLPageDetector or, for the
+    baseline, with a BeautifulSoup parse of the whole text at every chunk.
+    """
+
+    def build(options):
+        from agents.html_detector import HTMLPageDetector
+
+        page = _page(rows=rows)
+        chunks = [page[start : start + chunk_size] for start in range(0, len(page), chunk_size)]
+
+        def detect():
+            detector = HTMLPageDetector()
+            content = ""
+            detected = False
+            for chunk in chunks:
+                content += chunk
+                if baseline:
+                    detected = _beautifulsoup_check(content)
+                else:
+                    detected = detector.check(content, key="page")
+            if not detected:
+                raise RuntimeError("The page was not detected.")
+
+        return detect
+
+    return build
+
+
+def build_import(module):
+    def build(options):
+        from .importtime import lazy_modules_loaded, measure_import
+
+        def import_module():
+            loaded = lazy_modules_loaded(measure_import(module))
+            if loaded:
+                raise RuntimeError(f"{module} imports {', '.join(loaded)} at startup")
+
+        return import_module
+
+    return build
+
+
+SCENARIOS = {
+    scenario.name: scenario
+    for scenario in [
+        *[
+            scenario
+            for count in (1, 4, 10)
+            for scenario in (
+                Scenario(
+                    f"graph_construction_{count}",
+                    f"Construct an Agent with {count} tool(s), the graph is cached",
+                    build_graph_construction(count),
+                ),
+                Scenario(
+                    f"graph_uncached_{count}",
+                    f"Compile the graph and bind {count} tool(s) for every agent, the baseline",
+                    build_graph_uncached(count),
+                ),
+            )
+        ],
+        Scenario("cli", "Command line session: instruction, search, answer, exit", build_cli),
+        Scenario("workflow", "WorkflowAgent search returning JSON", build_workflow),
+        Scenario(
+            "workflow_async",
+            "WorkflowAgent search on the event loop, many in flight",
+            build_workflow_async,
+            is_async=True,
+            concurrency=50,
+        ),
+        Scenario(
+            "workflow_tiered",
+            "WorkflowAgent search with a small model, escalating invalid answers",
+            build_workflow_tiered,
+        ),
+        Scenario("html", "HTMLAgent streaming a generated page", build_html),
+        Scenario("api_dispatch", "POST /api/search served by the direct dispatch", build_api_dispatch),
+        Scenario("api_agent", "POST /api/<custom path> served by a session agent", build_api_agent),
+        Scenario(
+            "api_burst",
+            "Identical POST /api/<custom path> requests at once, coalesced into shared runs",
+            build_api_burst,
+            concurrency=20,
+        ),
+        Scenario(
+            "html_detection",
+            "Detect a streamed 440 KB page in 40 character chunks",
+            build_html_detection(8000, 40),
+        ),
+        Scenario(
+            "html_detection_440kb",
+            "Detect a 440 KB page checked every 40 KB, with HTMLPageDetector",
+            build_html_detection(8000, 40000),
+        ),
+        Scenario(
+            "html_detection_440kb_bs4",
+            "Detect a 440 KB page checked every 40 KB, parsing it with BeautifulSoup, the baseline",
+            build_html_detection(8000, 40000, baseline=True),
+            # a few seconds per operation
+            max_iterations=3,
+        ),
+        Scenario(
+            "html_detection_43kb",
+            "Detect a 43 KB page checked every 2 KB, with HTMLPageDetector",
+            build_html_detection(800, 2000),
+        ),
+        Scenario(
+            "html_detection_43kb_bs4",
+            "Detect a 43 KB page checked every 2 KB, parsing it with BeautifulSoup, the baseline",
+            build_html_detection(800, 2000, baseline=True),
+        ),
+        Scenario("import_cli", "Start the command line app: import main in a new interpreter", build_import("main")),
+        Scenario("import_app", "Boot a Flask worker: import app in a new interpreter", build_import("app")),
+    ]
+}
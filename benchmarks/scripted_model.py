@@ -0,0 +1,171 @@
+import asyncio
+import hashlib
+import json
+import threading
+import time
+import uuid
+from typing import Any, List
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, HumanMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from pydantic import PrivateAttr
+
+from agents.context_manager import approximate_tokens
+
+
+def tool_call(name, **args):
+    """
+    Build a scripted tool call.
+    """
+    return {"name": name, "args": args, "id": None}
+
+
+def respond(content="", tool_calls=None):
+    """
+    Build a scripted model turn, with text content and/or tool calls.
+    """
+    return AIMessage(content=content, tool_calls=tool_calls or [])
+
+
+class ScriptedChatModel(BaseChatModel):
+    """
+    A deterministic chat model that replays a script, for offline benchmarks.
+
+    The script is a list of turns. The turn played is the number of AI
+    messages since the last human message, so every conversation replays the
+    script from the start after each user message, and one model can be shared
+    by any number of agents and threads. A turn is an AIMessage or a function
+    of the messages that returns one. Past the end of the script the last turn
+    is repeated.
+
+    Each call sleeps for latency seconds, and streamed calls also sleep
+    token_latency seconds per chunk of chunk_size characters.
+
+    With prompt_cache, it reports prompt caching like a model provider: the
+    prompt tokens of the leading messages that an earlier call also started
+    with are counted as read from the cache.
+    """
+
+    script: List[Any]
+    latency: float = 0.0
+    token_latency: float = 0.0
+    chunk_size: int = 40
+    prompt_cache: bool = False
+
+    # hashes of the message prefixes sent so far, for prompt_cache
+    _prefixes: set = PrivateAttr(default_factory=set)
+    _prefixes_lock: Any = PrivateAttr(default_factory=threading.Lock)
+
+    @property
+    def _llm_type(self) -> str:
+        return "scripted"
+
+    def bind_tools(self, tools, **kwargs):
+        # the script decides which tools are called
+        return self
+
+    def next_turn(self, messages) -> AIMessage:
+        """
+        Get the scripted answer to a list of messages.
+        """
+        step = 0
+        for message in reversed(messages):
+            if isinstance(message, HumanMessage):
+                break
+            if isinstance(message, AIMessage):
+                step += 1
+
+        turn = self.script[min(step, len(self.script) - 1)]
+        if callable(turn):
+            turn = turn(messages)
+
+        tool_calls = [
+            {**call, "id": call.get("id") or f"call_{uuid.uuid4().hex[:12]}"}
+            for call in turn.tool_calls
+        ]
+        input_tokens = sum(approximate_tokens(message.content) for message in messages)
+        output_tokens = approximate_tokens(turn.content) + approximate_tokens(json.dumps(tool_calls))
+        usage = {
+            "input_tokens": input_tokens,
+            "output_tokens": output_tokens,
+            "total_tokens": input_tokens + output_tokens,
+        }
+        if self.prompt_cache:
+            usage["input_token_details"] = {"cache_read": self._cached_tokens(messages)}
+        return AIMessage(content=turn.content, tool_calls=tool_calls, usage_metadata=usage)
+
+    def _cached_tokens(self, messages) -> int:
+        """
+        Count the tokens of the leading messages an earlier call started with, and remember the prefixes.
+        """
+        digest = hashlib.sha256()
+        cached = tokens = 0
+        with self._prefixes_lock:
+            for message in messages:
+                digest.update(
+                    json.dumps(
+                        [message.type, message.content, getattr(message, "tool_calls", None)],
+                        default=str,
+                    ).encode()
+                )
+                tokens += approximate_tokens(message.content)
+                prefix = digest.copy().hexdigest()
+                if prefix in self._prefixes:
+                    cached = tokens
+                self._prefixes.add(prefix)
+        return cached
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs: Any) -> ChatResult:
+        time.sleep(self.latency)
+        return ChatResult(generations=[ChatGeneration(message=self.next_turn(messages))])
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs: Any) -> ChatResult:
+        await asyncio.sleep(self.latency)
+        return ChatResult(generations=[ChatGeneration(message=self.next_turn(messages))])
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs: Any):
+        time.sleep(self.latency)
+        for chunk in self._chunks(self.next_turn(messages)):
+            if self.token_latency:
+                time.sleep(self.token_latency)
+            if run_manager is not None and chunk.message.content:
+                run_manager.on_llm_new_token(chunk.message.content, chunk=chunk)
+            yield chunk
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs: Any):
+        await asyncio.sleep(self.latency)
+        for chunk in self._chunks(self.next_turn(messages)):
+            if self.token_latency:
+                await asyncio.sleep(self.token_latency)
+            if run_manager is not None and chunk.message.content:
+                await run_manager.on_llm_new_token(chunk.message.content, chunk=chunk)
+            yield chunk
+
+    def _chunks(self, message):
+        """
+        Split a message into stream chunks, the tool calls and usage come with the last one.
+        """
+        content = message.content
+        pieces = [
+            content[start : start + self.chunk_size]
+            for start in range(0, len(content), self.chunk_size)
+        ] or [""]
+
+        for piece in pieces[:-1]:
+            yield ChatGenerationChunk(message=AIMessageChunk(content=piece))
+        yield ChatGenerationChunk(
+            message=AIMessageChunk(
+                content=pieces[-1],
+                tool_call_chunks=[
+                    {
+                        "name": call["name"],
+                        "args": json.dumps(call["args"]),
+                        "id": call["id"],
+                        "index": index,
+                    }
+                    for index, call in enumerate(message.tool_calls)
+                ],
+                usage_metadata=message.usage_metadata,
+            )
+        )
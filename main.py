@@ -1,26 +1,19 @@
-import os
-
 from dotenv import load_dotenv
-from langchain_openai import AzureChatOpenAI
 
 from agents.command_line_agent import CommandLineAgent
+from agents.context_manager import ContextManager
+from agents.model_provider import get_agent_model, get_model
 from agents.workflow_agent import WorkflowAgent
 from tools import ask_for_instruction, report_progress
 from tools.ai_search_tools import (create_document, delete_document, search,
                                    update_document, list_indexes, create_index,
-                                   delete_index, describe_index_schema)
+                                   delete_index, describe_index_schema,
+                                   create_documents, update_documents,
+                                   delete_documents)
 
 # Load environment variables from .env file
 load_dotenv()
 
-# Initialize the AzureChatOpenAI model
-model = AzureChatOpenAI(
-    azure_endpoint=os.getenv("AZURE_OPENAI_ENDPOINT"),
-    api_version=os.getenv("AZURE_OPENAI_API_VERSION"),
-    api_key=os.getenv("AZURE_OPENAI_KEY"),
-    deployment_name=os.getenv("AZURE_OPENAI_DEPLOYMENT_NAME"),
-    temperature=0,
-)
 
 def command_line_agent():
     agent_prompt = """
@@ -42,6 +35,7 @@ Tools:
 - For deleting documents when the ID is unknown, first perform a search, then use **delete_document** on the located document.
 - When creating a document, leverage **create_document** with details provided by the user.
 - To update a document, first search for it, then apply changes using **update_document** following further clarification via **ask_for_instruction**.
+- When creating, updating or deleting many documents, use **create_documents**, **update_documents** or **delete_documents** with all of them in one call.
 - For listing all indexes, use **list_indexes** to display existing indexes.
 - For creating a new index, use **create_index** with the necessary fields.
 - For deleting an index, confirm the index name and use **delete_index** to remove it.
@@ -56,18 +50,23 @@ Take as much time as you need and ask for help if you need it. Always communicat
     """
 
     # Initialize the agent
-    agent = CommandLineAgent(model=model, tools=[ 
+    agent = CommandLineAgent(model=get_agent_model(), tools=[ 
             ask_for_instruction,
             report_progress,
             search,
             delete_document,
             create_document,
             update_document,
+            create_documents,
+            update_documents,
+            delete_documents,
             list_indexes,
             create_index,
             delete_index,
             describe_index_schema,
         ], agent_prompt=agent_prompt,
+        # keep long sessions within a token budget, summarising old turns
+        context_manager=ContextManager(summarizer=get_model()),
     )
 
     # Run the agent
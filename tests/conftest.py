@@ -0,0 +1,24 @@
+import pytest
+
+from agents import instrumentation
+from tools.search_backends import LocalSearchBackend, set_search_backend
+
+
+@pytest.fixture
+def local_backend():
+    """The search tools on an in-process index, with an empty search cache"""
+    backend = LocalSearchBackend(default_index="documents")
+    set_search_backend(backend)
+    yield backend
+    set_search_backend(None)
+
+
+@pytest.fixture
+def metrics_on():
+    """Instrumentation turned on, with empty metrics"""
+    enabled = instrumentation.enabled()
+    instrumentation.set_enabled(True)
+    instrumentation.metrics.clear()
+    yield instrumentation.metrics
+    instrumentation.set_enabled(enabled)
+    instrumentation.metrics.clear()
@@ -0,0 +1,83 @@
+import asyncio
+import inspect
+
+import pytest
+
+from agents.agent import Agent
+from agents.checkpointer import BoundedMemorySaver
+from benchmarks.scripted_model import ScriptedChatModel, respond, tool_call
+from tools import ask_for_instruction
+
+TURNS = 50
+
+
+def asking_agent(**listeners):
+    # every turn asks the user again, past the end of the script the last turn repeats
+    model = ScriptedChatModel(script=[respond(tool_calls=[tool_call("ask_for_instruction")])])
+    agent = Agent(
+        model, [ask_for_instruction], "Ask the user.", message_listener=lambda event: None, **listeners
+    )
+    agent.state["messages"].append({"role": "user", "content": "start"})
+    return agent
+
+
+def test_session_pauses_at_each_interrupt():
+    agent = asking_agent()
+    session = agent.session()
+
+    with pytest.raises(RuntimeError):
+        session.resume("too early")
+
+    assert session.start() == "User >> "
+    assert session.waiting and agent.has_interrupt()
+    assert agent.interrupts[0].value == "User >> "
+
+    # has_interrupt reads the interrupts of the last run, not the graph state
+    interrupts, agent.interrupts = agent.interrupts, []
+    assert not agent.has_interrupt()
+    agent.interrupts = interrupts
+
+    assert session.resume("answer") == "User >> "
+    tool_messages = [message for message in session.last_event["messages"] if message.type == "tool"]
+    assert tool_messages[-1].content == "answer"
+
+
+def test_run_goes_on_for_many_turns_in_a_flat_stack():
+    depths = []
+
+    def answer(event):
+        depths.append(len(inspect.stack(0)))
+        return None if len(depths) == TURNS else f"answer {len(depths)}"
+
+    agent = asking_agent(user_input_listener=answer)
+    agent.run()
+
+    assert len(depths) == TURNS
+    assert len(set(depths)) == 1
+    # the thread keeps a bounded number of checkpoints, however long the session
+    checkpointer = agent.graph.checkpointer
+    if isinstance(checkpointer, BoundedMemorySaver):
+        thread_id = agent.thread_config["configurable"]["thread_id"]
+        assert len(checkpointer.storage[thread_id][""]) <= checkpointer.keep_last
+
+
+def test_arun_goes_on_for_many_turns_in_a_flat_stack():
+    depths = []
+
+    async def answer(event):
+        depths.append(len(inspect.stack(0)))
+        return None if len(depths) == TURNS else f"answer {len(depths)}"
+
+    agent = asking_agent(user_input_listener=answer)
+    asyncio.run(agent.arun())
+
+    assert len(depths) == TURNS
+    assert len(set(depths)) == 1
+
+
+def test_async_session_is_only_resumed_when_waiting():
+    agent = asking_agent()
+    session = agent.session()
+
+    with pytest.raises(RuntimeError):
+        asyncio.run(session.aresume("too early"))
@@ -0,0 +1,28 @@
+import json
+
+from tools.ai_search_tools import create_document, create_documents
+
+
+def test_create_documents_keeps_every_field(local_backend):
+    result = create_documents.invoke(
+        {
+            "documents": [
+                {"id": "1", "title": "First", "content": "one", "category": "notes"},
+                {"title": "Second", "content": "two"},
+            ]
+        }
+    )
+
+    assert json.loads(result)["succeeded"] == 2
+    documents = {
+        document["title"]: document
+        for document in local_backend.search("documents", "*", ["title"], ["id", "title", "category"], 10)
+    }
+    assert documents["First"] == {"id": "1", "title": "First", "category": "notes"}
+    assert documents["Second"]["id"]
+
+
+def test_create_document_writes_through_the_writer(local_backend):
+    document = json.loads(create_document.invoke({"title": "Title", "content": "text"}))
+
+    assert local_backend.search("documents", "text", ["content"], ["id"], 5) == [{"id": document["id"]}]
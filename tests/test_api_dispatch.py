@@ -0,0 +1,41 @@
+import pytest
+
+from tools.api_dispatch import dispatch_api_request
+
+
+@pytest.mark.parametrize(
+    "path, data",
+    [
+        ("unknown", {"query": "x"}),
+        ("search", ["query"]),
+        ("search", {"query": "x", "top": 3}),
+        ("search", {"query": 3}),
+        ("create", {"title": "Title"}),
+        ("create", {"title": "Title", "content": "text", "tags": []}),
+        ("create", {"title": "Title", "content": 3}),
+        ("update", {"id": "1"}),
+        ("update", {"id": 1, "title": "Title"}),
+        ("delete", {"id": "1", "reason": "old"}),
+        ("delete", {"id": 1}),
+    ],
+)
+def test_requests_that_are_not_standard_go_to_the_agent(local_backend, path, data):
+    assert dispatch_api_request(path, data) is None
+    assert local_backend.list_indexes() == []
+
+
+def test_standard_requests_run_their_tool(local_backend):
+    created = dispatch_api_request("/Create/", {"title": "Title", "content": "some text"})
+    assert created["title"] == "Title"
+
+    assert dispatch_api_request("search", {"query": "text"}) == [created]
+
+    updated = dispatch_api_request("update", {"id": created["id"], "content": "new words"})
+    assert updated == f"Document with ID {created['id']} successfully updated."
+    assert dispatch_api_request("search", {"query": "words"})[0]["title"] == "Title"
+
+    deleted = dispatch_api_request("delete", {"id": created["id"]})
+    assert deleted == f"Document with ID {created['id']} successfully deleted."
+    assert dispatch_api_request("search", {"query": "words"}) == {
+        "message": "No results found for your query."
+    }
@@ -0,0 +1,97 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+import asgi
+from agents.model_provider import set_model
+from agents.page_cache import PageCache
+from agents.session_pool import AgentPool
+from benchmarks.scripted_model import ScriptedChatModel, respond, tool_call
+
+# seconds per model call, each request makes two
+LATENCY = 0.1
+REQUESTS = 20
+
+
+def last_tool_content(messages):
+    return next(message.content for message in reversed(messages) if message.type == "tool")
+
+
+@pytest.fixture
+def scripted_model(local_backend):
+    set_model(
+        ScriptedChatModel(
+            script=[
+                respond(tool_calls=[tool_call("search", query="benchmark")]),
+                lambda messages: respond(content=last_tool_content(messages)),
+            ],
+            latency=LATENCY,
+        )
+    )
+    yield
+    set_model(None)
+
+
+def test_concurrent_requests_share_the_event_loop(scripted_model):
+    client = asgi.app.test_client()
+
+    async def post(number):
+        # different payloads, so the requests are not coalesced into one run
+        response = await client.post("/api/find-latest", json={"topic": f"load {number}"})
+        return response.status_code
+
+    async def load():
+        return await asyncio.gather(*(post(number) for number in range(REQUESTS)))
+
+    start = time.perf_counter()
+    statuses = asyncio.run(load())
+    elapsed = time.perf_counter() - start
+
+    assert statuses == [200] * REQUESTS
+    # one after the other they would take REQUESTS * 2 * LATENCY = 4s
+    assert elapsed < REQUESTS * 2 * LATENCY / 4
+
+
+class FakeAgent:
+    def __init__(self):
+        self.deleted_on = None
+
+    def delete_thread(self):
+        self.deleted_on = threading.current_thread()
+
+
+def test_async_session_gives_agents_back_off_the_event_loop():
+    pool = AgentPool(FakeAgent)
+
+    async def fail():
+        async with pool.asession("session") as agent:
+            raise ValueError("request failed")
+
+    async def use():
+        async with pool.asession() as agent:
+            return agent
+
+    with pytest.raises(ValueError):
+        asyncio.run(fail())
+    agent = asyncio.run(use())
+
+    assert pool.stats()["idle_agents"] == 0
+    assert agent.deleted_on is not None
+    assert agent.deleted_on is not threading.main_thread()
+
+
+def test_cache_invalidation_needs_the_admin_token(monkeypatch, tmp_path):
+    page_cache = PageCache(directory=str(tmp_path))
+    page_cache.put(page_cache.make_key("search", "prompt", []), "<html></html>")
+    monkeypatch.setattr(asgi, "get_page_cache", lambda: page_cache)
+    monkeypatch.setenv("UI_CACHE_ADMIN_TOKEN", "secret")
+    client = asgi.app.test_client()
+
+    async def invalidate(token):
+        response = await client.post("/ui-cache/invalidate", headers={"X-Admin-Token": token})
+        return response.status_code, await response.get_json()
+
+    assert asyncio.run(invalidate("wrong"))[0] == 403
+    assert asyncio.run(invalidate("secret")) == (200, {"removed": 1})
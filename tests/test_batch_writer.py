@@ -0,0 +1,116 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from tools.batch_writer import BufferedDocumentWriter
+
+
+def succeed(key, documents):
+    return [{"id": document["id"], "succeeded": True, "error": None} for document in documents]
+
+
+def test_single_write_is_sent_without_waiting():
+    batches = []
+
+    def send(key, documents):
+        batches.append((key, documents))
+        return succeed(key, documents)
+
+    writer = BufferedDocumentWriter(send, window=10)
+    start = time.monotonic()
+
+    result = writer.write(("upload", None), {"id": "1"})
+
+    assert result["succeeded"]
+    assert time.monotonic() - start < 1
+    assert batches == [(("upload", None), [{"id": "1"}])]
+
+
+def test_writes_during_a_send_are_coalesced():
+    batches = []
+    sending = threading.Event()
+    release = threading.Event()
+
+    def send(key, documents):
+        batches.append([document["id"] for document in documents])
+        sending.set()
+        release.wait(5)
+        return succeed(key, documents)
+
+    writer = BufferedDocumentWriter(send, window=0.05)
+    with ThreadPoolExecutor(4) as executor:
+        first = executor.submit(writer.write, "upload", {"id": "0"})
+        sending.wait(5)
+        others = [executor.submit(writer.write, "upload", {"id": str(i)}) for i in range(1, 4)]
+        time.sleep(0.01)
+        release.set()
+
+        assert first.result(5)["succeeded"]
+        assert all(future.result(5)["succeeded"] for future in others)
+
+    assert batches[0] == ["0"]
+    assert sorted(batches[1]) == ["1", "2", "3"]
+
+
+class BusyWriter:
+    """
+    A writer whose first batch is held until release, so the next writes are buffered.
+    """
+
+    def __init__(self, send, **options):
+        self.batches = []
+        self.sending = threading.Event()
+        self.release = threading.Event()
+        self.send = send
+        self.writer = BufferedDocumentWriter(self._send, **options)
+        self.executor = ThreadPoolExecutor(1)
+        self.first = self.executor.submit(self.writer.write, "upload", {"id": "0"})
+        self.sending.wait(5)
+
+    def _send(self, key, documents):
+        self.batches.append([document["id"] for document in documents])
+        if len(self.batches) == 1:
+            self.sending.set()
+            self.release.wait(5)
+            return succeed(key, documents)
+        return self.send(key, documents)
+
+
+def test_full_batch_is_sent_right_away():
+    busy = BusyWriter(succeed, window=10, max_batch_size=2)
+
+    first = busy.writer.submit("upload", {"id": "1"})
+    second = busy.writer.submit("upload", {"id": "2"})
+
+    assert second.result(1)["succeeded"] and first.result(1)["succeeded"]
+    assert busy.batches == [["0"], ["1", "2"]]
+    busy.release.set()
+    assert busy.first.result(5)["succeeded"]
+
+
+def test_missing_results_fail_the_writes():
+    busy = BusyWriter(lambda key, documents: succeed(key, documents)[:1], window=10)
+
+    first = busy.writer.submit("upload", {"id": "1"})
+    second = busy.writer.submit("upload", {"id": "2"})
+    busy.writer.flush()
+
+    assert first.result(1)["succeeded"]
+    with pytest.raises(RuntimeError):
+        second.result(1)
+    busy.release.set()
+
+
+def test_send_error_fails_every_write():
+    def fail(key, documents):
+        raise ConnectionError("service unavailable")
+
+    writer = BufferedDocumentWriter(fail)
+
+    with pytest.raises(ConnectionError):
+        writer.write("delete", {"id": "1"}, timeout=1)
+    # the failed send is over, the next write goes out right away again
+    with pytest.raises(ConnectionError):
+        writer.write("delete", {"id": "2"}, timeout=1)
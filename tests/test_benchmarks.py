@@ -0,0 +1,52 @@
+import json
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+REPORT_KEYS = {
+    "scenario",
+    "iterations",
+    "concurrency",
+    "model_latency_ms",
+    "errors",
+    "first_error",
+    "p50_ms",
+    "p95_ms",
+    "p99_ms",
+    "mean_ms",
+    "max_ms",
+    "throughput_per_s",
+    "peak_memory_kb",
+}
+
+
+def run_benchmarks(*args):
+    return subprocess.run(
+        [sys.executable, "-m", "benchmarks", "api_dispatch", "--iterations", "3", "--warmup", "0", *args],
+        cwd=ROOT,
+        capture_output=True,
+        text=True,
+        timeout=120,
+    )
+
+
+def test_benchmark_harness_reports_a_scenario(tmp_path):
+    path = tmp_path / "report.json"
+
+    result = run_benchmarks("--latency", "0", "--json", str(path))
+
+    assert result.returncode == 0, result.stderr
+    assert "api_dispatch" in result.stdout
+    [report] = json.loads(path.read_text())
+    assert set(report) == REPORT_KEYS
+    assert report["scenario"] == "api_dispatch"
+    assert report["iterations"] == 3
+    assert report["errors"] == 0
+    assert report["p50_ms"] <= report["p95_ms"] <= report["p99_ms"] <= report["max_ms"]
+    assert report["throughput_per_s"] > 0
+
+    # a run compared with itself, within a generous tolerance, has no regressions
+    result = run_benchmarks("--latency", "0", "--baseline", str(path), "--tolerance", "100")
+    assert result.returncode == 0, result.stdout + result.stderr
@@ -0,0 +1,85 @@
+import time
+
+from langgraph.checkpoint.base import empty_checkpoint
+from langgraph.constants import INTERRUPT
+
+from agents.checkpointer import BoundedMemorySaver
+
+
+def config(thread_id, checkpoint_id=None):
+    configurable = {"thread_id": thread_id, "checkpoint_ns": ""}
+    if checkpoint_id is not None:
+        configurable["checkpoint_id"] = checkpoint_id
+    return {"configurable": configurable}
+
+
+def put(saver, thread_id, value, version):
+    checkpoint = empty_checkpoint()
+    checkpoint["channel_values"] = {"messages": value}
+    checkpoint["channel_versions"] = {"messages": version}
+    return saver.put(config(thread_id), checkpoint, {}, {"messages": version})
+
+
+def test_compacts_to_the_last_checkpoints_and_their_values():
+    saver = BoundedMemorySaver(keep_last=2, ttl=None, max_bytes=None)
+    for version in range(1, 6):
+        saved = put(saver, "thread", f"value {version}", version)
+
+    checkpoints = list(saver.list(config("thread")))
+    assert len(checkpoints) == 2
+    assert saver.get_tuple(config("thread")).checkpoint["channel_values"] == {"messages": "value 5"}
+    # only the values of the kept checkpoints are left
+    assert sorted(key[3] for key in saver.blobs) == [4, 5]
+    assert saver.stats()["compacted_checkpoints"] == 3
+    assert saved["configurable"]["checkpoint_id"] == checkpoints[0].config["configurable"]["checkpoint_id"]
+
+
+def test_idle_threads_expire_after_ttl():
+    saver = BoundedMemorySaver(ttl=0.05, max_bytes=None)
+    put(saver, "idle", "value", 1)
+
+    time.sleep(0.06)
+    put(saver, "active", "value", 1)
+
+    assert saver.get_tuple(config("idle")) is None
+    assert saver.get_tuple(config("active")) is not None
+    assert saver.stats()["expired_threads"] == 1
+
+
+def test_thread_paused_at_an_interrupt_outlives_ttl():
+    saver = BoundedMemorySaver(ttl=0.05, max_bytes=None)
+    saved = put(saver, "paused", "value", 1)
+    saver.put_writes(saved, [(INTERRUPT, "what next?")], task_id="task")
+
+    time.sleep(0.06)
+    put(saver, "active", "value", 1)
+
+    assert saver.get_tuple(config("paused")) is not None
+    assert saver.stats()["expired_threads"] == 0
+
+
+def test_least_recently_used_threads_are_evicted_over_max_bytes():
+    saver = BoundedMemorySaver(ttl=None, max_bytes=None)
+    put(saver, "first", "x" * 1000, 1)
+    size = saver.stats()["bytes"]
+    saver.max_bytes = size * 2 + size // 2
+
+    put(saver, "second", "x" * 1000, 1)
+    saver.get_tuple(config("first"))
+    put(saver, "third", "x" * 1000, 1)
+
+    assert saver.get_tuple(config("second")) is None
+    assert saver.get_tuple(config("first")) is not None
+    assert saver.stats()["evicted_threads"] == 1
+    assert saver.stats()["bytes"] <= saver.max_bytes
+
+
+def test_deleted_thread_is_forgotten():
+    saver = BoundedMemorySaver(ttl=None, max_bytes=None)
+    put(saver, "thread", "value", 1)
+
+    saver.delete_thread("thread")
+
+    assert saver.get_tuple(config("thread")) is None
+    assert saver.stats()["threads"] == 0
+    assert saver.stats()["bytes"] == 0
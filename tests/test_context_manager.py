@@ -0,0 +1,80 @@
+from langchain_core.messages import AIMessage, HumanMessage, SystemMessage, ToolMessage
+
+from agents.context_manager import SUMMARY_NAME, ContextManager
+
+
+def count_words(text):
+    return len(str(text).split())
+
+
+def conversation(turns):
+    messages = [SystemMessage(content="system prompt")]
+    for turn in range(turns):
+        messages.append(HumanMessage(content=f"question {turn} " + "word " * 20))
+        messages.append(
+            AIMessage(
+                content="",
+                tool_calls=[{"name": "search", "args": {"query": str(turn)}, "id": f"call_{turn}"}],
+            )
+        )
+        messages.append(ToolMessage(content="result " * 20, tool_call_id=f"call_{turn}"))
+    return messages
+
+
+def test_history_within_budget_is_unchanged():
+    manager = ContextManager(max_tokens=10_000, count_tokens=count_words)
+
+    assert manager.prepare(conversation(2)) is None
+    assert manager.stats()["trimmed_calls"] == 0
+
+
+def test_large_tool_output_is_truncated():
+    manager = ContextManager(max_tool_tokens=10)
+    messages = [HumanMessage(content="q"), ToolMessage(content="x" * 1000, tool_call_id="call")]
+
+    prepared = manager.prepare(messages)
+
+    assert len(prepared[1].content) < 100
+    assert prepared[1].response_metadata["truncated"]
+
+
+def test_oldest_turns_are_dropped_keeping_tool_results_with_their_call():
+    manager = ContextManager(max_tokens=200, keep_last=2, count_tokens=count_words)
+
+    prepared = manager.prepare(conversation(5))
+
+    assert isinstance(prepared[0], SystemMessage)
+    assert sum(manager.message_tokens(message) for message in prepared) <= 200
+    # never starts on a tool result whose tool call was dropped
+    assert not isinstance(prepared[1], ToolMessage)
+    assert prepared[-1].tool_call_id == "call_4"
+
+
+def test_dropped_turns_are_summarised():
+    calls = []
+
+    def invoke(model, request):
+        calls.append(request)
+        return AIMessage(content="they searched for 0 and 1")
+
+    manager = ContextManager(max_tokens=200, keep_last=2, summarizer=object(), count_tokens=count_words)
+
+    prepared = manager.prepare(conversation(5), invoke=invoke)
+
+    assert len(calls) == 1
+    summaries = [message for message in prepared if message.name == SUMMARY_NAME]
+    assert summaries[0].content.endswith("they searched for 0 and 1")
+
+
+def test_tokens_saved_are_exported(metrics_on):
+    manager = ContextManager(max_tokens=200, keep_last=2, count_tokens=count_words)
+
+    manager.prepare(conversation(5))
+    manager.prepare(conversation(1))
+
+    saved = manager.stats()["tokens_saved"]
+    assert saved > 0
+    exported = metrics_on.prometheus()
+    assert f"agent_context_tokens_saved_total {saved}" in exported
+    assert 'agent_context_calls_total{result="trimmed"} 1' in exported
+    assert 'agent_context_calls_total{result="unchanged"} 1' in exported
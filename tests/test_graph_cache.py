@@ -0,0 +1,45 @@
+from agents.agent import Agent
+from agents.graph_cache import get_bound_model, get_compiled_graph
+from agents.model_policy import LARGE, SMALL, ModelPolicy
+from benchmarks.scripted_model import ScriptedChatModel, respond
+from tools.html_tools import button, html_template, search_bar
+
+
+class BindingModel(ScriptedChatModel):
+    """A scripted model that returns a new runnable for every binding, like a real chat model"""
+
+    def bind_tools(self, tools, **kwargs):
+        return self.bind(tools=[tool.name for tool in tools])
+
+
+def model():
+    return BindingModel(script=[respond(content="done")])
+
+
+def test_agents_with_the_same_tools_share_one_graph():
+    shared = model()
+    first = Agent(shared, [button, search_bar], "First prompt.")
+    second = Agent(shared, [search_bar, button], "Second prompt.")
+
+    assert first.graph is second.graph
+    assert first.model is second.model
+    assert first.graph is get_compiled_graph([button, search_bar])
+
+
+def test_different_tool_sets_get_their_own_graph():
+    shared = model()
+    first = Agent(shared, [button], "Prompt.")
+    second = Agent(shared, [button, search_bar], "Prompt.")
+
+    assert first.graph is not second.graph
+    assert first.model is not second.model
+
+
+def test_each_model_is_bound_once_per_tool_set():
+    small, large = model(), model()
+    agent = Agent(ModelPolicy(small, large), [html_template], "Prompt.")
+
+    assert agent.tier_models[SMALL] is not agent.tier_models[LARGE]
+    assert agent.tier_models[SMALL] is get_bound_model(small, [html_template])
+    assert agent.tier_models[LARGE] is agent.model
+    assert Agent(large, [html_template], "Prompt.").model is agent.model
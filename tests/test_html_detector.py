@@ -0,0 +1,73 @@
+from agents.html_detector import HTMLPageDetector, is_html_page
+
+PAGE = '<!DOCTYPE html>\n<html lang="en"><head></head><body><p>hi</p></body></html>'
+
+
+def test_complete_pages_are_detected():
+    assert is_html_page(PAGE)
+    assert is_html_page("<HTML><BODY class='x'></BODY></HTML>")
+    assert is_html_page("```html\n<html>\n<body/>\n</html>\n```")
+
+
+def test_text_without_both_start_tags_is_not_a_page():
+    assert not is_html_page("<html><bodyx></bodyx></html>")
+    assert not is_html_page("<htmlx><body></body>")
+    assert not is_html_page("<html></html>")
+    assert not is_html_page("The page needs an html and a body tag.")
+    assert not is_html_page("")
+
+
+def test_tags_split_across_chunks_are_found():
+    detector = HTMLPageDetector()
+    content = ""
+    results = []
+    for chunk in ["<ht", "ml>", "<head></head><bo", "dy", ">"]:
+        content += chunk
+        results.append(detector.check(content, key="message"))
+
+    assert results == [False, False, False, False, True]
+
+
+def test_only_the_new_text_is_scanned():
+    detector = HTMLPageDetector()
+    detector.check("<html>", key="message")
+    detector.check("<html><body>", key="message")
+
+    assert detector.scanned == len("<html><body>")
+    assert detector.tags == {"html", "body"}
+
+
+def test_a_new_key_starts_over():
+    detector = HTMLPageDetector()
+    assert not detector.check("<html>", key="first")
+    # the <html> of the first message does not count for the second one
+    assert not detector.check("<head></head><body>", key="second")
+    assert detector.check("<html><body>", key="third")
+
+
+def test_text_that_shrank_or_has_no_key_is_scanned_again():
+    detector = HTMLPageDetector()
+    assert detector.check(PAGE, key="message")
+    assert not detector.check("<html>", key="message")
+    assert detector.check(PAGE)
+    assert not detector.check("<body>")
+
+
+def test_validator_runs_once_the_structure_is_found():
+    calls = []
+
+    def validator(content):
+        calls.append(content)
+        return "</html>" in content
+
+    detector = HTMLPageDetector(validator)
+    assert not detector.check("<html>", key="message")
+    assert calls == []
+
+    assert not detector.check("<html><body>", key="message")
+    # unchanged text is not validated again
+    assert not detector.check("<html><body>", key="message")
+    assert detector.check("<html><body></body></html>", key="message")
+    assert calls == ["<html><body>", "<html><body></body></html>"]
+
+    assert not is_html_page(PAGE, validator=lambda content: False)
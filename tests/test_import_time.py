@@ -0,0 +1,18 @@
+import pytest
+
+from benchmarks.importtime import best_import_ms, import_budget_ms, lazy_modules_loaded, measure_import
+
+
+@pytest.fixture(scope="module")
+def budget_ms():
+    # measured here, so a slow machine raises the budget along with the imports
+    return import_budget_ms()
+
+
+@pytest.mark.parametrize("module", ["main", "app"])
+def test_startup_import_within_budget(module, budget_ms):
+    assert lazy_modules_loaded(measure_import(module)) == []
+    milliseconds = best_import_ms(module)
+    assert milliseconds <= budget_ms, (
+        f"importing {module} took {milliseconds:.0f}ms, over the {budget_ms:.0f}ms budget"
+    )
@@ -0,0 +1,110 @@
+import json
+import os
+import uuid
+
+from langchain_core.tools import tool
+
+import app as flask_app
+from agents import instrumentation
+from agents.instrumentation import RunTrace
+from agents.workflow_agent import WorkflowAgent
+from benchmarks.scripted_model import ScriptedChatModel, respond, tool_call
+
+
+@tool
+def lookup(query: str) -> str:
+    """Look up documents."""
+    return "[]"
+
+
+def run_workflow():
+    model = ScriptedChatModel(
+        script=[respond(tool_calls=[tool_call("lookup", query="x")]), respond('{"done": true}')]
+    )
+    agent = WorkflowAgent(model, [lookup], "Look up and return JSON.")
+    assert agent.run_workflow({"query": "x"}) == {"done": True}
+    return agent
+
+
+def test_nothing_is_recorded_when_off(monkeypatch):
+    monkeypatch.setattr(instrumentation, "_enabled", False)
+    instrumentation.metrics.clear()
+    agent = run_workflow()
+
+    config, trace = agent.start_trace()
+    assert trace is None
+    assert "callbacks" not in config
+    assert agent.last_trace is None
+    assert instrumentation.metrics.prometheus() == "\n"
+
+
+def test_run_is_traced(metrics_on, tmp_path, monkeypatch):
+    monkeypatch.setenv("AGENT_TRACE_DIR", str(tmp_path))
+    trace = run_workflow().last_trace
+
+    spans = trace["spans"]
+    assert [span["name"] for span in spans if span["kind"] == "node"] == [
+        "context",
+        "agent",
+        "tools",
+        "context",
+        "agent",
+    ]
+    assert [span["name"] for span in spans if span["kind"] == "tool"] == ["lookup"]
+    models = [span for span in spans if span["kind"] == "model"]
+    assert len(models) == 2
+    assert [span["start"] for span in spans] == sorted(span["start"] for span in spans)
+    assert all(span["duration"] >= 0 for span in spans)
+
+    # the spans of a node's model and tool calls lie within it
+    agent_node = next(span for span in spans if span["name"] == "agent")
+    assert agent_node["start"] <= models[0]["start"]
+    assert models[0]["start"] + models[0]["duration"] <= agent_node["start"] + agent_node["duration"]
+
+    assert trace["prompt_tokens"] == sum(span["prompt_tokens"] for span in models) > 0
+    assert trace["completion_tokens"] == sum(span["completion_tokens"] for span in models) > 0
+    assert trace["cached_prompt_tokens"] == 0
+    assert trace["retries"] == 0
+    assert trace["agent"] == "WorkflowAgent"
+
+    files = os.listdir(tmp_path)
+    assert len(files) == 1 and files[0].startswith(trace["thread_id"])
+    with open(tmp_path / files[0], encoding="utf-8") as file:
+        assert json.load(file) == json.loads(json.dumps(trace))
+
+    text = metrics_on.prometheus()
+    assert 'agent_runs_total{agent="WorkflowAgent"} 1' in text
+    assert f'agent_model_tokens_total{{type="prompt"}} {trace["prompt_tokens"]}' in text
+    assert f'agent_model_tokens_total{{type="completion"}} {trace["completion_tokens"]}' in text
+    assert 'agent_tool_seconds_count{tool="lookup"} 1' in text
+    assert 'agent_node_seconds_count{node="agent"} 2' in text
+    assert "agent_model_seconds_count 2" in text
+    assert "agent_checkpoint_bytes_count" in text
+
+
+def test_retries_and_tool_errors_are_counted(metrics_on):
+    trace = RunTrace("Agent", "thread")
+    trace.on_retry(None, run_id=uuid.uuid4())
+    run_id = uuid.uuid4()
+    trace.on_tool_start({}, "", run_id=run_id, name="lookup")
+    trace.on_tool_error(ValueError("bad query"), run_id=run_id)
+
+    result = trace.finish()
+
+    assert result["retries"] == 1
+    assert result["spans"][0]["error"] == "ValueError('bad query')"
+    text = metrics_on.prometheus()
+    assert 'agent_retries_total{kind="runnable"} 1' in text
+    assert 'agent_tool_errors_total{tool="lookup"} 1' in text
+
+
+def test_metrics_route_serves_the_prometheus_text(metrics_on):
+    metrics_on.increment("agent_runs_total", agent="Agent")
+
+    response = flask_app.app.test_client().get("/metrics")
+
+    assert response.mimetype == "text/plain"
+    text = response.get_data(as_text=True)
+    assert "# HELP agent_runs_total Agent graph runs." in text
+    assert "# TYPE agent_runs_total counter" in text
+    assert 'agent_runs_total{agent="Agent"} 1' in text
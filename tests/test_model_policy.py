@@ -0,0 +1,73 @@
+from benchmarks.scripted_model import ScriptedChatModel, respond, tool_call
+from agents.html_agent import HTMLAgent
+from agents.model_policy import LARGE, SMALL, ModelPolicy, default_route
+from agents.workflow_agent import WorkflowAgent
+from tools.html_tools import button
+
+PAGE = "<html><body>{}</body></html>"
+
+
+def test_page_generation_without_tools_goes_to_large_model():
+    policy = ModelPolicy(
+        ScriptedChatModel(script=[respond(content=PAGE.format("small"))]),
+        ScriptedChatModel(script=[respond(content=PAGE.format("large"))]),
+    )
+    agent = HTMLAgent(policy, [], "Write a page.")
+
+    assert agent.render_html({}) == PAGE.format("large")
+    stats = policy.stats()
+    assert stats[SMALL]["calls"] == 0
+    assert stats[LARGE]["calls"] == 1
+
+
+def test_html_agent_picks_tools_with_small_model_and_writes_with_large():
+    policy = ModelPolicy(
+        ScriptedChatModel(script=[respond(tool_calls=[tool_call("button", id="go", text="Go")])]),
+        ScriptedChatModel(script=[respond(content=PAGE.format("large"))]),
+    )
+    agent = HTMLAgent(policy, [button], "Write a page.")
+
+    assert list(agent.stream_html({})) == [PAGE.format("large")]
+    stats = policy.stats()
+    assert stats[SMALL]["calls"] == 1
+    assert stats[LARGE]["calls"] == 1
+    assert stats["escalations"] == 0
+
+
+def test_page_written_by_small_model_is_escalated():
+    policy = ModelPolicy(
+        ScriptedChatModel(script=[respond(content=PAGE.format("small"))]),
+        ScriptedChatModel(script=[respond(content=PAGE.format("large"))]),
+    )
+    agent = HTMLAgent(policy, [button], "Write a page.")
+
+    assert agent.render_html({}) == PAGE.format("large")
+    assert policy.stats()["escalations"] == 1
+
+
+def test_invalid_small_answer_is_escalated():
+    policy = ModelPolicy(
+        ScriptedChatModel(script=[respond(content="not json")]),
+        ScriptedChatModel(script=[respond(content='{"value": 1}')]),
+    )
+    agent = WorkflowAgent(policy, [], "Return JSON.", quiet=True)
+
+    assert default_route(agent, []) == SMALL
+    assert agent.run_workflow({}) == {"value": 1}
+    assert policy.stats()["escalations"] == 1
+
+
+def list_documents() -> str:
+    """List the documents."""
+    return "[]"
+
+
+def test_tool_given_as_function_is_valid():
+    policy = ModelPolicy(
+        ScriptedChatModel(script=[respond(content="")]),
+        ScriptedChatModel(script=[respond(content="")]),
+    )
+    agent = WorkflowAgent(policy, [list_documents], "Return JSON.", quiet=True)
+
+    assert agent.is_valid_response(respond(tool_calls=[tool_call("list_documents")]))
+    assert not agent.is_valid_response(respond(tool_calls=[tool_call("delete_documents")]))
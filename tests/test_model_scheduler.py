@@ -0,0 +1,128 @@
+import asyncio
+import time
+from email.utils import formatdate
+from types import SimpleNamespace
+
+import pytest
+
+from agents.model_scheduler import ModelScheduler, TokenBucket, is_rate_limit, retry_after
+
+MESSAGES = [{"role": "user", "content": "hello"}]
+
+
+class RateLimited(Exception):
+    def __init__(self, headers=None):
+        super().__init__("429 Too Many Requests")
+        self.status_code = 429
+        self.response = SimpleNamespace(status_code=429, headers=headers or {})
+
+
+class FlakyModel:
+    """A model that fails with the given errors before answering"""
+
+    model_name = "flaky"
+
+    def __init__(self, *errors):
+        self.errors = list(errors)
+        self.calls = []
+
+    def invoke(self, messages):
+        self.calls.append(time.monotonic())
+        if self.errors:
+            raise self.errors.pop(0)
+        return SimpleNamespace(content="answer", usage_metadata={"total_tokens": 10})
+
+    async def ainvoke(self, messages):
+        return self.invoke(messages)
+
+
+def test_bucket_refills_over_time_up_to_its_burst():
+    bucket = TokenBucket(per_minute=600, burst_seconds=10)  # 10 per second, holds 100
+    assert bucket.capacity == 100
+
+    bucket.take(100, now=bucket.updated)
+    assert bucket.wait_time(20, now=bucket.updated) == pytest.approx(2)
+    assert bucket.wait_time(20, now=bucket.updated + 2) == 0
+
+    assert bucket.wait_time(1, now=bucket.updated + 3600) == 0
+    assert bucket.level == 100
+
+
+def test_bucket_caps_large_requests_at_its_capacity():
+    bucket = TokenBucket(per_minute=60, burst_seconds=10)  # holds 10
+
+    assert bucket.wait_time(1000, now=bucket.updated) == 0
+    bucket.take(1000, now=bucket.updated)
+    assert bucket.level == 0
+
+
+def test_bucket_is_corrected_with_the_real_usage():
+    bucket = TokenBucket(per_minute=600, burst_seconds=10)
+    bucket.take(80, now=bucket.updated)
+
+    bucket.adjust(30)
+    assert bucket.level == 50
+    bucket.adjust(-70)
+    assert bucket.level == -20
+    bucket.adjust(1000)
+    assert bucket.level == 100
+
+
+def test_retry_after_headers():
+    assert retry_after(RateLimited({"retry-after": "3"})) == 3
+    assert retry_after(RateLimited({"retry-after-ms": "250", "retry-after": "3"})) == 0.25
+    assert 8 <= retry_after(RateLimited({"retry-after": formatdate(time.time() + 10, usegmt=True)})) <= 10
+    assert retry_after(RateLimited({"retry-after": "soon"})) is None
+    assert retry_after(RateLimited()) is None
+    assert retry_after(ValueError()) is None
+
+
+def test_rate_limits_are_recognised():
+    assert is_rate_limit(RateLimited())
+    assert is_rate_limit(type("RateLimitError", (Exception,), {})())
+    assert not is_rate_limit(ValueError())
+
+
+def test_rate_limited_calls_wait_for_retry_after():
+    scheduler = ModelScheduler(requests_per_minute=6000)
+    model = FlakyModel(RateLimited({"retry-after-ms": "200"}))
+
+    response = scheduler.invoke(model, MESSAGES)
+
+    assert response.content == "answer"
+    assert model.calls[1] - model.calls[0] >= 0.2
+    assert scheduler.stats()["rate_limited"] == 1
+
+
+def test_rate_limits_without_retry_after_back_off():
+    scheduler = ModelScheduler(requests_per_minute=6000, base_delay=0.1)
+    model = FlakyModel(RateLimited(), RateLimited())
+
+    asyncio.run(scheduler.ainvoke(model, MESSAGES))
+
+    # 0.5-1x of 0.1s, then of 0.2s
+    assert model.calls[1] - model.calls[0] >= 0.05
+    assert model.calls[2] - model.calls[1] >= 0.1
+    assert len(model.calls) == 3
+
+
+def test_other_errors_and_exhausted_retries_are_raised():
+    scheduler = ModelScheduler(requests_per_minute=6000, max_retries=1, base_delay=0.01)
+
+    with pytest.raises(ValueError):
+        scheduler.invoke(FlakyModel(ValueError("bad request")), MESSAGES)
+    with pytest.raises(RateLimited):
+        scheduler.invoke(FlakyModel(RateLimited(), RateLimited()), MESSAGES)
+    assert scheduler.stats()["waiting"] == 0
+
+
+def test_calls_wait_for_the_request_budget():
+    # one request per 0.1s, with a burst of a single request
+    scheduler = ModelScheduler(requests_per_minute=600)
+    scheduler._lane(FlakyModel()).requests = TokenBucket(600, burst_seconds=0.1)
+    model = FlakyModel()
+
+    for _ in range(3):
+        scheduler.invoke(model, MESSAGES)
+
+    assert model.calls[2] - model.calls[0] >= 0.18
@@ -0,0 +1,65 @@
+import os
+
+from agents.page_cache import PageCache
+
+
+def test_put_and_get_with_etag(tmp_path):
+    cache = PageCache(directory=str(tmp_path))
+    key = cache.make_key("search", "prompt", [])
+
+    etag = cache.put(key, "<html></html>")
+
+    assert cache.get(key) == ("<html></html>", etag)
+    assert cache.get(cache.make_key("search", "other prompt", [])) is None
+
+
+def test_reads_pages_written_by_another_process(tmp_path):
+    cache = PageCache(directory=str(tmp_path))
+    other = PageCache(directory=str(tmp_path))
+    key = cache.make_key("search", "prompt", [])
+
+    other.put(key, "<html>v1</html>")
+    assert cache.get(key)[0] == "<html>v1</html>"
+
+    other.put(key, "<html>v2</html>")
+    content, etag = cache.get(key)
+    assert content == "<html>v2</html>"
+    assert etag == PageCache.make_etag("<html>v2</html>")
+
+
+def test_invalidate_removes_pages_of_other_processes(tmp_path):
+    cache = PageCache(directory=str(tmp_path))
+    other = PageCache(directory=str(tmp_path))
+    other.put(cache.make_key("search", "prompt", []), "<html>search</html>")
+    other.put(cache.make_key("search/all", "prompt", []), "<html>all</html>")
+    cache.put(cache.make_key("create", "prompt", []), "<html>create</html>")
+
+    # only the exact path, not the paths below it
+    assert cache.invalidate("search") == 1
+    assert other.get(cache.make_key("search", "prompt", [])) is None
+    assert other.get(cache.make_key("search/all", "prompt", [])) is not None
+
+    assert cache.invalidate() == 2
+    assert [name for name in os.listdir(tmp_path) if name.endswith(".html")] == []
+
+
+def test_evicts_least_recently_used_page(tmp_path):
+    cache = PageCache(directory=str(tmp_path), max_bytes=25)
+    first, second, third = (cache.make_key(path, "prompt", []) for path in ("a", "b", "c"))
+    cache.put(first, "x" * 10)
+    cache.put(second, "y" * 10)
+    cache.get(first)
+
+    cache.put(third, "z" * 10)
+
+    assert cache.get(second) is None
+    assert cache.get(first) is not None
+    assert cache.get(third) is not None
+
+
+def test_index_survives_restart(tmp_path):
+    cache = PageCache(directory=str(tmp_path))
+    key = cache.make_key("search", "prompt", [])
+    cache.put(key, "<html></html>")
+
+    assert PageCache(directory=str(tmp_path)).get(key)[0] == "<html></html>"
@@ -0,0 +1,160 @@
+import os
+import threading
+import time
+
+import pytest
+
+import app as flask_app
+from agents.page_cache import PageCache
+from agents.page_warmup import (
+    CACHED,
+    FAILED,
+    GENERATED,
+    IN_FLIGHT,
+    LOCK_FILE,
+    PageWarmer,
+    WarmupPage,
+)
+from agents.single_flight import SingleFlight, make_key
+
+
+@pytest.fixture
+def page_cache(tmp_path):
+    return PageCache(directory=str(tmp_path))
+
+
+def page(page_cache, name, render):
+    return WarmupPage(name, page_cache.make_key(name, "prompt", []), render)
+
+
+def test_only_one_process_claims_the_warmup(page_cache):
+    release = threading.Event()
+    first = PageWarmer(page_cache)
+    # another process sharing the page cache directory
+    second = PageWarmer(PageCache(directory=page_cache.directory))
+    pages = [page(page_cache, "search", lambda: release.wait(5) and "<html></html>")]
+
+    thread = first.start(pages)
+    assert thread is not None
+    assert first.start(pages) is thread
+    assert second.start(pages) is None
+
+    release.set()
+    thread.join(5)
+    assert not os.path.exists(os.path.join(page_cache.directory, LOCK_FILE))
+    assert first.results["search"]["status"] == GENERATED
+    # the lock is free again once the warm-up is done
+    thread = second.start(pages, force=True)
+    assert thread is not None
+    thread.join(5)
+
+
+def test_stale_lock_of_a_crashed_process_is_replaced(page_cache):
+    lock_file = os.path.join(page_cache.directory, LOCK_FILE)
+    open(lock_file, "w").close()
+    warmer = PageWarmer(page_cache)
+
+    assert warmer.start([]) is None
+    an_hour_ago = time.time() - 3600
+    os.utime(lock_file, (an_hour_ago, an_hour_ago))
+    thread = warmer.start([])
+    assert thread is not None
+    thread.join(5)
+
+
+def test_cached_pages_are_not_generated_again(page_cache):
+    rendered = []
+    search = page(page_cache, "search", lambda: rendered.append("search") or "<html>new</html>")
+    page_cache.put(search.cache_key, "<html>old</html>")
+    warmer = PageWarmer(page_cache)
+
+    assert [result["status"] for result in warmer.warm([search])] == [CACHED]
+    assert rendered == []
+
+    assert [result["status"] for result in warmer.warm([search], force=True)] == [GENERATED]
+    assert rendered == ["search"]
+
+
+def test_pages_in_flight_are_left_to_their_visitor(page_cache):
+    flights = SingleFlight("ui", timeout=5)
+    flight, _ = flights.join(make_key("ui", "search"))
+    rendered = []
+    warmer = PageWarmer(page_cache, flights=flights)
+
+    results = warmer.warm([page(page_cache, "search", lambda: rendered.append("search"))])
+
+    assert [result["status"] for result in results] == [IN_FLIGHT]
+    assert warmer.results["search"]["status"] == IN_FLIGHT
+    assert rendered == []
+
+
+def test_visitors_wait_on_the_page_being_warmed_up(page_cache):
+    flights = SingleFlight("ui", timeout=5)
+    rendering, release = threading.Event(), threading.Event()
+
+    def render():
+        rendering.set()
+        release.wait(5)
+        return "<html>warm</html>"
+
+    warmer = PageWarmer(page_cache, flights=flights)
+    thread = threading.Thread(target=warmer.warm, args=([page(page_cache, "search", render)],))
+    thread.start()
+    rendering.wait(5)
+
+    flight, leader = flights.join(make_key("ui", "search"))
+    release.set()
+    thread.join(5)
+
+    assert not leader
+    assert flight.wait(5) and flight.result == "<html>warm</html>"
+
+
+def test_failed_pages_are_reported(page_cache):
+    flights = SingleFlight("ui", timeout=5)
+
+    def fail():
+        raise RuntimeError("model unavailable")
+
+    warmer = PageWarmer(page_cache, flights=flights)
+    warmer.warm([page(page_cache, "search", fail), page(page_cache, "create", lambda: None)])
+
+    assert warmer.results["search"]["status"] == FAILED
+    assert warmer.results["search"]["error"] == "model unavailable"
+    assert warmer.results["create"]["status"] == FAILED
+    assert warmer.results["create"]["error"] == "no page generated"
+    # the next visitor generates the page itself
+    assert flights.join(make_key("ui", "search"))[1]
+
+
+def test_pages_are_swapped_in_whole(page_cache):
+    served = []
+    def render():
+        served.append(page_cache.get(search.cache_key)[0])
+        return "<html>new</html>"
+
+    search = page(page_cache, "search", render)
+    page_cache.put(search.cache_key, "<html>old</html>")
+
+    PageWarmer(page_cache).warm([search], force=True)
+
+    # the old page is served until the new one is complete
+    assert served == ["<html>old</html>"]
+    assert page_cache.get(search.cache_key) == ("<html>new</html>", PageCache.make_etag("<html>new</html>"))
+    assert [name for name in os.listdir(page_cache.directory) if name.endswith(".tmp")] == []
+
+
+def test_warm_pages_command(page_cache, monkeypatch):
+    def fail():
+        raise RuntimeError("model unavailable")
+
+    pages = [page(page_cache, "search", lambda: "<html></html>"), page(page_cache, "create", fail)]
+    monkeypatch.setattr(flask_app, "page_warmer", PageWarmer(page_cache))
+    monkeypatch.setattr(flask_app, "warmup_pages", lambda paths: pages)
+
+    result = flask_app.app.test_cli_runner().invoke(args=["warm-pages", "--workers", "1"])
+
+    assert result.exit_code == 1
+    assert "search: generated in" in result.output
+    assert "create: failed" in result.output and "model unavailable" in result.output
+    assert "1 page(s) failed to generate" in result.output
@@ -0,0 +1,208 @@
+import asyncio
+import inspect
+import os
+import re
+import threading
+import time
+from importlib.metadata import version
+
+from langchain_core.messages import AIMessage
+from langchain_core.tools import StructuredTool, tool
+from langgraph.prebuilt import ToolNode
+
+from agents.parallel_tools import DEFAULT_MAX_WORKERS, ParallelToolNode
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# outside of a graph the tool node needs to be told there is no store
+NO_STORE = {"configurable": {"__pregel_store": None}}
+
+
+@tool
+def slow_lookup(name: str) -> str:
+    """Look up a name slowly."""
+    time.sleep(0.2)
+    return name.upper()
+
+
+def tool_turn(*names):
+    return {
+        "messages": [
+            AIMessage(
+                content="",
+                tool_calls=[
+                    {"name": "slow_lookup", "args": {"name": name}, "id": f"call_{name}"}
+                    for name in names
+                ],
+            )
+        ]
+    }
+
+
+def pinned_version(package):
+    with open(os.path.join(ROOT, "requirements.txt")) as f:
+        for line in f:
+            match = re.fullmatch(rf"{re.escape(package)}==(\S+)", line.strip())
+            if match:
+                return match.group(1)
+    return None
+
+
+def test_toolnode_internals_match_the_pinned_version():
+    # ParallelToolNode overrides these ToolNode internals, upgrading
+    # langgraph-prebuilt needs the override to be checked again
+    assert version("langgraph-prebuilt") == pinned_version("langgraph-prebuilt")
+    for name in ("_func", "_afunc"):
+        assert list(inspect.signature(getattr(ToolNode, name)).parameters) == [
+            "self",
+            "input",
+            "config",
+            "store",
+        ]
+    assert list(inspect.signature(ToolNode._parse_input).parameters) == ["self", "input", "store"]
+    for name in ("_run_one", "_arun_one"):
+        assert list(inspect.signature(getattr(ToolNode, name)).parameters) == [
+            "self",
+            "call",
+            "input_type",
+            "config",
+        ]
+    assert list(inspect.signature(ToolNode._combine_tool_outputs).parameters) == [
+        "self",
+        "outputs",
+        "input_type",
+    ]
+
+
+def test_tool_calls_run_concurrently_and_savings_are_exported(metrics_on):
+    node = ParallelToolNode([slow_lookup])
+    start = time.perf_counter()
+
+    result = node.invoke(tool_turn("a", "b", "c"), NO_STORE)
+
+    assert time.perf_counter() - start < 0.5
+    assert [message.content for message in result["messages"]] == ["A", "B", "C"]
+    stats = node.stats()
+    assert stats["tool_calls"] == 3
+    assert stats["saved_seconds"] > 0.2
+    assert "agent_tool_parallel_saved_seconds_count 1" in metrics_on.prometheus()
+
+
+def test_async_tool_calls_run_concurrently():
+    node = ParallelToolNode([slow_lookup])
+    start = time.perf_counter()
+
+    result = asyncio.run(node.ainvoke(tool_turn("a", "b"), NO_STORE))
+
+    assert time.perf_counter() - start < 0.35
+    assert [message.content for message in result["messages"]] == ["A", "B"]
+
+
+def test_timed_out_call_returns_an_error_message():
+    node = ParallelToolNode([slow_lookup], tool_timeouts={"slow_lookup": 0.05})
+
+    result = node.invoke(tool_turn("a"), NO_STORE)
+
+    assert result["messages"][0].status == "error"
+    assert node.stats()["timed_out"] == 1
+
+
+class Concurrency:
+    """Counts the calls running at the same time"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.active = 0
+        self.most = 0
+
+    def __enter__(self):
+        with self.lock:
+            self.active += 1
+            self.most = max(self.most, self.active)
+
+    def __exit__(self, *exc_info):
+        with self.lock:
+            self.active -= 1
+
+
+def calls(name, count):
+    return {
+        "messages": [
+            AIMessage(
+                content="",
+                tool_calls=[
+                    {"name": name, "args": {"name": str(i)}, "id": f"call_{i}"} for i in range(count)
+                ],
+            )
+        ]
+    }
+
+
+def test_tool_limit_holds_on_every_path():
+    running = Concurrency()
+
+    @tool
+    def limited(name: str) -> str:
+        """A tool with a limit."""
+        with running:
+            time.sleep(0.05)
+        return name
+
+    async def acall(name: str) -> str:
+        with running:
+            await asyncio.sleep(0.05)
+        return name
+
+    coroutine_only = StructuredTool.from_function(
+        coroutine=acall, name="coroutine_only", description="A tool with only a coroutine."
+    )
+    node = ParallelToolNode(
+        [limited, coroutine_only], tool_limits={"limited": 2, "coroutine_only": 2}
+    )
+
+    result = node.invoke(calls("limited", 6), NO_STORE)
+    assert [message.content for message in result["messages"]] == [str(i) for i in range(6)]
+    result = asyncio.run(node.ainvoke(calls("limited", 6), NO_STORE))
+    assert [message.content for message in result["messages"]] == [str(i) for i in range(6)]
+    result = asyncio.run(node.ainvoke(calls("coroutine_only", 6), NO_STORE))
+    assert [message.content for message in result["messages"]] == [str(i) for i in range(6)]
+
+    assert running.most == 2
+    assert all(limit.active == 0 for limit in node.limits.values())
+
+
+def test_calls_that_time_out_waiting_for_a_slot_never_run():
+    started = []
+
+    @tool
+    def single(name: str) -> str:
+        """A tool that runs one call at a time."""
+        started.append(name)
+        time.sleep(0.2)
+        return name
+
+    node = ParallelToolNode([single], tool_limits={"single": 1}, tool_timeouts={"single": 0.1})
+
+    result = asyncio.run(node.ainvoke(calls("single", 3), NO_STORE))
+
+    assert [message.status for message in result["messages"]] == ["error"] * 3
+    time.sleep(0.3)
+    assert started == ["0"]
+    assert node.limits["single"].active == 0
+
+
+def test_tools_that_run_agents_do_not_wait_on_their_own_workers():
+    inner = ParallelToolNode([slow_lookup])
+
+    @tool
+    def nested(name: str) -> str:
+        """A tool that runs the tools of another agent."""
+        return inner.invoke(tool_turn(name), NO_STORE)["messages"][0].content
+
+    # enough calls to take every worker of the shared pool
+    workers = int(os.getenv("AGENT_TOOL_WORKERS", DEFAULT_MAX_WORKERS))
+    outer = ParallelToolNode([nested], tool_timeouts={"nested": 5})
+
+    result = outer.invoke(calls("nested", workers), NO_STORE)
+
+    assert [message.content for message in result["messages"]] == [str(i) for i in range(workers)]
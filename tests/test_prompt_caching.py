@@ -0,0 +1,70 @@
+import json
+
+from langchain_core.messages import SystemMessage
+
+import app as flask_app
+from agents.agent import prompt_variables_message
+from agents.graph_cache import clear_cache, get_bound_model
+from benchmarks.scripted_model import ScriptedChatModel, respond
+
+PAGE = "<html><body>page</body></html>"
+
+
+def recording_model(answer):
+    sent = []
+
+    def play(messages):
+        sent.append(messages)
+        return respond(content=answer)
+
+    return ScriptedChatModel(script=[play], prompt_cache=True), sent
+
+
+def test_ui_requests_share_their_prompt_prefix(metrics_on, monkeypatch):
+    model, sent = recording_model(PAGE)
+    monkeypatch.setattr(flask_app, "get_agent_model", lambda: model)
+
+    first = flask_app.create_ui_agent("search")
+    second = flask_app.create_ui_agent("delete")
+    assert first.render_html({}) == second.render_html({}) == PAGE
+
+    assert isinstance(sent[0][0], SystemMessage)
+    # byte-identical static system prompt, the request's path comes after it
+    assert sent[0][0].content.encode() == sent[1][0].content.encode()
+    assert sent[0][0].content == flask_app.UI_AGENT_PROMPT
+    assert sent[0][1].content == prompt_variables_message({"path": "search"})["content"]
+    assert sent[1][1].content == prompt_variables_message({"path": "delete"})["content"]
+
+    # the static prompt of the second request was read from the provider's cache
+    assert first.last_trace["cached_prompt_tokens"] == 0
+    cached = second.last_trace["cached_prompt_tokens"]
+    assert cached > 0
+    assert second.last_trace["prompt_cache_hit_rate"] == cached / second.last_trace["prompt_tokens"]
+    assert f'agent_model_tokens_total{{type="prompt_cached"}} {cached}' in metrics_on.prometheus()
+
+
+def test_api_requests_share_their_system_prompt(monkeypatch):
+    model, sent = recording_model('{"done": true}')
+    monkeypatch.setattr(flask_app, "get_agent_model", lambda: model)
+
+    for path, data in [("search", {"query": "a"}), ("find-latest", {"topic": "b"})]:
+        request = flask_app.build_api_request(path, data, "POST")
+        assert flask_app.create_api_agent().run_workflow(request) == {"done": True}
+
+    assert sent[0][0].content == sent[1][0].content == flask_app.API_AGENT_PROMPT
+    assert sent[0][1:] != sent[1][1:]
+
+
+def test_tool_schemas_are_bound_in_a_stable_order():
+    from langchain_openai import ChatOpenAI
+
+    model = ChatOpenAI(api_key="unused", model="gpt-4o")
+    clear_cache()
+    in_order = get_bound_model(model, flask_app.UI_TOOLS).kwargs["tools"]
+    clear_cache()
+    reversed_order = get_bound_model(model, list(reversed(flask_app.UI_TOOLS))).kwargs["tools"]
+    clear_cache()
+
+    assert json.dumps(in_order) == json.dumps(reversed_order)
+    names = [schema["function"]["name"] for schema in in_order]
+    assert names == sorted(names)
@@ -0,0 +1,86 @@
+import asyncio
+
+from agents.agent import Agent
+from agents.html_agent import HTMLAgent
+from agents.response_cache import ResponseCache
+from benchmarks.scripted_model import ScriptedChatModel, respond, tool_call
+
+PAGE = "<html><body>" + "cell " * 60 + "</body></html>"
+
+
+def model(content="the answer"):
+    return ScriptedChatModel(script=[respond(content=content)], chunk_size=20)
+
+
+def first_answer(agent):
+    agent.state["messages"].append({"role": "user", "content": "question"})
+    for state in agent.stream_values(agent.next_input()):
+        if state["messages"][-1].type == "ai":
+            return state["messages"][-1]
+
+
+def test_same_turn_is_answered_from_the_cache():
+    cache = ResponseCache(":memory:")
+    shared = model()
+
+    first = first_answer(Agent(shared, [], "Prompt.", response_cache=cache))
+    second = first_answer(Agent(shared, [], "Prompt.", response_cache=cache))
+
+    assert second.content == first.content
+    assert second.id != first.id
+    assert cache.stats()["hits"] == 1
+
+
+def test_cache_hit_reaches_the_token_listener_once():
+    cache = ResponseCache(":memory:")
+    shared = model()
+    tokens = {}
+    for run in ("miss", "hit"):
+        tokens[run] = []
+        agent = Agent(shared, [], "Prompt.", token_listener=tokens[run].append, response_cache=cache)
+        first_answer(agent)
+
+    assert cache.stats()["hits"] == 1
+    assert "".join(tokens["hit"]) == "".join(tokens["miss"]) == "the answer"
+
+
+def test_async_cache_hit_reaches_the_token_listener_once():
+    cache = ResponseCache(":memory:")
+    shared = model()
+
+    async def answer(tokens):
+        agent = Agent(shared, [], "Prompt.", token_listener=tokens.append, response_cache=cache)
+        agent.state["messages"].append({"role": "user", "content": "question"})
+        async for state in agent.astream_values(agent.next_input()):
+            if state["messages"][-1].type == "ai":
+                break
+
+    miss, hit = [], []
+    asyncio.run(answer(miss))
+    asyncio.run(answer(hit))
+
+    assert cache.stats()["hits"] == 1
+    assert "".join(hit) == "".join(miss) == "the answer"
+
+
+def test_cached_page_is_streamed_like_a_generated_one():
+    cache = ResponseCache(":memory:")
+    shared = model(PAGE)
+
+    generated = list(HTMLAgent(shared, [], "Write a page.", response_cache=cache).stream_html({}))
+    cached = list(HTMLAgent(shared, [], "Write a page.", response_cache=cache).stream_html({}))
+
+    assert cache.stats()["hits"] == 1
+    assert len(generated) > 1
+    assert "".join(cached) == "".join(generated) == PAGE
+
+
+def test_tool_calls_are_not_replayed_from_similar_turns():
+    cache = ResponseCache(":memory:")
+    shared = ScriptedChatModel(script=[respond(tool_calls=[tool_call("search", query="x")])])
+
+    first_answer(Agent(shared, [], "Prompt.", response_cache=cache))
+    first_answer(Agent(shared, [], "Prompt.", response_cache=cache))
+
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["similar_hits"] == 0
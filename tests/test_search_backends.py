@@ -0,0 +1,116 @@
+import pytest
+
+from tools.search_backends import DEFAULT_LOCAL_FIELDS, LocalIndex, LocalSearchBackend, normalize_fields
+
+
+def make_index(*documents):
+    index = LocalIndex("documents", normalize_fields(DEFAULT_LOCAL_FIELDS))
+    for doc_id, title, content in documents:
+        index.put({"id": doc_id, "title": title, "content": content})
+    return index
+
+
+def ids(documents):
+    return [document["id"] for document in documents]
+
+
+def test_more_matching_terms_rank_higher():
+    index = make_index(
+        ("1", "Weather", "rain today"),
+        ("2", "Weather", "rain and wind today"),
+        ("3", "Food", "bread"),
+    )
+
+    assert ids(index.search("rain wind", ["content"], 5)) == ["2", "1"]
+
+
+def test_rare_terms_weigh_more_than_common_ones():
+    index = make_index(
+        ("1", "", "common common rare"),
+        ("2", "", "common common common"),
+        ("3", "", "common other words"),
+    )
+
+    assert ids(index.search("common rare", ["content"], 5))[0] == "1"
+
+
+def test_shorter_fields_rank_higher_for_the_same_frequency():
+    index = make_index(
+        ("1", "", "report " + "filler " * 20),
+        ("2", "", "report summary"),
+    )
+
+    assert ids(index.search("report", ["content"], 5)) == ["2", "1"]
+
+
+def test_search_only_looks_at_the_given_fields():
+    index = make_index(("1", "Rain", "sun"), ("2", "Sun", "rain"))
+
+    assert ids(index.search("rain", ["title"], 5)) == ["1"]
+    assert set(ids(index.search("rain", ["title", "content"], 5))) == {"1", "2"}
+    assert index.search("rain", ["missing"], 5) == []
+
+
+def test_empty_query_matches_everything_up_to_top():
+    index = make_index(("1", "", "a"), ("2", "", "b"), ("3", "", "c"))
+
+    assert ids(index.search("*", ["content"], 2)) == ["1", "2"]
+
+
+def test_replaced_and_removed_documents_leave_no_postings():
+    index = make_index(("1", "", "old words"))
+    index.put({"id": "1", "title": "", "content": "new words"})
+
+    assert index.search("old", ["content"], 5) == []
+    assert ids(index.search("new", ["content"], 5)) == ["1"]
+    assert index.total_lengths["content"] == 2
+
+    assert index.remove("1")
+    assert not index.remove("1")
+    assert index.postings["content"] == {}
+    assert index.total_lengths["content"] == 0
+
+
+def test_backend_writes_and_selects_fields():
+    backend = LocalSearchBackend(default_index="documents")
+    results = backend.index_batch(
+        None,
+        "upload",
+        [{"id": "1", "title": "First", "content": "one"}, {"title": "No key"}],
+    )
+
+    assert results == [
+        {"id": "1", "succeeded": True, "error": None},
+        {"id": None, "succeeded": False, "error": "Missing key"},
+    ]
+    assert backend.list_indexes() == ["documents"]
+
+    backend.index_batch("documents", "merge_or_upload", [{"id": "1", "content": "merged"}])
+    assert backend.search("documents", "merged", ["content"], ["id", "title"], 5) == [
+        {"id": "1", "title": "First"}
+    ]
+
+    backend.index_batch("documents", "delete", [{"id": "1"}])
+    assert backend.search("documents", "*", ["content"], ["id"], 5) == []
+    assert backend.search("missing", "*", ["content"], ["id"], 5) == []
+
+
+def test_backend_manages_indexes():
+    backend = LocalSearchBackend()
+    fields = normalize_fields(
+        [{"name": "key", "type": "Edm.String", "key": True}, {"name": "body", "type": "Edm.String"}]
+    )
+    backend.create_index("notes", fields)
+
+    with pytest.raises(ValueError):
+        backend.create_index("notes", fields)
+    assert backend.describe_index("notes") == {"name": "notes", "fields": fields}
+
+    backend.index_batch("notes", "upload", [{"key": "a", "body": "hello"}])
+    assert backend.search("notes", "hello", ["body"], ["key"], 5) == [{"key": "a"}]
+
+    backend.delete_index("notes")
+    with pytest.raises(ValueError):
+        backend.delete_index("notes")
+    with pytest.raises(KeyError):
+        backend.describe_index("notes")
@@ -0,0 +1,70 @@
+import time
+
+from tools.search_cache import SearchResultCache
+
+
+def test_hit_and_miss_are_counted_and_exported(metrics_on):
+    cache = SearchResultCache(settle_seconds=0)
+    key = cache.make_key("documents", "query", ["content"], 5)
+
+    assert cache.get(key) is None
+    cache.put(key, "[]", cache.generation("documents"))
+    assert cache.get(key) == "[]"
+
+    assert cache.stats()["hits"] == 1 and cache.stats()["misses"] == 1
+    exported = metrics_on.prometheus()
+    assert 'agent_search_cache_total{result="hit"} 1' in exported
+    assert 'agent_search_cache_total{result="miss"} 1' in exported
+
+
+def test_results_expire_after_ttl():
+    cache = SearchResultCache(ttl=0.05, settle_seconds=0)
+    key = cache.make_key("documents", "query", ["content"], 5)
+    cache.put(key, "[]", cache.generation("documents"))
+
+    time.sleep(0.06)
+
+    assert cache.get(key) is None
+
+
+def test_write_invalidates_and_blocks_stale_put():
+    cache = SearchResultCache(settle_seconds=0)
+    key = cache.make_key("documents", "query", ["content"], 5)
+    other = cache.make_key("other", "query", ["content"], 5)
+    cache.put(key, "[1]", cache.generation("documents"))
+    cache.put(other, "[2]", cache.generation("other"))
+
+    # a search that started before the write finishes after it
+    generation = cache.generation("documents")
+    cache.invalidate_index("documents")
+    cache.put(key, "[stale]", generation)
+
+    assert cache.get(key) is None
+    assert cache.get(other) == "[2]"
+
+
+def test_results_are_not_cached_right_after_a_write():
+    cache = SearchResultCache(settle_seconds=0.05)
+    key = cache.make_key("documents", "query", ["content"], 5)
+    cache.invalidate_index("documents")
+
+    cache.put(key, "[]", cache.generation("documents"))
+    assert cache.get(key) is None
+
+    time.sleep(0.06)
+    cache.put(key, "[]", cache.generation("documents"))
+    assert cache.get(key) == "[]"
+
+
+def test_least_recently_used_results_are_evicted():
+    cache = SearchResultCache(max_bytes=10, settle_seconds=0)
+    first, second, third = (cache.make_key("documents", query, ["content"], 5) for query in "abc")
+    cache.put(first, "x" * 4, 0)
+    cache.put(second, "y" * 4, 0)
+    cache.get(first)
+
+    cache.put(third, "z" * 4, 0)
+
+    assert cache.get(second) is None
+    assert cache.get(first) is not None
+    assert cache.stats()["evictions"] == 1
@@ -0,0 +1,45 @@
+import pytest
+
+from tools.search_clients import SearchClientRegistry
+
+
+@pytest.fixture
+def registry():
+    registry = SearchClientRegistry(
+        endpoint="https://search.example.net", key="key", default_index="documents", pool_size=4
+    )
+    yield registry
+    registry.close()
+
+
+def test_clients_are_reused_per_index(registry):
+    assert registry.search_client() is registry.search_client("documents")
+    assert registry.search_client("other") is not registry.search_client("documents")
+    assert registry.index_client() is registry.index_client()
+
+
+def test_clients_share_one_session(registry):
+    registry.search_client("documents")
+    registry.search_client("other")
+    registry.index_client()
+
+    assert registry._transport.session is registry._session
+    adapter = registry._session.get_adapter("https://search.example.net")
+    assert adapter._pool_maxsize == 4
+
+
+def test_close_drops_the_clients(registry):
+    client = registry.search_client()
+    registry.close()
+
+    assert registry.search_client() is not client
+
+
+def test_missing_configuration_is_reported(monkeypatch):
+    for name in ("AZURE_SEARCH_ENDPOINT", "AZURE_SEARCH_KEY", "AZURE_SEARCH_INDEX"):
+        monkeypatch.delenv(name, raising=False)
+
+    with pytest.raises(ValueError, match="credentials"):
+        SearchClientRegistry(default_index="documents").search_client()
+    with pytest.raises(ValueError, match="index"):
+        SearchClientRegistry(endpoint="https://x", key="k").search_client()
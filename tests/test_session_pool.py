@@ -0,0 +1,88 @@
+import pytest
+
+from agents import session_pool
+from agents.session_pool import AgentPool
+
+
+class FakeAgent:
+    def __init__(self):
+        self.deleted = False
+
+    def delete_thread(self):
+        self.deleted = True
+
+
+def test_agents_are_reused_by_their_session():
+    pool = AgentPool(FakeAgent)
+    agent = pool.checkout("a")
+    pool.checkin("a", agent)
+
+    assert pool.checkout("b") is not agent
+    assert pool.checkout("a") is agent
+    assert pool.stats() == {"sessions": 0, "idle_agents": 0, "created": 2, "reused": 1, "evicted": 0}
+    assert not agent.deleted
+
+
+def test_agents_without_a_session_are_not_kept():
+    pool = AgentPool(FakeAgent)
+    agent = pool.checkout()
+    pool.checkin(None, agent)
+
+    assert agent.deleted
+    assert pool.checkout() is not agent
+
+
+def test_failed_requests_discard_their_agent():
+    pool = AgentPool(FakeAgent)
+    with pytest.raises(ValueError):
+        with pool.session("a") as agent:
+            raise ValueError("request failed")
+
+    assert agent.deleted
+    assert pool.stats()["idle_agents"] == 0
+
+    with pool.session("a") as kept:
+        pass
+    assert not kept.deleted
+    assert pool.checkout("a") is kept
+
+
+def test_only_max_per_session_agents_are_kept():
+    pool = AgentPool(FakeAgent, max_per_session=2)
+    agents = [pool.checkout("a") for _ in range(3)]
+    for agent in agents:
+        pool.checkin("a", agent)
+
+    assert [agent.deleted for agent in agents] == [True, False, False]
+    assert pool.stats()["idle_agents"] == 2
+
+
+def test_least_recently_used_sessions_are_evicted():
+    pool = AgentPool(FakeAgent, max_sessions=2)
+    agents = {session_id: pool.checkout(session_id) for session_id in "abc"}
+    pool.checkin("a", agents["a"])
+    pool.checkin("b", agents["b"])
+    # a is used again, so b is the least recently used
+    pool.checkin("a", pool.checkout("a"))
+    pool.checkin("c", agents["c"])
+
+    assert agents["b"].deleted
+    assert not agents["a"].deleted and not agents["c"].deleted
+    assert pool.stats()["evicted"] == 1
+
+
+def test_idle_agents_expire(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(session_pool.time, "monotonic", lambda: now[0])
+    pool = AgentPool(FakeAgent, idle_timeout=60)
+    old, recent = pool.checkout("a"), pool.checkout("b")
+    pool.checkin("a", old)
+    now[0] += 50
+    pool.checkin("b", recent)
+    now[0] += 20
+
+    assert pool.evict_idle() == 1
+    assert old.deleted and not recent.deleted
+    # expired agents are not handed out again
+    assert pool.checkout("a") is not old
+    assert pool.checkout("b") is recent
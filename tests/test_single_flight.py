@@ -0,0 +1,52 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from agents.single_flight import SingleFlight, make_key
+
+
+def test_concurrent_calls_share_one_run_with_metrics_on(metrics_on):
+    flights = SingleFlight("api", timeout=5)
+    key = make_key("api", "search", {"query": "x"})
+    calls = []
+    started = threading.Event()
+
+    def run():
+        calls.append(1)
+        started.set()
+        time.sleep(0.2)
+        return {"value": 1}
+
+    def call(i):
+        if i:
+            started.wait(1)
+        return flights.do(key, run)
+
+    begin = time.monotonic()
+    with ThreadPoolExecutor(5) as executor:
+        results = list(executor.map(call, range(5)))
+
+    assert results == [{"value": 1}] * 5
+    assert len(calls) == 1
+    assert time.monotonic() - begin < 2
+    assert flights.stats() == {"runs": 1, "saved": 4, "timeouts": 0, "in_flight": 0}
+
+    exported = metrics_on.prometheus()
+    assert 'agent_single_flight_total{flight="api",result="run"} 1' in exported
+    assert 'agent_single_flight_total{flight="api",result="shared"} 4' in exported
+
+
+def test_error_is_shared_and_flight_released(metrics_on):
+    flights = SingleFlight("ui", timeout=5)
+    key = make_key("ui", "search")
+
+    def fail():
+        raise ValueError("no page")
+
+    with pytest.raises(ValueError):
+        flights.do(key, fail)
+
+    assert flights.stats()["in_flight"] == 0
+    assert flights.do(key, lambda: "page") == "page"
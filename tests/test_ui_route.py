@@ -0,0 +1,97 @@
+import pytest
+
+import app as flask_app
+from agents.page_cache import PageCache
+from agents.single_flight import SingleFlight, make_key
+
+
+class FakePageAgent:
+    def __init__(self, page):
+        self.page = None
+        self._page = page
+
+    def stream_html(self, values):
+        yield self._page
+        self.page = self._page
+
+
+@pytest.fixture
+def ui(tmp_path, monkeypatch):
+    page_cache = PageCache(directory=str(tmp_path))
+    flights = SingleFlight("ui", timeout=5)
+    monkeypatch.setattr(flask_app, "get_page_cache", lambda: page_cache)
+    monkeypatch.setattr(flask_app, "page_flights", flights)
+    return flask_app.app.test_client(), page_cache, flights
+
+
+def test_page_is_cached_and_flight_finished(ui, monkeypatch):
+    client, page_cache, flights = ui
+    monkeypatch.setattr(flask_app, "create_ui_agent", lambda path: FakePageAgent("<html></html>"))
+
+    with client.get("/ui/search") as response:
+        assert response.get_data(as_text=True) == "<html></html>"
+
+    assert flights.stats()["in_flight"] == 0
+    assert client.get("/ui/search").headers["ETag"]
+
+
+def test_failed_agent_creation_abandons_flight(ui, monkeypatch):
+    client, _, flights = ui
+
+    def fail(path):
+        raise RuntimeError("no model")
+
+    monkeypatch.setattr(flask_app, "create_ui_agent", fail)
+    assert client.get("/ui/search").status_code == 500
+
+    assert flights.stats()["in_flight"] == 0
+
+
+def test_unread_body_releases_flight(ui, monkeypatch):
+    client, _, flights = ui
+    monkeypatch.setattr(flask_app, "create_ui_agent", lambda path: FakePageAgent("<html></html>"))
+
+    # the client leaves before the body is sent
+    response = client.get("/ui/search", buffered=False)
+    assert flights.stats()["in_flight"] == 1
+    response.close()
+
+    assert flights.stats()["in_flight"] == 0
+
+
+def test_waiter_gets_shared_page_with_etag(ui, monkeypatch):
+    client, page_cache, flights = ui
+    flight, _ = flights.join(make_key("ui", "search"))
+    flight.resolve("<html>shared</html>")
+
+    response = client.get("/ui/search")
+
+    assert response.get_data(as_text=True) == "<html>shared</html>"
+    assert response.headers["ETag"] == f'"{page_cache.make_etag("<html>shared</html>")}"'
+
+
+def test_cache_invalidation_needs_the_admin_token(ui, monkeypatch):
+    client, page_cache, _ = ui
+    key = page_cache.make_key("search", "prompt", [])
+    page_cache.put(key, "<html></html>")
+
+    monkeypatch.delenv("UI_CACHE_ADMIN_TOKEN", raising=False)
+    assert client.post("/ui-cache/invalidate", headers={"X-Admin-Token": ""}).status_code == 403
+
+    monkeypatch.setenv("UI_CACHE_ADMIN_TOKEN", "secret")
+    assert client.post("/ui-cache/invalidate").status_code == 403
+    assert client.post("/ui-cache/invalidate", headers={"X-Admin-Token": "wrong"}).status_code == 403
+    assert page_cache.get(key) is not None
+
+    response = client.post("/ui-cache/invalidate", headers={"X-Admin-Token": "secret"})
+    assert response.get_json() == {"removed": 1}
+    assert page_cache.get(key) is None
+
+
+def test_pages_are_invalidated_from_the_command_line(ui):
+    _, page_cache, _ = ui
+    page_cache.put(page_cache.make_key("search", "prompt", []), "<html></html>")
+
+    result = flask_app.app.test_cli_runner().invoke(args=["invalidate-pages"])
+
+    assert result.output == "removed 1 page(s)\n"
@@ -0,0 +1,101 @@
+import asyncio
+import json
+
+import pytest
+from langchain_core.tools import tool
+
+from agents.workflow_agent import WorkflowAgent, extract_json
+from benchmarks.scripted_model import ScriptedChatModel, respond, tool_call
+
+DOCUMENTS = [{"id": "1", "title": "First"}]
+
+
+@tool
+def lookup(query: str) -> str:
+    """Look up documents."""
+    return "Found:\n" + json.dumps(DOCUMENTS)
+
+
+class CountedModel:
+    """A scripted model that counts its turns"""
+
+    def __init__(self, *turns):
+        self.calls = 0
+        self.model = ScriptedChatModel(script=[self.counted(turn) for turn in turns])
+
+    def counted(self, turn):
+        def play(messages):
+            self.calls += 1
+            return turn
+
+        return play
+
+
+@pytest.mark.parametrize(
+    "text, expected",
+    [
+        ('{"a": 1}', {"a": 1}),
+        ("[1, 2]", [1, 2]),
+        ('Here it is:\n```json\n{"a": 1}\n```\nDone.', {"a": 1}),
+        ('```\n[{"a": 1}]\n```', [{"a": 1}]),
+        ('The results are {"a": [1, 2]} as asked.', {"a": [1, 2]}),
+        ('text [1,2] and {"a":1}', [1, 2]),
+        ("not json {at all", None),
+        # a bare string or number is not a structured result
+        ('"x"', None),
+        ("42", None),
+        (None, None),
+    ],
+)
+def test_extract_json(text, expected):
+    assert extract_json(text) == expected
+
+
+def test_extract_json_skips_values_that_fail_the_check():
+    has_a = lambda value: isinstance(value, dict) and "a" in value
+
+    assert extract_json('text [1,2] and {"a":1}', has_a) == {"a": 1}
+    assert extract_json('```json\n{"b": 1}\n```\nor {"a": 2}', has_a) == {"a": 2}
+    assert extract_json('{"b": 1}', has_a) is None
+
+
+def test_result_after_prose_ends_the_run():
+    model = CountedModel(respond('Sure, here are the results: {"results": []} Let me know.'))
+    agent = WorkflowAgent(model.model, [lookup], "Return JSON.")
+
+    assert agent.run_workflow({"query": "x"}) == {"results": []}
+    assert model.calls == 1
+
+
+def test_result_rejected_by_the_schema_is_asked_again():
+    model = CountedModel(respond('{"wrong": 1}'), respond('Done: [0] {"results": [1]}'))
+    agent = WorkflowAgent(model.model, [lookup], "Return JSON.", result_schema=["results"])
+
+    assert agent.run_workflow({"query": "x"}) == {"results": [1]}
+    assert model.calls == 2
+
+
+def test_passthrough_tool_result_ends_the_run_without_another_turn():
+    model = CountedModel(respond(tool_calls=[tool_call("lookup", query="x")]), respond('{"never": 1}'))
+    agent = WorkflowAgent(model.model, [lookup], "Return JSON.", passthrough_tools=["lookup"])
+
+    assert asyncio.run(agent.arun_workflow({"query": "x"})) == DOCUMENTS
+    assert model.calls == 1
+
+
+def test_other_tool_results_go_back_to_the_model():
+    model = CountedModel(respond(tool_calls=[tool_call("lookup", query="x")]), respond('{"summary": 1}'))
+    agent = WorkflowAgent(model.model, [lookup], "Return JSON.")
+
+    assert agent.run_workflow({"query": "x"}) == {"summary": 1}
+    assert model.calls == 2
+
+
+def test_events_are_only_printed_when_asked(capsys):
+    model = CountedModel(respond('{"a": 1}'))
+
+    WorkflowAgent(model.model, [], "Return JSON.").run_workflow({})
+    assert capsys.readouterr().out == ""
+
+    WorkflowAgent(model.model, [], "Return JSON.", quiet=False).run_workflow({})
+    assert "messages" in capsys.readouterr().out
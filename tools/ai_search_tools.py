@@ -1,42 +1,99 @@
 import json
 import os
 import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
 
-from azure.core.credentials import AzureKeyCredential
-from azure.search.documents import SearchClient
-from azure.search.documents.indexes import SearchIndexClient
-from azure.search.documents.indexes.models import SearchFieldDataType
-from azure.search.documents.indexes.models import (
-    SearchFieldDataType,
-    SearchIndex,
-    SimpleField,
-)
-from dotenv import load_dotenv
 from langchain_core.tools import tool
 
-# Load environment variables from .env file
-load_dotenv()
+from .batch_writer import BufferedDocumentWriter
+from .search_backends import get_search_backend, normalize_fields
+from .search_cache import search_cache
+
+# Azure AI Search accepts at most 1000 documents in one indexing batch
+MAX_BATCH_SIZE = 1000
+# How many batches are sent to the service at the same time
+MAX_CONCURRENT_BATCHES = int(os.getenv("AZURE_SEARCH_MAX_CONCURRENT_BATCHES", 4))
+# How long single document writes wait to be coalesced into a batch while another
+# write of the same action and index is being sent, in seconds
+WRITE_WINDOW = float(os.getenv("AZURE_SEARCH_WRITE_WINDOW", 0.02))
 
-# Get Azure Search credentials from environment variables
-search_endpoint = os.getenv("AZURE_SEARCH_ENDPOINT")
-search_key = os.getenv("AZURE_SEARCH_KEY")
-# TODO get rid of this 
-index_name = os.getenv("AZURE_SEARCH_INDEX")
 
-# Initialize the search client
-credential = AzureKeyCredential(search_key)
-search_client = SearchClient(
-    endpoint=search_endpoint, index_name=index_name, credential=credential
+def index_documents(action, documents, index_name=None):
+    """
+    Send documents to the index in batches, with the batches sent concurrently.
+    Args:
+        action: One of "upload", "merge_or_upload" or "delete".
+        documents: The documents, each one must have an "id".
+        index_name: The index to write to. (optional, defaults to AZURE_SEARCH_INDEX)
+    Returns:
+        One result per document, in order, as a dictionary with 'id', 'succeeded' and 'error'.
+    """
+    backend = get_search_backend()
+    index_name = index_name or backend.default_index
+    batch_size = min(MAX_BATCH_SIZE, backend.max_batch_size)
+
+    batches = [
+        documents[start : start + batch_size]
+        for start in range(0, len(documents), batch_size)
+    ]
+
+    try:
+        with ThreadPoolExecutor(max_workers=MAX_CONCURRENT_BATCHES) as executor:
+            futures = [
+                executor.submit(backend.index_batch, index_name, action, batch)
+                for batch in batches
+            ]
+    finally:
+        # cached search results of this index may be stale now
+        search_cache.invalidate_index(index_name)
+
+    results = []
+    for batch, future in zip(batches, futures):
+        try:
+            results.extend(future.result())
+        except Exception as e:
+            # the whole batch failed, report it on every document
+            results.extend(
+                {"id": document.get("id"), "succeeded": False, "error": str(e)}
+                for document in batch
+            )
+
+    return results
+
+
+def _send_buffered_batch(key, documents):
+    """
+    Send a batch from the document writer, its key is (action, index name).
+    """
+    action, index_name = key
+    return index_documents(action, documents, index_name=index_name)
+
+
+# Coalesces the single document tools below into batches per action and index
+document_writer = BufferedDocumentWriter(
+    _send_buffered_batch, window=WRITE_WINDOW, max_batch_size=MAX_BATCH_SIZE
 )
 
 
+def _bulk_summary(results):
+    """
+    Summarise bulk results for a tool response, only listing the failures.
+    """
+    failed = [result for result in results if not result["succeeded"]]
+    return json.dumps(
+        {"succeeded": len(results) - len(failed), "failed": len(failed), "failures": failed}
+    )
+
+
 @tool
-def create_document(title: str, content: str) -> str:
+def create_document(title: str, content: str, index_name: Optional[str] = None) -> str:
     """
     Add a document to the Azure AI Search index.
     Args:
         title: The title of the document
         content: The main content of the document
+        index_name: The index to add the document to (optional, defaults to the configured index)
     Returns:
         Result message indicating success or failure
     """
@@ -52,38 +109,48 @@ def create_document(title: str, content: str) -> str:
         }
 
         # Upload the document to the index
-        result = search_client.upload_documents(documents=[document])
+        result = document_writer.write(("upload", index_name), document)
 
         # Check if upload was successful
-        if len(result) > 0 and result[0].succeeded:
+        if result["succeeded"]:
             return json.dumps(document)
         else:
-            error_msg = (
-                result[0].error_message
-                if len(result) > 0 and hasattr(result[0], "error_message")
-                else "Unknown error"
-            )
+            error_msg = result["error"] or "Unknown error"
             return f"Failed to add document: {error_msg}"
     except Exception as e:
         return f"Error adding document to search index: {str(e)}"
 
 
 @tool
-def search(query: str) -> str:
+def search(query: str, index_name: Optional[str] = None) -> str:
     """
     Search for information using Azure AI Search.
     Args:
         query: The search query string
+        index_name: The index to search (optional, defaults to the configured index)
     Returns:
         Search results as a JSON object with fields 'id', 'title', and 'content'
     """
     try:
+        backend = get_search_backend()
+        index_name = index_name or backend.default_index
+        top = 5  # Return top 5 results
+        search_fields = ["content", "title"]  # Adjust based on your index schema
+
+        # Return the cached results if this exact search was done recently
+        cache_key = search_cache.make_key(index_name, query, search_fields, top)
+        cached = search_cache.get(cache_key)
+        if cached is not None:
+            return cached
+        generation = search_cache.generation(index_name)
+
         # Execute search query
-        results = search_client.search(
-            search_text=query,
-            top=5,  # Return top 5 results
-            search_fields=["content", "title"],  # Adjust based on your index schema
+        results = backend.search(
+            index_name,
+            query,
+            search_fields=search_fields,
             select=["id", "content", "title"],  # Adjust based on your index schema
+            top=top,
         )
 
         # Format search results
@@ -97,20 +164,24 @@ def search(query: str) -> str:
             formatted_results.append(formatted_result)
 
         if formatted_results:
-            return json.dumps(formatted_results)
+            result = json.dumps(formatted_results)
         else:
-            return json.dumps({"message": "No results found for your query."})
+            result = json.dumps({"message": "No results found for your query."})
+
+        search_cache.put(cache_key, result, generation)
+        return result
     except Exception as e:
         return json.dumps({"error": f"Error performing search: {str(e)}"})
 
 
 @tool
-def update_document(id: str, updated_data: dict) -> str:
+def update_document(id: str, updated_data: dict, index_name: Optional[str] = None) -> str:
     """
     Update a document in the Azure AI Search index.
     Args:
         id: The ID of the document to update
         updated_data: A dictionary containing the updated fields and values
+        index_name: The index of the document (optional, defaults to the configured index)
     Returns:
         Result message indicating success or failure
     """
@@ -119,47 +190,96 @@ def update_document(id: str, updated_data: dict) -> str:
         updated_data["id"] = id
 
         # Update the document in the index
-        result = search_client.merge_or_upload_documents(documents=[updated_data])
+        result = document_writer.write(("merge_or_upload", index_name), updated_data)
 
-        if len(result) > 0 and result[0].succeeded:
+        if result["succeeded"]:
             return f"Document with ID {id} successfully updated."
         else:
-            error_msg = (
-                result[0].error_message
-                if len(result) > 0 and hasattr(result[0], "error_message")
-                else "Unknown error"
-            )
+            error_msg = result["error"] or "Unknown error"
             return f"Failed to update document: {error_msg}"
     except Exception as e:
         return f"Error updating document in search index: {str(e)}"
 
 
 @tool
-def delete_document(id: str) -> str:
+def delete_document(id: str, index_name: Optional[str] = None) -> str:
     """
     Delete a document from the Azure AI Search index.
     Args:
         doc_id: The ID of the document to delete, the id should look like a UUID and not be a word
+        index_name: The index of the document (optional, defaults to the configured index)
     Returns:
         Result message indicating success or failure
     """
     try:
         # Delete the document from the index
-        result = search_client.delete_documents(documents=[{"id": id}])
+        result = document_writer.write(("delete", index_name), {"id": id})
 
-        if len(result) > 0 and result[0].succeeded:
+        if result["succeeded"]:
             return f"Document with ID {id} successfully deleted."
         else:
-            error_msg = (
-                result[0].error_message
-                if len(result) > 0 and hasattr(result[0], "error_message")
-                else "Unknown error"
-            )
+            error_msg = result["error"] or "Unknown error"
             return f"Failed to delete document: {error_msg}"
     except Exception as e:
         return f"Error deleting document from search index: {str(e)}"
 
-tool
+
+@tool
+def create_documents(documents: list[dict], index_name: Optional[str] = None) -> str:
+    """
+    Add many documents to the Azure AI Search index at once.
+    Args:
+        documents: The documents to add, each a dictionary with a 'title', 'content' and any
+                   other fields of the index, and optionally an 'id' (a new id is generated
+                   when it is missing)
+        index_name: The index to add the documents to (optional, defaults to the configured index)
+    Returns:
+        A JSON object with the number of documents that succeeded and failed, and the failures
+    """
+    try:
+        # keep every field of the documents, only generate the missing ids
+        documents = [
+            {**document, "id": document.get("id") or str(uuid.uuid4())}
+            for document in documents
+        ]
+        return _bulk_summary(index_documents("upload", documents, index_name))
+    except Exception as e:
+        return json.dumps({"error": f"Error adding documents to search index: {str(e)}"})
+
+
+@tool
+def update_documents(documents: list[dict], index_name: Optional[str] = None) -> str:
+    """
+    Update many documents in the Azure AI Search index at once.
+    Args:
+        documents: The documents to update, each a dictionary with the 'id' and the updated fields
+        index_name: The index of the documents (optional, defaults to the configured index)
+    Returns:
+        A JSON object with the number of documents that succeeded and failed, and the failures
+    """
+    try:
+        return _bulk_summary(index_documents("merge_or_upload", documents, index_name))
+    except Exception as e:
+        return json.dumps({"error": f"Error updating documents in search index: {str(e)}"})
+
+
+@tool
+def delete_documents(ids: list[str], index_name: Optional[str] = None) -> str:
+    """
+    Delete many documents from the Azure AI Search index at once.
+    Args:
+        ids: The IDs of the documents to delete, the ids should look like UUIDs and not be words
+        index_name: The index of the documents (optional, defaults to the configured index)
+    Returns:
+        A JSON object with the number of documents that succeeded and failed, and the failures
+    """
+    try:
+        return _bulk_summary(index_documents("delete", [{"id": id} for id in ids], index_name))
+    except Exception as e:
+        return json.dumps({"error": f"Error deleting documents from search index: {str(e)}"})
+
+
+@tool
 def list_indexes() -> str:
     """
     List all indexes in the Azure AI Search resource.
@@ -167,25 +287,8 @@ def list_indexes() -> str:
         A JSON string containing the list of indexes
     """
     try:
-        # Get Azure Search credentials from environment variables
-        search_endpoint = os.getenv("AZURE_SEARCH_ENDPOINT")
-        search_key = os.getenv("AZURE_SEARCH_KEY")
-        
-        # Validate required credentials
-        if not all([search_endpoint, search_key]):
-            return json.dumps(
-                {
-                    "error": "Azure Search credentials not configured. Please set AZURE_SEARCH_ENDPOINT and AZURE_SEARCH_KEY environment variables."
-                }
-            )
-            
-        # Initialize the search client
-        credential = AzureKeyCredential(search_key)
-        search_client = SearchIndexClient(endpoint=search_endpoint, credential=credential)
-        
-        # List indexes
-        indexes = search_client.list_indexes()
-        index_names = [index.name for index in indexes]
+        # List indexes with the configured search backend
+        index_names = get_search_backend().list_indexes()
         
         return json.dumps(index_names)
     except Exception as e:
@@ -207,67 +310,19 @@ def create_index(index_name: str, fields: list) -> str:
         A message indicating success or failure.
     """
     try:
-        search_endpoint = os.getenv("AZURE_SEARCH_ENDPOINT")
-        search_key = os.getenv("AZURE_SEARCH_KEY")
-        credential = AzureKeyCredential(search_key)
-        index_client = SearchIndexClient(endpoint=search_endpoint, credential=credential)
-        
-        # Map string type names to SearchFieldDataType enum values
-        type_mapping = {
-            "Edm.String": SearchFieldDataType.String,
-            "Edm.Int32": SearchFieldDataType.Int32,
-            "Edm.Int64": SearchFieldDataType.Int64,
-            "Edm.Double": SearchFieldDataType.Double,
-            "Edm.Boolean": SearchFieldDataType.Boolean,
-            "Edm.DateTimeOffset": SearchFieldDataType.DateTimeOffset,
-            "Edm.GeographyPoint": SearchFieldDataType.GeographyPoint,
-            "Collection(Edm.String)": SearchFieldDataType.Collection(SearchFieldDataType.String)
-        }
-        
-        # Create the list of SimpleField objects from the input fields
-        index_fields = []
+        # Validate the fields before creating anything
         for field in fields:
-            field_name = field.get("name")
-            field_type_str = field.get("type")
-            
-            if not field_name or not field_type_str:
+            if not field.get("name") or not field.get("type"):
                 return f"Error: Each field must have a 'name' and 'type' property"
-                
-            # Get the corresponding enum value or default to String if not found
-            field_type = type_mapping.get(field_type_str, SearchFieldDataType.String)
-            
-            # Extract other field properties with defaults
-            is_key = field.get("key", False)
-            is_searchable = field.get("searchable", True)
-            is_filterable = field.get("filterable", not is_key)
-            is_sortable = field.get("sortable", not is_key)
-            is_facetable = field.get("facetable", not is_key)
-            is_retrievable = field.get("retrievable", True)
-            
-            # Create the field
-            index_fields.append(
-                SimpleField(
-                    name=field_name,
-                    type=field_type,
-                    key=is_key,
-                    searchable=is_searchable,
-                    filterable=is_filterable,
-                    sortable=is_sortable,
-                    facetable=is_facetable,
-                    retrievable=is_retrievable
-                )
-            )
-        
+
         # Ensure at least one field is marked as a key
-        if not any(field.key for field in index_fields):
+        if not any(field.get("key", False) for field in fields):
             return "Error: At least one field must be marked as a key field"
-            
-        # Create the SearchIndex object
-        index = SearchIndex(name=index_name, fields=index_fields)
-        
-        # Create the index using the SearchIndex object
-        index_client.create_index(index=index)
-        
+
+        # Create the index, filling in the field properties that were not given
+        get_search_backend().create_index(index_name, normalize_fields(fields))
+        search_cache.invalidate_index(index_name)
+
         return f"Index '{index_name}' created successfully with {len(fields)} fields."
     except Exception as e:
         return f"Error creating index: {str(e)}"
@@ -283,11 +338,8 @@ def delete_index(index_name: str) -> str:
         A message indicating success or failure.
     """
     try:
-        search_endpoint = os.getenv("AZURE_SEARCH_ENDPOINT")
-        search_key = os.getenv("AZURE_SEARCH_KEY")
-        credential = AzureKeyCredential(search_key)
-        index_client = SearchIndexClient(endpoint=search_endpoint, credential=credential)
-        index_client.delete_index(index=index_name)
+        get_search_backend().delete_index(index_name)
+        search_cache.invalidate_index(index_name)
         return f"Index '{index_name}' deleted successfully."
     except Exception as e:
         return f"Error deleting index: {str(e)}"
@@ -302,53 +354,12 @@ def describe_index_schema(index_name: str) -> str:
         JSON string containing the index schema information
     """
     try:
-        # Get Azure Search credentials from environment variables
-        search_endpoint = os.getenv("AZURE_SEARCH_ENDPOINT")
-        search_key = os.getenv("AZURE_SEARCH_KEY")
-        
-        # Validate required credentials
-        if not all([search_endpoint, search_key]):
-            return json.dumps({
-                "error": "Azure Search credentials not configured. Please set AZURE_SEARCH_ENDPOINT and AZURE_SEARCH_KEY environment variables."
-            })
-            
-        # Initialize the search client
-        credential = AzureKeyCredential(search_key)
-        index_client = SearchIndexClient(endpoint=search_endpoint, credential=credential)
-        
         # Get the index definition
         try:
-            index = index_client.get_index(name=index_name)
-        except Exception as e:
-            return json.dumps({"error": f"Index '{index_name}' not found: {str(e)}"})
-        
-        # Create a schema description with field information
-        schema_info = {
-            "name": index.name,
-            "fields": []
-        }
-        
-        # Add field definitions
-        for field in index.fields:
-            field_info = {
-                "name": field.name,
-                "type": str(field.type),
-                "key": field.key,
-                "searchable": getattr(field, "searchable", False),
-                "filterable": getattr(field, "filterable", False),
-                "sortable": getattr(field, "sortable", False),
-                "facetable": getattr(field, "facetable", False),
-                "retrievable": getattr(field, "retrievable", True)
-            }
-            schema_info["fields"].append(field_info)
-        
-        # Add other index properties if they exist
-        if hasattr(index, "scoring_profiles") and index.scoring_profiles:
-            schema_info["scoring_profiles"] = [profile.name for profile in index.scoring_profiles]
-        
-        if hasattr(index, "analyzers") and index.analyzers:
-            schema_info["analyzers"] = [analyzer.name for analyzer in index.analyzers]
-            
+            schema_info = get_search_backend().describe_index(index_name)
+        except KeyError as e:
+            return json.dumps({"error": f"Index '{index_name}' not found: {e.args[0]}"})
+
         return json.dumps(schema_info, indent=2)
         
     except Exception as e:
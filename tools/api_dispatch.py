@@ -0,0 +1,82 @@
+import json
+
+from .ai_search_tools import (
+    create_document,
+    delete_document,
+    search,
+    update_document,
+)
+
+
+def _search_args(data):
+    """
+    Build the search tool arguments, or None if the payload is not a plain search.
+    """
+    if set(data) != {"query"} or not isinstance(data["query"], str):
+        return None
+    return {"query": data["query"]}
+
+
+def _create_args(data):
+    """
+    Build the create_document tool arguments, or None if the payload is not a plain create.
+    """
+    if set(data) != {"title", "content"}:
+        return None
+    if not all(isinstance(value, str) for value in data.values()):
+        return None
+    return {"title": data["title"], "content": data["content"]}
+
+
+def _update_args(data):
+    """
+    Build the update_document tool arguments, or None if the payload is not a plain update.
+    """
+    if not isinstance(data.get("id"), str) or len(data) < 2:
+        return None
+    updated_data = {key: value for key, value in data.items() if key != "id"}
+    return {"id": data["id"], "updated_data": updated_data}
+
+
+def _delete_args(data):
+    """
+    Build the delete_document tool arguments, or None if the payload is not a plain delete.
+    """
+    if set(data) != {"id"} or not isinstance(data["id"], str):
+        return None
+    return {"id": data["id"]}
+
+
+# The standard API paths and the tool that implements each of them
+STANDARD_ROUTES = {
+    "search": (search, _search_args),
+    "create": (create_document, _create_args),
+    "update": (update_document, _update_args),
+    "delete": (delete_document, _delete_args),
+}
+
+
+def dispatch_api_request(path, data):
+    """
+    Dispatch a standard API request straight to its tool, without the LLM.
+    Args:
+        path: The API path, e.g. "search".
+        data: The JSON payload of the request.
+    Returns:
+        The tool result (decoded from JSON when possible), or None if the path
+        or payload is not a standard operation and the agent should handle it.
+    """
+    route = STANDARD_ROUTES.get(path.strip("/").lower())
+    if route is None or not isinstance(data, dict):
+        return None
+
+    tool, build_args = route
+    args = build_args(data)
+    if args is None:
+        return None
+
+    result = tool.invoke(args)
+    try:
+        return json.loads(result)
+    except (TypeError, ValueError):
+        return result
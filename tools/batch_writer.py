@@ -0,0 +1,109 @@
+import threading
+from concurrent.futures import Future
+
+
+class BufferedDocumentWriter:
+    """
+    Coalesces single document writes that arrive within a short window into one batch.
+
+    Writes are grouped by key, e.g. (action, index name). A write with nothing
+    else of its group buffered or being sent goes out right away. The writes
+    that arrive while it is sent are buffered, and a group is sent as soon as
+    it reaches max_batch_size or when the window since the first buffered write
+    has passed, whichever comes first.
+    """
+
+    def __init__(self, send_batch, window=0.02, max_batch_size=1000):
+        """
+        Initialize the writer.
+        Args:
+            send_batch: Function called as send_batch(key, documents) that returns
+                one result per document, in the same order as the documents.
+            window: How long to wait for more writes before sending, in seconds.
+            max_batch_size: The maximum number of documents sent in one batch.
+        """
+        self.send_batch = send_batch
+        self.window = window
+        self.max_batch_size = max_batch_size
+
+        self._lock = threading.Lock()
+        self._pending = {}
+        # key -> number of batches being sent
+        self._sending = {}
+        self._timer = None
+
+    def submit(self, key, document) -> Future:
+        """
+        Buffer a document write. A write that goes out right away is sent
+        before this returns.
+        Returns:
+            A future that resolves to the result for this document.
+        """
+        future = Future()
+        batch = None
+
+        with self._lock:
+            pending = self._pending.setdefault(key, [])
+            pending.append((document, future))
+
+            if len(pending) >= self.max_batch_size or (len(pending) == 1 and not self._sending.get(key)):
+                batch = self._take(key)
+            elif self._timer is None:
+                self._timer = threading.Timer(self.window, self.flush)
+                self._timer.daemon = True
+                self._timer.start()
+
+        if batch is not None:
+            self._send(key, batch)
+
+        return future
+
+    def write(self, key, document, timeout=None):
+        """
+        Buffer a document write and wait for its result.
+        """
+        return self.submit(key, document).result(timeout=timeout)
+
+    def flush(self) -> None:
+        """
+        Send everything that is buffered right away.
+        """
+        with self._lock:
+            pending = {key: self._take(key) for key in list(self._pending)}
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+
+        for key, batch in pending.items():
+            self._send(key, batch)
+
+    def _take(self, key):
+        """
+        Take the buffered writes of a key to send them, called with the lock held.
+        """
+        self._sending[key] = self._sending.get(key, 0) + 1
+        return self._pending.pop(key)
+
+    def _send(self, key, batch) -> None:
+        """
+        Send a batch and resolve the futures of its documents.
+        """
+        try:
+            results = list(self.send_batch(key, [document for document, _ in batch]))
+        except Exception as e:
+            for _, future in batch:
+                future.set_exception(e)
+            return
+        finally:
+            with self._lock:
+                self._sending[key] -= 1
+                if not self._sending[key]:
+                    del self._sending[key]
+
+        for (_, future), result in zip(batch, results):
+            future.set_result(result)
+        if len(results) < len(batch):
+            # no result came back for these documents, don't leave their writers waiting
+            error = RuntimeError(f"The batch returned {len(results)} results for {len(batch)} documents")
+            for _, future in batch[len(results) :]:
+                future.set_exception(error)
@@ -0,0 +1,415 @@
+import math
+import os
+import re
+import threading
+from collections import Counter
+
+from .search_cache import search_cache
+from .search_clients import search_clients
+
+
+class SearchBackend:
+    """
+    The interface between the search tools and a search service.
+
+    Documents are dictionaries with an "id", and write results are dictionaries
+    with 'id', 'succeeded' and 'error', one per document and in order.
+    Index fields are dictionaries with 'name', 'type', 'key', 'searchable',
+    'filterable', 'sortable', 'facetable' and 'retrievable'.
+    """
+
+    # The largest batch of documents the service accepts in one write
+    max_batch_size = 1000
+
+    @property
+    def default_index(self):
+        """
+        The index used when the tools are not given one.
+        """
+        raise NotImplementedError
+
+    def search(self, index_name, query, search_fields, select, top) -> list:
+        """
+        Search an index, returns the top documents with the selected fields.
+        """
+        raise NotImplementedError
+
+    def index_batch(self, index_name, action, documents) -> list:
+        """
+        Write one batch of documents, action is "upload", "merge_or_upload" or "delete".
+        """
+        raise NotImplementedError
+
+    def list_indexes(self) -> list:
+        """
+        List the names of the indexes.
+        """
+        raise NotImplementedError
+
+    def create_index(self, index_name, fields) -> None:
+        """
+        Create an index with the given fields.
+        """
+        raise NotImplementedError
+
+    def delete_index(self, index_name) -> None:
+        """
+        Delete an index.
+        """
+        raise NotImplementedError
+
+    def describe_index(self, index_name) -> dict:
+        """
+        Describe the schema of an index, raises KeyError if it does not exist.
+        """
+        raise NotImplementedError
+
+
+class AzureSearchBackend(SearchBackend):
+    """
+    Azure AI Search, through the shared clients in search_clients.
+    """
+
+    def __init__(self, clients=search_clients):
+        self.clients = clients
+
+    @property
+    def default_index(self):
+        return self.clients.default_index
+
+    def search(self, index_name, query, search_fields, select, top) -> list:
+        results = self.clients.search_client(index_name).search(
+            search_text=query,
+            top=top,
+            search_fields=search_fields,
+            select=select,
+        )
+        return [dict(result) for result in results]
+
+    def index_batch(self, index_name, action, documents) -> list:
+        search_client = self.clients.search_client(index_name)
+        send = {
+            "upload": search_client.upload_documents,
+            "merge_or_upload": search_client.merge_or_upload_documents,
+            "delete": search_client.delete_documents,
+        }[action]
+
+        by_key = {result.key: result for result in send(documents=documents)}
+
+        results = []
+        for document in documents:
+            result = by_key.get(document.get("id"))
+            if result is None:
+                results.append(
+                    {"id": document.get("id"), "succeeded": False, "error": "Unknown error"}
+                )
+            else:
+                results.append(
+                    {
+                        "id": result.key,
+                        "succeeded": result.succeeded,
+                        "error": getattr(result, "error_message", None),
+                    }
+                )
+        return results
+
+    def list_indexes(self) -> list:
+        return [index.name for index in self.clients.index_client().list_indexes()]
+
+    def create_index(self, index_name, fields) -> None:
+        from azure.search.documents.indexes.models import (
+            SearchFieldDataType,
+            SearchIndex,
+            SimpleField,
+        )
+
+        # Map string type names to SearchFieldDataType enum values
+        type_mapping = {
+            "Edm.String": SearchFieldDataType.String,
+            "Edm.Int32": SearchFieldDataType.Int32,
+            "Edm.Int64": SearchFieldDataType.Int64,
+            "Edm.Double": SearchFieldDataType.Double,
+            "Edm.Boolean": SearchFieldDataType.Boolean,
+            "Edm.DateTimeOffset": SearchFieldDataType.DateTimeOffset,
+            "Edm.GeographyPoint": SearchFieldDataType.GeographyPoint,
+            "Collection(Edm.String)": SearchFieldDataType.Collection(SearchFieldDataType.String)
+        }
+
+        index_fields = [
+            SimpleField(
+                name=field["name"],
+                # Get the corresponding enum value or default to String if not found
+                type=type_mapping.get(field["type"], SearchFieldDataType.String),
+                key=field["key"],
+                searchable=field["searchable"],
+                filterable=field["filterable"],
+                sortable=field["sortable"],
+                facetable=field["facetable"],
+                retrievable=field["retrievable"],
+            )
+            for field in fields
+        ]
+
+        index = SearchIndex(name=index_name, fields=index_fields)
+        self.clients.index_client().create_index(index=index)
+
+    def delete_index(self, index_name) -> None:
+        self.clients.index_client().delete_index(index=index_name)
+
+    def describe_index(self, index_name) -> dict:
+        index_client = self.clients.index_client()
+        try:
+            index = index_client.get_index(name=index_name)
+        except Exception as e:
+            raise KeyError(str(e))
+
+        # Create a schema description with field information
+        schema_info = {
+            "name": index.name,
+            "fields": []
+        }
+
+        # Add field definitions
+        for field in index.fields:
+            field_info = {
+                "name": field.name,
+                "type": str(field.type),
+                "key": field.key,
+                "searchable": getattr(field, "searchable", False),
+                "filterable": getattr(field, "filterable", False),
+                "sortable": getattr(field, "sortable", False),
+                "facetable": getattr(field, "facetable", False),
+                "retrievable": getattr(field, "retrievable", True)
+            }
+            schema_info["fields"].append(field_info)
+
+        # Add other index properties if they exist
+        if hasattr(index, "scoring_profiles") and index.scoring_profiles:
+            schema_info["scoring_profiles"] = [profile.name for profile in index.scoring_profiles]
+
+        if hasattr(index, "analyzers") and index.analyzers:
+            schema_info["analyzers"] = [analyzer.name for analyzer in index.analyzers]
+
+        return schema_info
+
+
+# The fields of indexes the local backend creates on first write
+DEFAULT_LOCAL_FIELDS = [
+    {"name": "id", "type": "Edm.String", "key": True, "searchable": False},
+    {"name": "title", "type": "Edm.String", "key": False, "searchable": True},
+    {"name": "content", "type": "Edm.String", "key": False, "searchable": True},
+]
+
+_TOKEN_PATTERN = re.compile(r"\w+")
+
+
+def tokenize(text):
+    """
+    Split text into lower case word tokens.
+    """
+    return _TOKEN_PATTERN.findall(str(text).lower())
+
+
+class LocalIndex:
+    """
+    An in-memory index with a BM25 ranked inverted index per searchable field.
+    """
+
+    # BM25 parameters, the same defaults Azure AI Search uses
+    k1 = 1.2
+    b = 0.75
+
+    def __init__(self, name, fields):
+        self.name = name
+        self.fields = fields
+        self.key_field = next(field["name"] for field in fields if field["key"])
+        self.searchable = [field["name"] for field in fields if field["searchable"]]
+
+        self.documents = {}
+        # field -> term -> {document id: term frequency}
+        self.postings = {field: {} for field in self.searchable}
+        # field -> {document id: length in tokens}
+        self.lengths = {field: {} for field in self.searchable}
+        self.total_lengths = {field: 0 for field in self.searchable}
+
+    def put(self, document):
+        doc_id = document[self.key_field]
+        self.remove(doc_id)
+        self.documents[doc_id] = document
+
+        for field in self.searchable:
+            tokens = tokenize(document.get(field, ""))
+            for term, count in Counter(tokens).items():
+                self.postings[field].setdefault(term, {})[doc_id] = count
+            self.lengths[field][doc_id] = len(tokens)
+            self.total_lengths[field] += len(tokens)
+
+    def remove(self, doc_id):
+        document = self.documents.pop(doc_id, None)
+        if document is None:
+            return False
+
+        for field in self.searchable:
+            for term in set(tokenize(document.get(field, ""))):
+                postings = self.postings[field][term]
+                postings.pop(doc_id, None)
+                if not postings:
+                    del self.postings[field][term]
+            self.total_lengths[field] -= self.lengths[field].pop(doc_id, 0)
+        return True
+
+    def search(self, query, search_fields, top):
+        terms = tokenize(query)
+        if not terms:
+            # an empty or "*" query matches everything, like Azure AI Search
+            return list(self.documents.values())[:top]
+
+        count = len(self.documents)
+        scores = Counter()
+        for field in search_fields:
+            if field not in self.postings:
+                continue
+            average_length = self.total_lengths[field] / count if count else 0
+            for term in set(terms):
+                postings = self.postings[field].get(term)
+                if not postings:
+                    continue
+                idf = math.log(1 + (count - len(postings) + 0.5) / (len(postings) + 0.5))
+                for doc_id, frequency in postings.items():
+                    length = self.lengths[field][doc_id]
+                    norm = 1 - self.b + self.b * (length / average_length if average_length else 0)
+                    scores[doc_id] += idf * frequency * (self.k1 + 1) / (frequency + self.k1 * norm)
+
+        return [self.documents[doc_id] for doc_id, _ in scores.most_common(top)]
+
+
+class LocalSearchBackend(SearchBackend):
+    """
+    An in-process search backend, for offline use, benchmarks and small indexes.
+
+    Indexes live in memory and are ranked with BM25 over their searchable
+    fields. Writing to an index that does not exist creates it with an
+    id/title/content schema.
+    """
+
+    def __init__(self, default_index=None):
+        self._default_index = default_index or os.getenv("AZURE_SEARCH_INDEX") or "documents"
+        self._lock = threading.Lock()
+        self._indexes = {}
+
+    @property
+    def default_index(self):
+        return self._default_index
+
+    def search(self, index_name, query, search_fields, select, top) -> list:
+        with self._lock:
+            index = self._indexes.get(index_name or self.default_index)
+            if index is None:
+                return []
+            documents = index.search(query, search_fields, top)
+            return [
+                {field: document[field] for field in select if field in document}
+                for document in documents
+            ]
+
+    def index_batch(self, index_name, action, documents) -> list:
+        with self._lock:
+            index_name = index_name or self.default_index
+            index = self._indexes.get(index_name)
+            if index is None:
+                index = LocalIndex(index_name, normalize_fields(DEFAULT_LOCAL_FIELDS))
+                self._indexes[index_name] = index
+
+            results = []
+            for document in documents:
+                doc_id = document.get(index.key_field)
+                if doc_id is None:
+                    results.append({"id": None, "succeeded": False, "error": "Missing key"})
+                    continue
+
+                if action == "delete":
+                    index.remove(doc_id)
+                elif action == "merge_or_upload":
+                    index.put({**index.documents.get(doc_id, {}), **document})
+                else:
+                    index.put(dict(document))
+                results.append({"id": doc_id, "succeeded": True, "error": None})
+            return results
+
+    def list_indexes(self) -> list:
+        with self._lock:
+            return list(self._indexes)
+
+    def create_index(self, index_name, fields) -> None:
+        with self._lock:
+            if index_name in self._indexes:
+                raise ValueError(f"Index '{index_name}' already exists.")
+            self._indexes[index_name] = LocalIndex(index_name, fields)
+
+    def delete_index(self, index_name) -> None:
+        with self._lock:
+            if self._indexes.pop(index_name, None) is None:
+                raise ValueError(f"Index '{index_name}' not found.")
+
+    def describe_index(self, index_name) -> dict:
+        with self._lock:
+            index = self._indexes.get(index_name)
+            if index is None:
+                raise KeyError(f"Index '{index_name}' not found.")
+            return {"name": index.name, "fields": [dict(field) for field in index.fields]}
+
+
+def normalize_fields(fields):
+    """
+    Fill in the optional properties of index fields with their defaults.
+    Args:
+        fields: List of dictionaries with at least a 'name' and 'type'.
+    """
+    filled = []
+    for field in fields:
+        is_key = field.get("key", False)
+        filled.append(
+            {
+                "name": field["name"],
+                "type": field["type"],
+                "key": is_key,
+                "searchable": field.get("searchable", True),
+                "filterable": field.get("filterable", not is_key),
+                "sortable": field.get("sortable", not is_key),
+                "facetable": field.get("facetable", not is_key),
+                "retrievable": field.get("retrievable", True),
+            }
+        )
+    return filled
+
+
+# The available backends, selected with the SEARCH_BACKEND environment variable
+SEARCH_BACKENDS = {
+    "azure": AzureSearchBackend,
+    "local": LocalSearchBackend,
+}
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def get_search_backend() -> SearchBackend:
+    """
+    Get the search backend used by the tools, created on first use.
+    """
+    global _backend
+    with _backend_lock:
+        if _backend is None:
+            _backend = SEARCH_BACKENDS[os.getenv("SEARCH_BACKEND", "azure").lower()]()
+        return _backend
+
+
+def set_search_backend(backend) -> None:
+    """
+    Replace the search backend used by the tools.
+    """
+    global _backend
+    with _backend_lock:
+        _backend = backend
+    # results cached from the previous backend no longer apply
+    search_cache.clear()
@@ -0,0 +1,165 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from agents import instrumentation
+
+# Default time to live of a cached search result, in seconds
+DEFAULT_TTL = 60
+# Default memory budget of the cache, in bytes of cached results
+DEFAULT_MAX_BYTES = 16 * 1024 * 1024
+# Default time after a write to an index during which its results are not cached,
+# in seconds. Azure AI Search indexes writes in near real time, so a search right
+# after a write can still return the results from before it.
+DEFAULT_SETTLE_SECONDS = 2
+
+
+class SearchResultCache:
+    """
+    In-process cache of search results with a TTL and LRU eviction.
+
+    Results are keyed by (index, query, fields, top) and the total size of the
+    cached results is kept under max_bytes. Writes to an index invalidate its
+    results, and a generation number per index makes sure a search that was
+    already running during a write cannot put a stale result back. Results
+    are not cached for settle_seconds after a write, while the search service
+    may still return results from before it.
+
+    Invalidation only reaches this process: the other workers of a server, or
+    a write made outside the tools, leave their cached results of the index in
+    place, so they can be up to ttl seconds old.
+    """
+
+    def __init__(self, ttl=DEFAULT_TTL, max_bytes=DEFAULT_MAX_BYTES, settle_seconds=DEFAULT_SETTLE_SECONDS):
+        """
+        Initialize the cache.
+        Args:
+            ttl: How long a result stays valid, in seconds.
+            max_bytes: The maximum total size of the cached results.
+            settle_seconds: How long after a write to an index its results are not cached.
+        """
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.settle_seconds = settle_seconds
+
+        self._lock = threading.Lock()
+        # key -> (expires_at, result, size), least recently used first
+        self._entries = OrderedDict()
+        self._size = 0
+        self._generations = {}
+        # index name -> time of the last write
+        self._written_at = {}
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    @staticmethod
+    def make_key(index_name, query, fields, top):
+        """
+        Build the cache key of a search.
+        """
+        return (index_name, query, tuple(fields), top)
+
+    def generation(self, index_name) -> int:
+        """
+        Get the current generation of an index, pass it back to put.
+        """
+        with self._lock:
+            return self._generations.get(index_name, 0)
+
+    def get(self, key):
+        """
+        Get a cached result, or None if it is not cached or has expired.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    self._remove(key)
+                self.misses += 1
+                result = None
+            else:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                result = entry[1]
+
+        if instrumentation.enabled():
+            instrumentation.metrics.increment(
+                "agent_search_cache_total", result="miss" if result is None else "hit"
+            )
+        return result
+
+    def put(self, key, result, generation) -> None:
+        """
+        Cache a result, unless its index was written to since generation was
+        read or in the last settle_seconds.
+        """
+        size = len(result)
+        if size > self.max_bytes:
+            return
+
+        with self._lock:
+            if self._generations.get(key[0], 0) != generation:
+                return
+            written_at = self._written_at.get(key[0])
+            if written_at is not None and time.monotonic() - written_at < self.settle_seconds:
+                return
+
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (time.monotonic() + self.ttl, result, size)
+            self._size += size
+
+            while self._size > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def invalidate_index(self, index_name) -> None:
+        """
+        Drop every cached result of an index.
+        """
+        with self._lock:
+            self._generations[index_name] = self._generations.get(index_name, 0) + 1
+            self._written_at[index_name] = time.monotonic()
+            for key in [key for key in self._entries if key[0] == index_name]:
+                self._remove(key)
+            self.invalidations += 1
+
+    def clear(self) -> None:
+        """
+        Drop every cached result.
+        """
+        with self._lock:
+            for index_name in {key[0] for key in self._entries}:
+                self._generations[index_name] = self._generations.get(index_name, 0) + 1
+            self._entries.clear()
+            self._size = 0
+
+    def stats(self) -> dict:
+        """
+        Get the cache counters.
+        """
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+                "entries": len(self._entries),
+                "bytes": self._size,
+            }
+
+    def _remove(self, key):
+        entry = self._entries.pop(key)
+        self._size -= entry[2]
+
+
+# The process-wide cache used by the search tool
+search_cache = SearchResultCache(
+    ttl=float(os.getenv("SEARCH_CACHE_TTL", DEFAULT_TTL)),
+    max_bytes=int(os.getenv("SEARCH_CACHE_MAX_BYTES", DEFAULT_MAX_BYTES)),
+    settle_seconds=float(os.getenv("SEARCH_CACHE_SETTLE_SECONDS", DEFAULT_SETTLE_SECONDS)),
+)
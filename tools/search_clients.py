@@ -0,0 +1,134 @@
+import os
+import threading
+
+from dotenv import load_dotenv
+
+# Load environment variables from .env file
+load_dotenv()
+
+# Number of pooled connections kept open to the search service
+DEFAULT_POOL_SIZE = 10
+
+
+class SearchClientRegistry:
+    """
+    Lazily creates and reuses the Azure AI Search clients.
+
+    There is one SearchIndexClient and one SearchClient per index, and all of
+    them share a single HTTP session, so connections (and their TLS handshakes)
+    are kept alive and reused across calls and indexes. The Azure SDK is only
+    imported when the first client is created, as it is slow to import.
+    """
+
+    def __init__(self, endpoint=None, key=None, default_index=None, pool_size=None):
+        """
+        Initialize the registry, anything not given is read from the environment.
+        Args:
+            endpoint: The search service endpoint. (optional)
+            key: The search service API key. (optional)
+            default_index: The index used when none is given. (optional)
+            pool_size: The number of pooled connections. (optional)
+        """
+        self.endpoint = endpoint or os.getenv("AZURE_SEARCH_ENDPOINT")
+        self.key = key or os.getenv("AZURE_SEARCH_KEY")
+        self.default_index = default_index or os.getenv("AZURE_SEARCH_INDEX")
+        self.pool_size = pool_size or int(
+            os.getenv("AZURE_SEARCH_POOL_SIZE", DEFAULT_POOL_SIZE)
+        )
+
+        self._lock = threading.Lock()
+        self._session = None
+        self._transport = None
+        self._index_client = None
+        self._search_clients = {}
+
+    def index_client(self):
+        """
+        Get the shared SearchIndexClient.
+        """
+        with self._lock:
+            if self._index_client is None:
+                from azure.search.documents.indexes import SearchIndexClient
+
+                self._index_client = SearchIndexClient(
+                    endpoint=self.endpoint,
+                    credential=self._credential(),
+                    transport=self._shared_transport(),
+                )
+            return self._index_client
+
+    def search_client(self, index_name=None):
+        """
+        Get the shared SearchClient for an index.
+        Args:
+            index_name: The index to search. (optional, defaults to AZURE_SEARCH_INDEX)
+        """
+        index_name = index_name or self.default_index
+        if not index_name:
+            raise ValueError(
+                "No search index given. Please pass an index name or set the AZURE_SEARCH_INDEX environment variable."
+            )
+
+        with self._lock:
+            client = self._search_clients.get(index_name)
+            if client is None:
+                from azure.search.documents import SearchClient
+
+                client = SearchClient(
+                    endpoint=self.endpoint,
+                    index_name=index_name,
+                    credential=self._credential(),
+                    transport=self._shared_transport(),
+                )
+                self._search_clients[index_name] = client
+            return client
+
+    def close(self) -> None:
+        """
+        Close the clients and the shared HTTP session.
+        """
+        with self._lock:
+            for client in self._search_clients.values():
+                client.close()
+            if self._index_client is not None:
+                self._index_client.close()
+            if self._session is not None:
+                self._session.close()
+
+            self._search_clients = {}
+            self._index_client = None
+            self._session = None
+            self._transport = None
+
+    def _credential(self):
+        if not all([self.endpoint, self.key]):
+            raise ValueError(
+                "Azure Search credentials not configured. Please set AZURE_SEARCH_ENDPOINT and AZURE_SEARCH_KEY environment variables."
+            )
+        from azure.core.credentials import AzureKeyCredential
+
+        return AzureKeyCredential(self.key)
+
+    def _shared_transport(self):
+        """
+        Build the HTTP transport shared by all the clients, on first use.
+        """
+        if self._transport is None:
+            import requests
+            from azure.core.pipeline.transport import RequestsTransport
+
+            self._session = requests.Session()
+            adapter = requests.adapters.HTTPAdapter(
+                pool_connections=self.pool_size, pool_maxsize=self.pool_size
+            )
+            self._session.mount("https://", adapter)
+            self._session.mount("http://", adapter)
+            # the clients must not close the session, it outlives each of them
+            self._transport = RequestsTransport(
+                session=self._session, session_owner=False
+            )
+        return self._transport
+
+
+# The process-wide registry used by the search tools
+search_clients = SearchClientRegistry()
@@ -1,22 +1,12 @@
-import os
-
 from dotenv import load_dotenv
-from langchain_openai import AzureChatOpenAI
 
+from agents.model_provider import get_agent_model
 from agents.workflow_agent import WorkflowAgent
 from tools.ai_search_tools import search
 
 # Load environment variables from .env file
 load_dotenv()
 
-# Initialize the AzureChatOpenAI model
-model = AzureChatOpenAI(
-    azure_endpoint=os.getenv("AZURE_OPENAI_ENDPOINT"),
-    api_version=os.getenv("AZURE_OPENAI_API_VERSION"),
-    api_key=os.getenv("AZURE_OPENAI_KEY"),
-    deployment_name=os.getenv("AZURE_OPENAI_DEPLOYMENT_NAME"),
-    temperature=0,
-)
 
 
 def workflow_agent_example():
@@ -36,11 +26,13 @@ Instructions:
 
     # Initialize the workflow agent
     search_agent = WorkflowAgent(
-        model=model,
+        model=get_agent_model(),
         tools=[
             search,
         ],
         agent_prompt=search_agent_prompt,
+        # the search result is the workflow result
+        passthrough_tools=["search"],
     )
 
     result = search_agent.run_workflow(